@@ -0,0 +1,106 @@
+import time
+import random
+import eeuploader.image as eeup
+import eeuploader.utils as utils
+#
+# CONSTANTS
+#
+USER='bench'
+COLLECTION='benchmarks'
+ASSET_ROOT='projects/earthengine-legacy/assets'
+FIELDS=[
+    'benchmark',
+    'case',
+    'n',
+    'seconds',
+    'per_second',
+    'rpcs' ]
+# fast polling for simulated ingestions of a few tenths of a second
+POLLING={
+    'initial': 0.1,
+    'maximum': 1 }
+
+
+
+#
+# HELPERS
+#
+def row(benchmark,case,n,seconds,rpcs=None,**extra):
+    """ benchmark result row """
+    result={
+        'benchmark': benchmark,
+        'case': case,
+        'n': n,
+        'seconds': seconds,
+        'per_second': n/seconds if seconds else None,
+        'rpcs': rpcs or {} }
+    result.update(extra)
+    return result
+
+
+def timed(func,*args,**kwargs):
+    """ (seconds,return value) of `func(*args,**kwargs)` """
+    start=time.perf_counter()
+    value=func(*args,**kwargs)
+    return time.perf_counter()-start, value
+
+
+def best(repeat,func,*args,**kwargs):
+    """ shortest (seconds,return value) of `repeat` runs of `func(*args,**kwargs)` """
+    return min((timed(func,*args,**kwargs) for _ in range(repeat)),key=lambda r: r[0])
+
+
+def asset_name(i,collection=COLLECTION):
+    return f'{ASSET_ROOT}/users/{USER}/{collection}/img{i}'
+
+
+def manifests(n,collection=COLLECTION):
+    """ minimal upload manifests """
+    return [
+        { 'name': asset_name(i,collection), 'tilesets': [] }
+        for i in range(n) ]
+
+
+def features(n,seed=0):
+    """ synthetic image features """
+    rng=random.Random(seed)
+    return [
+        {
+            'type': 'Feature',
+            'properties': {
+                'gcs': f'gs://bench-bucket/images/img{i}.tif',
+                'date': rng.choice(['2019-08-12','2020-01-01','2021-06-30']),
+                'crs': 'epsg:32720',
+                'biome': rng.choice(['forest','savanna','wetland']),
+                'cloud_cover': rng.random() } }
+        for i in range(n) ]
+
+
+def uploader(**kwargs):
+    """ EEImagesUp for the benchmark collection """
+    upkwargs={
+        'features': None,
+        'collection': COLLECTION,
+        'skip_existing': False,
+        'polling': POLLING,
+        'rate_limit': False }
+    upkwargs.update(kwargs)
+    return eeup.EEImagesUp(USER,**upkwargs)
+
+
+def report(rows):
+    """ print the rows as a table """
+    print(f'{"benchmark":<18}{"case":<26}{"n":>8}{"seconds":>10}{"per_second":>12}  rpcs')
+    for r in rows:
+        per_second=f'{r["per_second"]:>12.1f}' if r['per_second'] else f'{"-":>12}'
+        rpcs=', '.join(f'{k}={v}' for k,v in sorted(r['rpcs'].items()))
+        extra=', '.join(f'{k}={v}' for k,v in r.items() if k not in FIELDS)
+        if extra:
+            rpcs=f'{rpcs}  {extra}' if rpcs else extra
+        print(f'{r["benchmark"]:<18}{r["case"]:<26}{r["n"]:>8}{r["seconds"]:>10.3f}{per_second}  {rpcs}')
+
+
+def save(rows,path):
+    """ save the rows (json) """
+    utils.save_json(rows,path)
+    return path
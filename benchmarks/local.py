@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import subprocess
+import eeuploader.image as eeup
+import eeuploader.simulator as sim
+from . import harness
+#
+# CONFIG
+#
+# process counts of the manifests sweep: 1, 2, 4, ... up to the number of CPUs
+NB_PROCESSES=None
+LATENCY=0.01
+REPEAT=3
+# number of features/assets of the size sweeps. runs of LARGE or more are timed once
+SIZES=[
+    10000,
+    100000,
+    1000000 ]
+LARGE=1000000
+# max checks timed with the (O(n) per check) list scan
+MAX_SCAN_CHECKS=1000
+
+
+
+#
+# BENCHMARKS
+#
+def skip_check(scale=1,sizes=SIZES):
+    """ existing assets: getList + list scan (baseline) vs paged listAssets + set
+
+    For each size: `size` existing assets and `size/10` checks (half of them missing).
+    The list scan baseline is only timed on the first MAX_SCAN_CHECKS checks.
+    """
+    rows=[]
+    for size in sizes:
+        rows+=_skip_check(int(size*scale))
+    return rows
+
+
+def startup(scale=1):
+    """ import time and time to the first manifest (no requests before the first upload) """
+    env=dict(os.environ)
+    root=os.path.dirname(os.path.dirname(os.path.abspath(eeup.__file__)))
+    env['PYTHONPATH']=os.pathsep.join(p for p in [root,env.get('PYTHONPATH')] if p)
+    def _run(code):
+        return min(
+            harness.timed(subprocess.run,[sys.executable,'-c',code],check=True,env=env)[0]
+            for _ in range(REPEAT))
+    rows=[]
+    interpreter=_run('pass')
+    rows.append(harness.row('startup','import',1,_run('import eeuploader.image')-interpreter))
+    feats=harness.features(int(1000*scale))
+    with sim.simulate(latency=LATENCY) as backend:
+        seconds,up=harness.timed(
+            harness.uploader,
+            features=feats,
+            skip_existing=True,
+            start_time_key='date')
+        rows.append(harness.row(
+            'startup',
+            'construct',
+            1,
+            seconds,
+            dict(backend.rpcs),
+            nb_initialized=backend.nb_initialized))
+        seconds,_=harness.timed(up.manifest,0)
+        rows.append(harness.row(
+            'startup',
+            'first_manifest',
+            1,
+            seconds,
+            dict(backend.rpcs),
+            nb_initialized=backend.nb_initialized))
+    return rows
+
+
+def manifest_build(scale=1,sizes=SIZES,processes=NB_PROCESSES):
+    """ manifests for every feature: per-feature vs bulk vs process pools
+
+    The process pool cases are run for each process count of `processes`
+    (defaults to 1, 2, 4, ... up to os.cpu_count()). The *_jsonl cases save 
+    to a jsonl file. `parent_cpu` is the CPU time spent in the parent process: 
+    with a process pool it is the serial part (receiving and writing the 
+    workers' output) that bounds the speedup.
+    """
+    processes=processes or process_counts()
+    rows=[]
+    for size in sizes:
+        rows+=_manifest_build(int(size*scale),processes)
+    return rows
+
+
+
+#
+# HELPERS
+#
+def process_counts(max_processes=None):
+    """ 1, 2, 4, ... up to `max_processes` (defaults to os.cpu_count()), included """
+    max_processes=max_processes or os.cpu_count() or 1
+    counts=[]
+    count=1
+    while count<max_processes:
+        counts.append(count)
+        count*=2
+    return counts+[max_processes]
+
+
+
+#
+# INTERNAL
+#
+def _skip_check(nb_assets):
+    nb_checks=max(nb_assets//10,1)
+    names=[harness.asset_name(i) for i in range(nb_assets)]
+    rng=random.Random(1)
+    checks=[harness.asset_name(rng.randrange(2*nb_assets)) for _ in range(nb_checks)]
+    parent=f'users/{harness.USER}/{harness.COLLECTION}'
+    rows=[]
+    with sim.simulate(latency=LATENCY,assets=names) as backend:
+        seconds,listing=harness.timed(
+            lambda: [a['id'] for a in backend.get_list({ 'id': parent })])
+        rows.append(harness.row('skip_check','getList',nb_assets,seconds,dict(backend.rpcs)))
+        scan_checks=checks[:MAX_SCAN_CHECKS]
+        seconds,_=harness.timed(lambda: [name in listing for name in scan_checks])
+        rows.append(harness.row('skip_check','list_scan',len(scan_checks),seconds))
+    with sim.simulate(latency=LATENCY,assets=names) as backend:
+        up=harness.uploader(skip_existing=True)
+        seconds,_=harness.timed(lambda: up.existing_assets)
+        rows.append(harness.row('skip_check','listAssets_pages',nb_assets,seconds,dict(backend.rpcs)))
+        seconds,_=harness.timed(lambda: [up._check_existing(name) for name in checks])
+        rows.append(harness.row('skip_check','set_lookup',nb_checks,seconds))
+    return rows
+
+
+def _manifest_build(n,processes):
+    up=harness.uploader(features=harness.features(n),start_time_key='date')
+    tmp=tempfile.TemporaryDirectory()
+    path=os.path.join(tmp.name,'manifests.jsonl')
+    repeat=REPEAT if n<LARGE else 1
+    cases=[
+        ('per_feature',dict(bulk=False)),
+        ('bulk',dict(bulk=True)),
+        ('bulk_jsonl',dict(bulk=True,dest=path,save_as=eeup.JSONL)) ]
+    for nb in processes:
+        cases+=[
+            (f'processes_{nb}',dict(nb_processes=nb)),
+            (f'processes_{nb}_jsonl',dict(nb_processes=nb,dest=path,save_as=eeup.JSONL)) ]
+    rows=[]
+    for case,kwargs in cases:
+        cpu=time.process_time()
+        # drop the manifests before the next case (1M manifests take GBs)
+        seconds=harness.best(repeat,up.manifest,features=True,**kwargs)[0]
+        cpu=(time.process_time()-cpu)/repeat
+        rows.append(harness.row('manifests',case,n,seconds,parent_cpu=round(cpu,3)))
+    tmp.cleanup()
+    return rows
@@ -0,0 +1,82 @@
+import click
+from . import harness
+from . import local
+from . import upload
+#
+# CONSTANTS
+#
+MANIFESTS='manifests'
+BENCHMARKS={
+    'scheduler': upload.scheduler_makespan,
+    'engines': upload.engines,
+    'poller': upload.poller_rpcs,
+    'task_ids': upload.task_id_pool,
+    'skip_check': local.skip_check,
+    'startup': local.startup,
+    MANIFESTS: local.manifest_build }
+# benchmarks with a size sweep (see --sizes)
+SIZED=[
+    'skip_check',
+    MANIFESTS ]
+SCALE_HELP='multiplies the size of every benchmark'
+SIZES_HELP=(
+    'comma separated sizes (number of assets/features) of the skip_check and manifests '
+    'sweeps. defaults to 10000,100000,1000000')
+PROCESSES_HELP=(
+    'comma separated process counts of the manifests process pool cases. '
+    'defaults to 1,2,4,... up to the number of CPUs')
+DEST_HELP='save the result rows to a json file'
+
+
+
+#
+# CLI INTERFACE
+#
+@click.command()
+@click.argument('names',nargs=-1,type=click.Choice(list(BENCHMARKS)))
+@click.option('--scale',help=SCALE_HELP,default=1.0,type=float)
+@click.option('--sizes',help=SIZES_HELP,default=None,type=str)
+@click.option('--processes',help=PROCESSES_HELP,default=None,type=str)
+@click.option('--dest',help=DEST_HELP,default=None,type=str)
+def run(names,scale,sizes,processes,dest):
+    """ run offline benchmarks (against the simulated earth engine backend)
+
+    Examples:
+
+        ```bash
+        # - all benchmarks
+        python -m benchmarks.run
+        # - scheduler and poller benchmarks, twice the default size
+        python -m benchmarks.run scheduler poller --scale 2
+        # - skip-check and manifest sweeps at 10k and 100k (instead of 10k/100k/1M)
+        python -m benchmarks.run skip_check manifests --sizes 10000,100000
+        # - manifests with pools of 1, 8 and 32 processes
+        python -m benchmarks.run manifests --processes 1,8,32
+        # - save the results
+        python -m benchmarks.run --dest benchmarks.json
+        ```
+
+    """
+    kwargs={ 'sizes': [int(s) for s in sizes.split(',')] } if sizes else {}
+    rows=[]
+    for name in (names or BENCHMARKS):
+        if name==MANIFESTS and processes:
+            rows+=BENCHMARKS[name](
+                scale=scale,
+                processes=[int(p) for p in processes.split(',')],
+                **kwargs)
+        elif name in SIZED:
+            rows+=BENCHMARKS[name](scale=scale,**kwargs)
+        else:
+            rows+=BENCHMARKS[name](scale=scale)
+    harness.report(rows)
+    if dest:
+        harness.save(rows,dest)
+
+
+
+#
+# MAIN
+#
+if __name__ == "__main__":
+    run()
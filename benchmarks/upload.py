@@ -0,0 +1,108 @@
+import math
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import eeuploader.gee_utils as gutils
+import eeuploader.results as uresults
+import eeuploader.scheduler as scheduler
+import eeuploader.simulator as sim
+from . import harness
+#
+# CONFIG
+#
+NB_WORKERS=8
+TIMEOUT=60
+LATENCY=0.01
+INGESTION_TIME=sim.lognormal(0.3)
+
+
+
+#
+# BENCHMARKS
+#
+def scheduler_makespan(scale=1):
+    """ static batches (baseline) vs shared work queue with heavy-tailed durations """
+    n=int(200*scale)
+    rng=random.Random(1)
+    durations=[rng.lognormvariate(math.log(0.01),1) for _ in range(n)]
+    lower_bound=max(sum(durations)/NB_WORKERS,max(durations))
+    rows=[]
+    seconds,_=harness.timed(_static_batches,time.sleep,durations,NB_WORKERS)
+    rows.append(harness.row('scheduler','static_batches',n,seconds,lower_bound=lower_bound))
+    seconds,_=harness.timed(scheduler.map_with_queue,time.sleep,durations,NB_WORKERS)
+    rows.append(harness.row('scheduler','shared_queue',n,seconds,lower_bound=lower_bound))
+    return rows
+
+
+def engines(scale=1):
+    """ makespan, throughput and rpcs of the upload engines on the simulator """
+    n=int(300*scale)
+    cases=[
+        ('threads',lambda up: up.upload_collection(manifests=harness.manifests(n),nb_batches=50)),
+        ('pipelined',lambda up: up.upload_collection(manifests=harness.manifests(n),nb_batches=4,max_in_flight=100)),
+        ('async',lambda up: asyncio.run(up.upload_collection_async(manifests=harness.manifests(n),max_in_flight=100))) ]
+    rows=[]
+    for case,upload in cases:
+        with sim.simulate(latency=LATENCY,ingestion_time=INGESTION_TIME,max_running=100,seed=1) as backend:
+            up=harness.uploader()
+            seconds,_=harness.timed(upload,up)
+            rows.append(harness.row(
+                'engines',
+                case,
+                n,
+                seconds,
+                dict(backend.rpcs),
+                states=uresults.state_counts(up.tasks)))
+    return rows
+
+
+def poller_rpcs(scale=1):
+    """ status requests: one poll loop per task (baseline) vs a shared TaskMonitor """
+    n=int(100*scale)
+    policy=gutils.PollingPolicy(**harness.POLLING)
+    def _per_task_wait(task_ids):
+        scheduler.map_with_queue(
+            lambda task_id: gutils.wait(task_id,TIMEOUT,noisy=False,polling=policy),
+            task_ids,
+            nb_workers=len(task_ids))
+    def _task_monitor(task_ids):
+        monitor=gutils.TaskMonitor(TIMEOUT,polling=policy).start()
+        for task_id in task_ids:
+            monitor.add(task_id,lambda status: None)
+        monitor.stop()
+    rows=[]
+    for case,wait in [('per_task_wait',_per_task_wait),('task_monitor',_task_monitor)]:
+        with sim.simulate(latency={sim.GET_TASK_STATUS: LATENCY},ingestion_time=INGESTION_TIME,seed=1) as backend:
+            task_ids=backend.new_task_id(n)
+            for task_id,manifest in zip(task_ids,harness.manifests(n)):
+                backend.start_ingestion(task_id,manifest)
+            backend.rpcs.clear()
+            seconds,_=harness.timed(wait,task_ids)
+            rows.append(harness.row('poller',case,n,seconds,dict(backend.rpcs)))
+    return rows
+
+
+def task_id_pool(scale=1):
+    """ submissions with one newTaskId request per upload vs the TaskIdPool """
+    n=int(300*scale)
+    rows=[]
+    for case,block in [('per_upload_request',0),('pool_100',100)]:
+        with sim.simulate(latency=LATENCY/2,ingestion_time=0) as backend:
+            up=harness.uploader(task_id_block=block)
+            seconds,_=harness.timed(
+                lambda: [up.upload(manifest=m,noisy=False) for m in harness.manifests(n)])
+            rows.append(harness.row('task_ids',case,n,seconds,dict(backend.rpcs)))
+    return rows
+
+
+
+#
+# INTERNAL
+#
+def _static_batches(func,args_list,nb_batches):
+    # the original upload_collection: split into nb_batches fixed slices
+    size=int(math.ceil(len(args_list)/nb_batches))
+    batches=[args_list[i:i+size] for i in range(0,len(args_list),size)]
+    with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+        return list(executor.map(lambda batch: [func(a) for a in batch],batches))
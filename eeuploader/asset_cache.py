@@ -0,0 +1,169 @@
+import os
+import re
+import gzip
+import json
+import time
+from . import gee_utils as gutils
+from . import utils
+#
+# CONFIG
+#
+CACHE_DIR=os.environ.get(
+    'EEUPLOADER_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'),'.eeuploader','assets'))
+ASSET_CACHE_TTL=24*60*60
+#
+# CONSTANTS
+#
+EXT='txt.gz'
+
+
+
+#
+# MAIN
+#
+class AssetCache(object):
+    """ on-disk cache of the asset names in a user/collection
+
+    The cache is a gzipped text file: a json header line (parent and the time
+    the listing was taken) followed by one asset name (relative to the parent)
+    per line. Assets created during a run are merged with `add` and appended
+    to the file with `flush`, so the cache stays current without re-listing.
+    The full listing is only re-taken once the cache is older than `ttl` (or
+    with `load(refresh=True)`).
+
+    Args:
+        user<str>:
+            gee user or project root
+        collection<str|None>:
+            name of image_collection or folder
+        directory<str|None>:
+            cache directory. defaults to CACHE_DIR
+            (env: EEUPLOADER_CACHE_DIR, default: ~/.eeuploader/assets)
+        ttl<int|None>:
+            seconds before the listing is re-taken. if None never expire
+        metrics<metrics.Metrics|None>:
+            if provided list requests are counted
+        readonly<bool>:
+            if true never write the cache file (ie. shard workers: see
+            shard.LocalCoordinator, the single writer of a sharded run)
+
+    Usage:
+
+        cache=AssetCache('projects/wri-datalab','image_collection_name')
+        existing=cache.load()
+        ...
+        cache.add(new_asset_name)
+        cache.flush()
+    """
+    def __init__(
+            self,
+            user,
+            collection=None,
+            directory=None,
+            ttl=ASSET_CACHE_TTL,
+            metrics=None,
+            readonly=False):
+        self.user=user
+        self.collection=collection
+        self.ttl=ttl
+        self.metrics=metrics
+        self.readonly=readonly
+        self.parent=gutils.asset_id(user,collection,prefix=True)
+        key=re.sub('/','__',gutils.asset_id(user,collection))
+        self.path=os.path.join(directory or CACHE_DIR,f'{key}.{EXT}')
+        self.timestamp=None
+        self.assets=set()
+        self._added=[]
+
+
+    def load(self,refresh=False):
+        """ load asset names (from the cache if it exists and is fresh)
+
+        Args:
+            refresh<bool>: if true force a new listing
+
+        Returns<set>: set of asset names
+        """
+        if refresh or (not self._read()) or self.is_stale():
+            self.refresh()
+        return self.assets
+
+
+    def refresh(self):
+        """ re-list the assets and rewrite the cache """
+        self.assets=set(gutils.iter_assets(
+            self.user,
+            collection=self.collection,
+            strip_prefix=False,
+            metrics=self.metrics))
+        self.timestamp=time.time()
+        self._added=[]
+        if not self.readonly:
+            self._write()
+        return self.assets
+
+
+    def add(self,name):
+        """ merge a newly created asset (written on `flush`) """
+        if name not in self.assets:
+            self.assets.add(name)
+            self._added.append(name)
+
+
+    def flush(self):
+        """ append assets added since the last load/flush to the cache file """
+        added,self._added=self._added,[]
+        if added and (not self.readonly) and os.path.isfile(self.path):
+            with gzip.open(self.path,'at') as file:
+                file.writelines(f'{self._relative(n)}\n' for n in added)
+
+
+    def age(self):
+        if self.timestamp:
+            return time.time()-self.timestamp
+
+
+    def is_stale(self):
+        return bool(self.ttl) and (self.age()>self.ttl)
+
+
+    #
+    # INTERNAL
+    #
+    def _read(self):
+        if not os.path.isfile(self.path):
+            return False
+        with gzip.open(self.path,'rt') as file:
+            header=json.loads(file.readline())
+            if header.get('parent')!=self.parent:
+                return False
+            self.timestamp=header['timestamp']
+            self.assets={ self._absolute(line.rstrip()) for line in file }
+        self._added=[]
+        return True
+
+
+    def _write(self):
+        utils.ensure_dir(self.path)
+        tmp_path=f'{self.path}.{os.getpid()}.tmp'
+        header={ 'parent': self.parent, 'timestamp': self.timestamp }
+        with gzip.open(tmp_path,'wt') as file:
+            file.write(f'{json.dumps(header)}\n')
+            file.writelines(f'{self._relative(n)}\n' for n in self.assets)
+        os.replace(tmp_path,self.path)
+
+
+    def _relative(self,name):
+        # names outside of parent are stored whole with a leading "/"
+        if name.startswith(f'{self.parent}/'):
+            return name[len(self.parent)+1:]
+        else:
+            return f'/{name}'
+
+
+    def _absolute(self,name):
+        if name.startswith('/'):
+            return name[1:]
+        else:
+            return f'{self.parent}/{name}'
@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+import ee
+
+
+
+#
+# MAIN
+#
+class EEBackend(object):
+    """ the earth engine requests made by eeuploader
+
+    Every request to earth engine goes through the current backend (see
+    `get_backend`). EEBackend forwards them to `ee`. Alternative backends
+    (ie. simulator.SimulatedBackend) implement the same methods.
+
+    Methods:
+        initialize(**kwargs): ee.Initialize
+        new_task_id(count): ee.data.newTaskId
+        start_ingestion(task_id,manifest,force): ee.data.startIngestion
+        update_asset(asset_id,asset,update_mask): ee.data.updateAsset
+        get_task_status(task_ids): ee.data.getTaskStatus
+        list_assets(params): ee.data.listAssets
+        get_list(params): ee.data.getList
+    """
+    initialized=False
+    def initialize(self,**kwargs):
+        ee.Initialize(**kwargs)
+
+
+    def new_task_id(self,count=1):
+        return ee.data.newTaskId(count)
+
+
+    def start_ingestion(self,task_id,manifest,force=False):
+        return ee.data.startIngestion(task_id,manifest,force)
+
+
+    def update_asset(self,asset_id,asset,update_mask):
+        return ee.data.updateAsset(asset_id,asset,update_mask)
+
+
+    def get_task_status(self,task_ids):
+        return ee.data.getTaskStatus(task_ids)
+
+
+    def list_assets(self,params):
+        return ee.data.listAssets(params)
+
+
+    def get_list(self,params):
+        return ee.data.getList(params)
+
+
+
+#
+# METHODS
+#
+_backend=EEBackend()
+_backend_lock=threading.Lock()
+def get_backend():
+    """ current backend """
+    return _backend
+
+
+def set_backend(backend=None):
+    """ set the current backend (for every thread)
+
+    Args:
+        backend<EEBackend|object|None>: backend. if None reset to EEBackend
+
+    Returns: the previous backend
+    """
+    global _backend
+    with _backend_lock:
+        previous=_backend
+        _backend=backend or EEBackend()
+    return previous
+
+
+@contextmanager
+def use_backend(backend):
+    """ temporarily set the current backend
+
+    Usage:
+
+        with use_backend(SimulatedBackend()):
+            up.upload_collection()
+    """
+    previous=set_backend(backend)
+    try:
+        yield backend
+    finally:
+        set_backend(previous)
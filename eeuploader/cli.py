@@ -2,11 +2,16 @@ from __future__ import print_function
 import os,sys
 sys.path.append(os.environ.get('PROJECT_DIR','..'))
 import re
+import asyncio
 from datetime import datetime
 from pprint import pprint
 import yaml
 import click
 import eeuploader.image as eeup
+import eeuploader.manifests as umanifests
+import eeuploader.results as uresults
+import eeuploader.metrics as umetrics
+import eeuploader.shard as ushard
 import eeuploader.utils as utils
 
 #
@@ -16,27 +21,72 @@ UPLOAD_HELP='upload feature collection'
 RANGE_HELP='restrict to index range'
 LIMIT_HELP='limit to first N'
 INDEX_HELP='index of feature to generate manifiest'
-NB_BATCHES_HELP='number of simultaneous uploads'
+NB_BATCHES_HELP='number of simultaneous uploads (pipelined: number of submission threads)'
+MAX_IN_FLIGHT_HELP='pipelined mode: max number of outstanding ingestion tasks'
+ENGINE_HELP='upload engine: one of threads or async. defaults to threads'
+JOURNAL_HELP='path to run journal (jsonl). if it exists the run is resumed from it'
+MANIFESTS_HELP=(
+    'upload precomputed manifests (jsonl, json or pickle file saved with info --dest). '
+    'FEATURE_COLLECTION must be omitted: the first argument is the upload args file')
+METRICS_HELP='save per-phase timings and rpc counts to a json or csv file'
+SHARD_HELP='upload only shard i of N ("i/N"). images are assigned to shards by a stable hash of their asset name'
+NB_SHARDS_HELP='run the upload as N local worker processes (one shard each) and merge their results and journals'
+RESULTS_HELP='save the upload results to a jsonl file'
+POLLING_HELP='task status polling: "adaptive" or a fixed interval in seconds'
 PRINT_ALL_HELP='print all the tasks, if false print first-last'
 DEST_HELP='save manifest file to destination <dest>'
 ALL_HELP='if true save/print all features'
-SAVE_AS_HELP='one of json or pickle. defaults to pickle'
+SAVE_AS_HELP='one of json, jsonl or pickle. defaults to pickle'
+NB_PROCESSES_HELP='build manifests in a pool of N processes. defaults to a single process'
+CHUNK_SIZE_HELP='number of features per process-pool task'
 DEST=None
+FEATURE_COLLECTION_EXT='.geojson'
+THREADS='threads'
+ASYNC='async'
+ENGINE=THREADS
 ALL=False
 SAVE_AS=eeup.PICKLE
 LIMIT=None
 NOISY=False
 INDEX=0
 PRINT_ALL=False
+NB_SLOWEST=5
 INDICES='comma separated feature index list'
 NOISY_HELP='be noisy'
 INFO_HELP='print number of features and manifiest for first feature'
+# upload options passed on to the --nb_shards worker processes
+WORKER_OPTIONS=[
+    '--index_range',
+    '--indices',
+    '--limit',
+    '--nb_batches',
+    '--max_in_flight',
+    '--engine',
+    '--polling',
+    '--noisy' ]
+# key=value arguments parsed as yaml (booleans, numbers, dicts). other values are strings
+YAML_KWARGS=[
+    'stream_features',
+    'index_features',
+    'drop_geometry',
+    'asset_cache',
+    'asset_cache_ttl',
+    'refresh_assets',
+    'polling',
+    'task_id_block',
+    'rate_limit',
+    'retry',
+    'progress' ]
 ARG_KWARGS_SETTINGS={
     'ignore_unknown_options': True,
     'allow_extra_args': True
 }
 TS_FMT='[%Y%m%d]: %H:%M:%S'
 ERROR_MISSING_PARAM_FILE="ee.uploader.cli: {} is not a file"
+ERROR_MISSING_FEATURE_COLLECTION="ee.uploader.cli: missing FEATURE_COLLECTION (or --manifests)"
+ERROR_MANIFESTS_FEATURE_COLLECTION="ee.uploader.cli: FEATURE_COLLECTION can not be used with --manifests: {}"
+ERROR_SHARD_OPTIONS="ee.uploader.cli: --shard and --nb_shards are mutually exclusive"
+ERROR_FAILED_SHARDS="ee.uploader.cli: shards {} failed (see the shard logs in {})"
 
 
 
@@ -52,7 +102,12 @@ def cli(ctx):
 @click.command(
     help=UPLOAD_HELP,
     context_settings=ARG_KWARGS_SETTINGS ) 
-@click.argument('feature_collection',type=str)
+@click.argument('feature_collection',type=str,required=False)
+@click.option(
+    '--manifests',
+    help=MANIFESTS_HELP,
+    default=None,
+    type=str)
 @click.option(
     '--index_range',
     help=RANGE_HELP,
@@ -73,6 +128,46 @@ def cli(ctx):
     help=NB_BATCHES_HELP,
     default=eeup.NB_BATCHES,
     type=int)
+@click.option(
+    '--max_in_flight',
+    help=MAX_IN_FLIGHT_HELP,
+    default=eeup.MAX_IN_FLIGHT,
+    type=int)
+@click.option(
+    '--engine',
+    help=ENGINE_HELP,
+    default=ENGINE,
+    type=click.Choice([THREADS,ASYNC]))
+@click.option(
+    '--journal',
+    help=JOURNAL_HELP,
+    default=None,
+    type=str)
+@click.option(
+    '--polling',
+    help=POLLING_HELP,
+    default=None,
+    type=str)
+@click.option(
+    '--metrics',
+    help=METRICS_HELP,
+    default=None,
+    type=str)
+@click.option(
+    '--shard',
+    help=SHARD_HELP,
+    default=None,
+    type=str)
+@click.option(
+    '--nb_shards',
+    help=NB_SHARDS_HELP,
+    default=None,
+    type=int)
+@click.option(
+    '--results',
+    help=RESULTS_HELP,
+    default=None,
+    type=str)
 @click.option(
     '--noisy',
     help=NOISY_HELP,
@@ -84,7 +179,24 @@ def cli(ctx):
     default=PRINT_ALL,
     type=bool)
 @click.pass_context
-def upload(ctx,feature_collection,index_range,indices,limit,nb_batches,noisy,print_all):
+def upload(
+        ctx,
+        feature_collection,
+        manifests,
+        index_range,
+        indices,
+        limit,
+        nb_batches,
+        max_in_flight,
+        engine,
+        journal,
+        polling,
+        metrics,
+        shard,
+        nb_shards,
+        results,
+        noisy,
+        print_all):
     """ upload feature_collection
 
     use fc file and args file (or kwargs) to upload a feature collection
@@ -102,17 +214,78 @@ def upload(ctx,feature_collection,index_range,indices,limit,nb_batches,noisy,pri
         eeuploader upload fc.geojson upargs.yaml --index_range 3,400,24
         # - image features 3,400,24 with overwrite=True
         eeuploader upload fc.geojson upargs.yaml --index_range 3,400,24 force=True
+        # - 8 submission threads keeping up to 500 ingestions in flight
+        eeuploader upload fc.geojson upargs.yaml --nb_batches 8 --max_in_flight 500
+        # - poll task status every 30 seconds (instead of adaptive polling)
+        eeuploader upload fc.geojson upargs.yaml --polling 30
+        # - asyncio engine with up to 500 ingestions in flight
+        eeuploader upload fc.geojson upargs.yaml --engine async --max_in_flight 500
+        # - cache the existing-asset listing locally
+        eeuploader upload fc.geojson upargs.yaml asset_cache=true
+        # - journal the run (re-run the same command to resume after a crash)
+        eeuploader upload fc.geojson upargs.yaml --journal run.jsonl
+        # - at most 5 ingestion and 2 status requests per second
+        eeuploader upload fc.geojson upargs.yaml "rate_limit={submit_rate: 5, status_rate: 2}"
+        # - retry transient failures up to 5 times per image (at most 1000 retries in total)
+        eeuploader upload fc.geojson upargs.yaml "retry={retries: 5, budget: 1000}"
+        # - upload manifests saved with `eeuploader info --dest` (no feature collection)
+        eeuploader upload --manifests manifests.jsonl.gz upargs.yaml
+        # - store the results of a very large run in a sqlite database (instead of memory)
+        eeuploader upload fc.geojson upargs.yaml results_store=results.db
+        # - save per-phase timings and rpc counts
+        eeuploader upload fc.geojson upargs.yaml --metrics metrics.csv
+        # - print progress (counts, images/min, eta) every 30 seconds
+        eeuploader upload fc.geojson upargs.yaml progress=true
+        # - write a progress snapshot (json) every minute for external monitoring
+        eeuploader upload fc.geojson upargs.yaml "progress={path: progress.json, interval: 60}"
+        # - upload shard 2 of 4 (run shards 0/4 to 3/4, e.g. on 4 hosts, to upload everything)
+        eeuploader upload fc.geojson upargs.yaml --shard 2/4 --journal run.shard-2.jsonl
+        # - 8 local worker processes (one shard each), journals merged into run.jsonl
+        eeuploader upload fc.geojson upargs.yaml --nb_shards 8 --journal run.jsonl
+        # - delta upload: skip unchanged images, update changed properties, ingest new/changed images
+        eeuploader upload fc.geojson upargs.yaml delta=fingerprints.jsonl skip_existing=true
         ```
 
     """
-    upkwargs=_upload_kwargs(ctx.args)
+    if shard and nb_shards:
+        raise click.UsageError(ERROR_SHARD_OPTIONS)
+    if manifests:
+        _check_manifests_args(feature_collection,ctx.args)
+    if nb_shards:
+        return _upload_shards(
+            ctx,
+            feature_collection,
+            manifests,
+            nb_shards,
+            journal,
+            metrics,
+            results,
+            print_all)
+    args=ctx.args
+    if manifests:
+        # no feature collection: the first argument is the upload args file
+        if feature_collection:
+            args=[feature_collection]+args
+            feature_collection=None
+    elif not feature_collection:
+        raise click.UsageError(ERROR_MISSING_FEATURE_COLLECTION)
+    upkwargs=_upload_kwargs(args)
+    if polling:
+        upkwargs['polling']=polling
+    if journal:
+        upkwargs['journal']=journal
+    if shard:
+        upkwargs['shard']=shard
     up=eeup.EEImagesUp(
         features=feature_collection,
         **upkwargs)
     print('\n'*2)
     print('eeuploader.cli.upload:')
     print()
-    print('- feature_collection:',feature_collection)
+    if manifests:
+        print('- manifests:',manifests)
+    else:
+        print('- feature_collection:',feature_collection)
     if index_range:
         print('- index_range:',index_range)
         index_range=_int_parts(index_range)
@@ -122,24 +295,49 @@ def upload(ctx,feature_collection,index_range,indices,limit,nb_batches,noisy,pri
         features=_int_parts(indices)
     else:
         features=None
+    if manifests and (features is not None):
+        saved=list(umanifests.read_manifests(manifests))
+        manifests=[saved[i] for i in features]
     if limit:
         print('- limit:',limit)
+    print('- engine:',engine)
+    if max_in_flight:
+        print('- max_in_flight:',max_in_flight)
+    if polling:
+        print('- polling:',polling)
+    if journal:
+        print('- journal:',journal)
+    if metrics:
+        print('- metrics:',metrics)
+    if shard:
+        print('- shard:',shard)
     print('- noisy:',noisy)
     print()
     start=_timestamp('start')
     print()
-    up.upload_collection(
-        features=features,
-        limit=limit,
-        nb_batches=nb_batches)
+    if engine==ASYNC:
+        asyncio.run(up.upload_collection_async(
+            features=features,
+            limit=limit,
+            max_in_flight=max_in_flight or nb_batches,
+            manifests=manifests))
+    else:
+        up.upload_collection(
+            features=features,
+            limit=limit,
+            nb_batches=nb_batches,
+            max_in_flight=max_in_flight,
+            manifests=manifests)
     print()
     _timestamp('complete',start)
-    print('- nb_tasks:',len(up.tasks))
+    _print_summary(up.tasks,print_all)
     print()
-    if print_all:
-        pprint(up.tasks)
-    else:
-        pprint([up.tasks[0],'...',up.tasks[-1]])
+    _print_metrics(up.metrics)
+    if metrics:
+        print()
+        print('- metrics saved:',up.metrics.save(metrics))
+    if results:
+        print('- results saved:',ushard.save_results(up.tasks,results))
     print('\n'*2)
 
 
@@ -180,8 +378,18 @@ def upload(ctx,feature_collection,index_range,indices,limit,nb_batches,noisy,pri
     help=SAVE_AS_HELP,
     default=SAVE_AS,
     type=str)
+@click.option(
+    '--nb_processes',
+    help=NB_PROCESSES_HELP,
+    default=None,
+    type=int)
+@click.option(
+    '--chunk_size',
+    help=CHUNK_SIZE_HELP,
+    default=umanifests.CHUNK_SIZE,
+    type=int)
 @click.pass_context
-def info(ctx,feature_collection,dest,index,index_range,indices,all,save_as):
+def info(ctx,feature_collection,dest,index,index_range,indices,all,save_as,nb_processes,chunk_size):
     """ prints info for inspection before upload
     
     output includes:
@@ -200,6 +408,10 @@ def info(ctx,feature_collection,dest,index,index_range,indices,all,save_as):
         eeuploader info fc.geojson upargs.yaml --dest manifests.p --all true
         # - save upload manifest for indices 1,10,100 to a json file
         eeuploader info fc.geojson upargs.yaml --dest manifests.json --save_as json --indices 1,10,100
+        # - build all upload manifests with 32 processes (2000 features per task)
+        eeuploader info fc.geojson upargs.yaml --dest manifests.p --all true --nb_processes 32 --chunk_size 2000
+        # - stream all upload manifests to a gzipped json-lines file
+        eeuploader info fc.geojson upargs.yaml --dest manifests.jsonl.gz --save_as jsonl --all true
         ```
 
     """
@@ -225,9 +437,17 @@ def info(ctx,feature_collection,dest,index,index_range,indices,all,save_as):
     else:
         features=None
         print('- index:',index)
+    if nb_processes:
+        print('- nb_processes:',nb_processes)
     print(f'- manifest:')
     print()
-    pprint(up.manifest(feat=index,features=features,dest=dest,save_as=save_as))
+    pprint(up.manifest(
+        feat=index,
+        features=features,
+        dest=dest,
+        save_as=save_as,
+        nb_processes=nb_processes,
+        chunk_size=chunk_size))
     print('\n'*2)
 
 
@@ -253,17 +473,115 @@ def _args_kwargs(ctx_args):
     kwargs={}
     for a in ctx_args:
         if re.search('=',a):
-            k,v=a.split('=')
+            k,v=a.split('=',1)
+            if k in YAML_KWARGS:
+                v=yaml.safe_load(v)
             kwargs[k]=v
         else:
             args.append(a)
     return args,kwargs
 
 
+def _check_manifests_args(feature_collection,ctx_args):
+    # with --manifests the first argument is the upload args file
+    args,_=_args_kwargs(ctx_args)
+    if feature_collection and (args or feature_collection.endswith(FEATURE_COLLECTION_EXT)):
+        raise click.UsageError(ERROR_MANIFESTS_FEATURE_COLLECTION.format(feature_collection))
+
+
+def _upload_shards(ctx,feature_collection,manifests,nb_shards,journal,metrics,results,print_all):
+    # re-run this upload command as nb_shards local worker processes
+    args=[]
+    if manifests:
+        args+=['--manifests',manifests]
+    if feature_collection:
+        args.append(feature_collection)
+    for param in ctx.command.params:
+        value=ctx.params[param.name]
+        if param.opts[0] in WORKER_OPTIONS and (value is not None):
+            args+=[param.opts[0],str(value)]
+    args+=ctx.args
+    # the coordinator writes the files shared by the workers (index, asset cache, delta, results store)
+    if manifests and feature_collection:
+        upkwargs=_upload_kwargs([feature_collection]+ctx.args)
+        feature_collection=None
+    else:
+        upkwargs=_upload_kwargs(ctx.args)
+    up=eeup.EEImagesUp(features=None,**upkwargs)
+    coordinator=ushard.LocalCoordinator(
+        nb_shards,
+        args,
+        journal=journal,
+        metrics=metrics,
+        index=feature_collection if upkwargs.get('index_features') else None,
+        asset_cache=up.asset_cache,
+        delta=upkwargs.get('delta'),
+        results_store=upkwargs.get('results_store'),
+        progress=upkwargs.get('progress'))
+    print('\n'*2)
+    print('eeuploader.cli.upload:')
+    print()
+    print('- nb_shards:',nb_shards)
+    print('- work_dir:',coordinator.work_dir)
+    if journal:
+        print('- journal:',journal)
+    print()
+    start=_timestamp('start')
+    print()
+    tasks=coordinator.run()
+    print()
+    _timestamp('complete',start)
+    _print_summary(tasks,print_all)
+    if metrics:
+        print()
+        print('- shard metrics saved:',[
+            ushard.shard_path(metrics,i,nb_shards) for i in range(nb_shards)])
+    if results:
+        print('- results saved:',ushard.save_results(tasks,results))
+    print('\n'*2)
+    failed_shards=coordinator.failed_shards()
+    if failed_shards:
+        raise click.ClickException(ERROR_FAILED_SHARDS.format(failed_shards,coordinator.work_dir))
+
+
 def _int_parts(ints_string):
     return [int(i) for i in ints_string.split(',')]
 
 
+def _print_summary(tasks,print_all):
+    failed=uresults.failed(tasks)
+    print('- nb_tasks:',len(tasks))
+    print('- states:',uresults.state_counts(tasks))
+    print('- nb_retried:',uresults.nb_retried(tasks))
+    print('- nb_failed:',len(failed))
+    print()
+    if print_all:
+        pprint(list(tasks))
+    elif len(tasks):
+        pprint([tasks[0],'...',tasks[-1]])
+    print()
+    print(f'- slowest:')
+    for result in uresults.slowest(tasks,NB_SLOWEST):
+        print(f'  {result.duration:.1f}s',result.name,result.state)
+    if failed:
+        print()
+        print('- failures:')
+        for result in failed:
+            print(f'  {result.name} [{result.error_class}, retries={result.retries}]:',result.error_message)
+
+
+def _print_metrics(metrics):
+    print('- rpcs:',metrics.rpcs)
+    print('- phases (seconds):')
+    fields=umetrics.SUMMARY_FIELDS
+    print(f'  {"":<14}'+''.join(f'{f:>10}' for f in fields))
+    for phase,summary in metrics.summary().items():
+        values=''.join(
+            f'{summary[f]:>10}' if f=='count' else f'{summary[f]:>10.3f}'
+            for f in fields)
+        print(f'  {phase:<14}'+values)
+
+
 def _timestamp(prefix,start=None):
     dt=datetime.now()
     print(f'{prefix.upper()}:',dt.strftime(TS_FMT))
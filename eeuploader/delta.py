@@ -0,0 +1,114 @@
+import time
+from datetime import datetime, timezone
+from . import journal as ujournal
+#
+# CONSTANTS
+#
+NEW='NEW'
+UNCHANGED='UNCHANGED'
+METADATA='METADATA'
+SOURCE='SOURCE'
+# manifest keys that can be updated in place (without re-ingestion)
+METADATA_KEYS=[
+    'properties',
+    'start_time',
+    'end_time' ]
+TIME_KEYS=[
+    'start_time',
+    'end_time' ]
+TS_FMT='%Y-%m-%dT%H:%M:%SZ'
+
+
+
+#
+# HELPERS
+#
+def fingerprint(manifest):
+    """ (source,metadata) hashes of an upload manifest
+
+    * source: everything that requires an ingestion (name, tilesets, bands, ...)
+    * metadata: properties, start_time and end_time (see `update_request`)
+    """
+    source={ k: v for k,v in manifest.items() if k not in METADATA_KEYS }
+    metadata={ k: manifest.get(k) for k in METADATA_KEYS }
+    return ujournal.manifest_hash(source), ujournal.manifest_hash(metadata)
+
+
+def update_request(manifest):
+    """ (asset,update_mask) to set the metadata of an asset to that of manifest
+
+    metadata missing from the manifest is cleared.
+
+    Returns<tuple>: ee.data.updateAsset `asset` and `update_mask` arguments
+    """
+    asset={}
+    for key in METADATA_KEYS:
+        value=manifest.get(key)
+        if value is None:
+            continue
+        if key in TIME_KEYS:
+            value=_timestamp(value)
+        asset[key]=value
+    return asset, list(METADATA_KEYS)
+
+
+
+#
+# MAIN
+#
+class Fingerprints(ujournal.JsonlLog):
+    """ append-only (jsonl) store of the manifest fingerprints of uploaded assets
+
+    Drives delta uploads: each manifest is compared with the fingerprint
+    recorded the last time the asset was ingested or updated:
+
+        * NEW: no fingerprint (ingest)
+        * UNCHANGED: same source and metadata (skip)
+        * METADATA: same source, changed metadata (update the asset's properties)
+        * SOURCE: changed source (re-ingest, overwriting the asset)
+
+    One record is appended each time an asset is ingested or updated:
+
+        {"name": <asset-name>, "source": <source-hash>, "metadata": <metadata-hash>,
+         "time": <unix-time>}
+
+    On load the last record for each asset name wins.
+
+    Args:
+        path<str>: path to fingerprints file. created on first write if it does not exist
+        fsync<bool>: if true fsync after every record (see journal.JsonlLog)
+    """
+    def change(self,manifest):
+        """ NEW, UNCHANGED, METADATA or SOURCE (see class doc-string) """
+        record=self.records.get(manifest['name'])
+        if not record:
+            return NEW
+        source,metadata=fingerprint(manifest)
+        if record['source']!=source:
+            return SOURCE
+        elif record['metadata']!=metadata:
+            return METADATA
+        else:
+            return UNCHANGED
+
+
+    def record(self,manifest):
+        """ record the fingerprint of an ingested or updated asset """
+        source,metadata=fingerprint(manifest)
+        record={
+            'name': manifest['name'],
+            'source': source,
+            'metadata': metadata,
+            'time': time.time() }
+        self.append(record)
+
+
+
+#
+# INTERNAL
+#
+def _timestamp(value):
+    # manifest timestamp ({"seconds": ...}) to an RFC 3339 string
+    if isinstance(value,dict):
+        value=datetime.fromtimestamp(value.get('seconds',0),tz=timezone.utc).strftime(TS_FMT)
+    return value
@@ -0,0 +1,331 @@
+import os
+import re
+import json
+import mmap
+import struct
+from itertools import islice
+#
+# CONFIG
+#
+CHUNK_SIZE=2**20
+#
+# CONSTANTS
+#
+FEATURES='features'
+GEOMETRY='geometry'
+WHITESPACE_REGX=re.compile(r'[ \t\n\r]*')
+INDEX_EXT='idx'
+INDEX_MAGIC=b'EEUPIDX1'
+INDEX_HEADER=struct.Struct('<8sQQQ')
+INDEX_RECORD=struct.Struct('<QQ')
+
+
+
+#
+# METHODS
+#
+def iter_features(path,drop_geometry=False,key=FEATURES,chunk_size=CHUNK_SIZE):
+    """ stream features from a (geo)json feature collection file
+
+    Features are parsed one at a time from the `key`-list (or from a top-level
+    list) so that very large files are never fully loaded into memory.
+
+    Args:
+        path<str>: path to (geo)json file
+        drop_geometry<bool>: if true remove the "geometry" from each feature
+        key<str>: key of the features list
+        chunk_size<int>: number of characters read at a time
+
+    Yields<dict>: feature
+    """
+    with open(path,'r') as file:
+        stream=_JSONStream(file,chunk_size)
+        stream.find_array(key)
+        for feat in stream.array():
+            if drop_geometry:
+                feat.pop(GEOMETRY,None)
+            yield feat
+
+
+
+#
+# MAIN
+#
+class FeatureStream(object):
+    """ re-iterable, list-like view of a feature collection file
+
+    Each iteration streams the features from the file (see `iter_features`).
+    Integer indices and slices are supported. Without an index they require 
+    streaming up to the requested feature (use `select` to fetch many indices 
+    at once). With `index=True` a FeatureIndex sidecar file is used (and built 
+    if needed) so that indexed features are read directly from their byte offsets.
+
+    Args:
+        path<str>: path to (geo)json file
+        drop_geometry<bool>: if true remove the "geometry" from each feature
+        key<str>: key of the features list
+        index<bool>: use (and if needed build) a FeatureIndex
+
+    Usage:
+
+        feats=FeatureStream('fc.geojson',drop_geometry=True,index=True)
+        for feat in feats:
+            ...
+        feats[10]
+        feats.select([3,400,24])
+    """
+    def __init__(self,path,drop_geometry=False,key=FEATURES,index=False):
+        self.path=path
+        self.drop_geometry=drop_geometry
+        self.key=key
+        self.index=FeatureIndex(path,key=key) if index else None
+        self._len=None
+
+
+    def __iter__(self):
+        return iter_features(self.path,drop_geometry=self.drop_geometry,key=self.key)
+
+
+    def __len__(self):
+        if self.index is not None:
+            return len(self.index)
+        if self._len is None:
+            self._len=sum(1 for _ in self)
+        return self._len
+
+
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            start,stop,step=index.indices(len(self))
+            if self.index is not None:
+                return self.select(range(start,stop,step))
+            else:
+                return list(islice(self,start,stop,step))
+        else:
+            return self.select([index])[0]
+
+
+    def select(self,indices):
+        """ features for a list of indices (in the order of indices) """
+        indices=[i+len(self) if i<0 else i for i in indices]
+        if self.index is not None:
+            feats=self.index.read(indices)
+        else:
+            feats=self._scan(indices)
+        if self.drop_geometry:
+            for feat in feats:
+                feat.pop(GEOMETRY,None)
+        return feats
+
+
+    #
+    # INTERNAL
+    #
+    def _scan(self,indices):
+        wanted=set(indices)
+        found={}
+        if wanted:
+            for i,feat in enumerate(islice(self,max(wanted)+1)):
+                if i in wanted:
+                    found[i]=feat
+        missing=wanted.difference(found)
+        if missing:
+            raise IndexError(f'feature index out of range: {min(missing)}')
+        return [found[i] for i in indices]
+
+
+
+class FeatureIndex(object):
+    """ byte-offset index of the features in a feature collection file
+
+    The index is a sidecar file (<path>.idx) built once (by streaming the 
+    file) and rebuilt if the feature collection file changes (size or mtime).
+    It holds a (start,end) byte-offset pair per feature and is memory-mapped,
+    so `read` seeks straight to the requested features and parses only those.
+
+    Args:
+        path<str>: path to (geo)json file
+        index_path<str|None>: sidecar path. defaults to <path>.idx
+        key<str>: key of the features list
+    """
+    def __init__(self,path,index_path=None,key=FEATURES):
+        self.path=path
+        self.index_path=index_path or f'{path}.{INDEX_EXT}'
+        self.key=key
+        self._mmap=None
+        self._len=None
+        if not self._load():
+            self.build()
+            self._load()
+
+
+    def build(self):
+        """ stream the feature collection and write the sidecar index """
+        stat=os.stat(self.path)
+        # per-process tmp file: concurrent builds (ie. shard workers) can not mix
+        tmp_path=f'{self.index_path}.{os.getpid()}.tmp'
+        count=0
+        # latin-1 maps bytes 1:1 to characters and newline='' keeps \r\n 
+        # untranslated: character offsets are byte offsets
+        with open(self.path,'r',encoding='latin-1',newline='') as src, open(tmp_path,'wb') as dest:
+            dest.write(INDEX_HEADER.pack(INDEX_MAGIC,stat.st_size,stat.st_mtime_ns,0))
+            stream=_JSONStream(src)
+            stream.find_array(self.key)
+            for start,end in stream.array_offsets():
+                dest.write(INDEX_RECORD.pack(start,end))
+                count+=1
+            dest.seek(0)
+            dest.write(INDEX_HEADER.pack(INDEX_MAGIC,stat.st_size,stat.st_mtime_ns,count))
+        os.replace(tmp_path,self.index_path)
+
+
+    def __len__(self):
+        return self._len
+
+
+    def offsets(self,index):
+        if (index<0) or (index>=self._len):
+            raise IndexError(f'feature index out of range: {index}')
+        return INDEX_RECORD.unpack_from(
+            self._mmap,
+            INDEX_HEADER.size+index*INDEX_RECORD.size)
+
+
+    def read(self,indices):
+        """ features for a list of indices (in the order of indices) """
+        offsets=[self.offsets(i) for i in indices]
+        feats={}
+        with open(self.path,'rb') as file:
+            for start,end in sorted(set(offsets)):
+                file.seek(start)
+                feats[start]=file.read(end-start)
+        return [json.loads(feats[start]) for start,_ in offsets]
+
+
+    #
+    # INTERNAL
+    #
+    def _load(self):
+        if not os.path.isfile(self.index_path):
+            return False
+        if os.path.getsize(self.index_path)<INDEX_HEADER.size:
+            return False
+        stat=os.stat(self.path)
+        with open(self.index_path,'rb') as file:
+            index_mmap=mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+        magic,size,mtime,count=INDEX_HEADER.unpack_from(index_mmap)
+        if (magic!=INDEX_MAGIC) or (size!=stat.st_size) or (mtime!=stat.st_mtime_ns):
+            index_mmap.close()
+            return False
+        self._mmap=index_mmap
+        self._len=count
+        return True
+
+
+
+#
+# INTERNAL
+#
+class _JSONStream(object):
+    """ minimal incremental json reader: decodes one value at a time """
+    def __init__(self,file,chunk_size=CHUNK_SIZE):
+        self.file=file
+        self.chunk_size=chunk_size
+        self.decoder=json.JSONDecoder()
+        self.buf=''
+        self.pos=0
+        self.offset=0
+        self.eof=False
+
+
+    def find_array(self,key):
+        """ position the stream at the top-level list or the key-list """
+        if self.peek()=='[':
+            return
+        self.expect('{')
+        while self.peek()!='}':
+            name=self.value()
+            self.expect(':')
+            if name==key:
+                return
+            self.value()
+            if self.peek()==',':
+                self.pos+=1
+        raise KeyError(key)
+
+
+    def array(self):
+        self.expect('[')
+        if self.peek()==']':
+            self.pos+=1
+            return
+        while True:
+            yield self.value()
+            char=self.peek()
+            self.pos+=1
+            if char==']':
+                return
+            elif char!=',':
+                raise ValueError(f'invalid json: expected "," or "]" not {char}')
+
+
+    def array_offsets(self):
+        """ like `array` but yields the (start,end) offset of each value """
+        self.expect('[')
+        if self.peek()==']':
+            self.pos+=1
+            return
+        while True:
+            self.peek()
+            start=self.offset+self.pos
+            self.value()
+            yield start, self.offset+self.pos
+            char=self.peek()
+            self.pos+=1
+            if char==']':
+                return
+            elif char!=',':
+                raise ValueError(f'invalid json: expected "," or "]" not {char}')
+
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj,end=self.decoder.raw_decode(self.buf,self.pos)
+                # a value at the end of the buffer may be incomplete (ie. a number)
+                if (end<len(self.buf)) or self.eof:
+                    self.pos=end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+    def peek(self):
+        while True:
+            self.pos=WHITESPACE_REGX.match(self.buf,self.pos).end()
+            if self.pos<len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+
+    def expect(self,char):
+        found=self.peek()
+        if found!=char:
+            raise ValueError(f'invalid json: expected "{char}" not {found}')
+        self.pos+=1
+
+
+    def _fill(self):
+        if not self.eof:
+            chunk=self.file.read(self.chunk_size)
+            if chunk:
+                self.offset+=self.pos
+                self.buf=self.buf[self.pos:]+chunk
+                self.pos=0
+                return True
+            self.eof=True
+        return False
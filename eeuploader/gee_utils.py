@@ -1,11 +1,35 @@
 import ee
 import re
 import time
+import asyncio
+import random
+import statistics
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from . import rate_limit as urate_limit
+from . import metrics as umetrics
+from . import backend as ubackend
+#
+# CONFIG
+#
+POLL_INITIAL=1
+POLL_MAX=60
+POLL_FACTOR=2
+POLL_JITTER=0.1
+POLL_HISTORY=1000
+STATUS_CHUNK_SIZE=10
+STATUS_THREADS=8
+MAX_POLL_FAILURES=5
+ASSET_PAGE_SIZE=1000
+TASK_ID_BLOCK_SIZE=100
 #
 # CONSTANTS
 #
 USR='users'
 DOT='d'
+ADAPTIVE='adaptive'
 # GEE INTERNAL
 USR_PRJ_REGEX=r'^(users|projects)'
 NAME_PREFIX="projects/earthengine-legacy/assets"
@@ -17,14 +41,35 @@ TASK_TYPES = {
     'INGEST': 'Upload',
     'INGEST_IMAGE': 'Upload',
     'INGEST_TABLE': 'Upload' }
+COMPLETED='COMPLETED'
+FAILED='FAILED'
 TASK_FINISHED_STATES=[
-    'COMPLETED',
-    'FAILED',
+    COMPLETED,
+    FAILED,
     'CANCELLED' ]
 
 #
 # GEE HELPERS
 #
+_initialize_lock=threading.Lock()
+def initialize(**kwargs):
+    """ initialize earth engine (once per backend, see backend.get_backend)
+
+    Called lazily by the helpers below (and EEImagesUp) before the first request,
+    so that importing eeuploader and purely local work (ie. building manifests)
+    does not require authentication.
+
+    Args:
+        **kwargs: passed to ee.Initialize on the first call
+    """
+    backend=ubackend.get_backend()
+    if not backend.initialized:
+        with _initialize_lock:
+            if not backend.initialized:
+                backend.initialize(**kwargs)
+                backend.initialized=True
+
+
 def asset_id(user,collection=None,name=None,prefix=False,safe=True):
     """ build gee asset_id from parts
 
@@ -70,7 +115,8 @@ def task_info(task_id):
     """
     if isinstance(task_id,dict):
         task_id=task_id['id']
-    for i, status in enumerate(ee.data.getTaskStatus(task_id)):
+    initialize()
+    for i, status in enumerate(ubackend.get_backend().get_task_status(task_id)):
         if i:
             print()
         print('%s:' % status['id'])
@@ -92,30 +138,207 @@ def task_info(task_id):
             print('  Destination URIs: %s' % ', '.join(status['destination_uris']))
 
 
-def wait(task_id, timeout, noisy=True, raise_error=False):
+class TaskIdPool(object):
+    """ thread-safe pool of pre-allocated task ids
+
+    Task ids are fetched `block_size` at a time with a single 
+    `ee.data.newTaskId(count)` request. Once `refill_at` (or fewer) ids remain,
+    the next block is fetched in a background thread, so `get` only blocks 
+    when the pool is empty (ie. on first use). Unused ids are simply dropped.
+
+    Args:
+        block_size<int>: number of task ids per request
+        refill_at<int|None>: remaining ids that trigger a refill. defaults to block_size/4
+        metrics<metrics.Metrics|None>: if provided newTaskId requests are counted
+
+    Usage:
+
+        task_ids=TaskIdPool(500)
+        ee.data.startIngestion(task_ids.get(),manifest)
+    """
+    def __init__(self,block_size=TASK_ID_BLOCK_SIZE,refill_at=None,metrics=None):
+        self.block_size=block_size
+        if refill_at is None:
+            refill_at=block_size//4
+        self.refill_at=refill_at
+        self.metrics=metrics
+        self._ids=deque()
+        self._lock=threading.Lock()
+        self._refilling=False
+
+
+    def get(self):
+        """ next task id """
+        with self._lock:
+            if not self._ids:
+                self._ids.extend(self._fetch())
+            task_id=self._ids.popleft()
+            if (len(self._ids)<=self.refill_at) and (not self._refilling):
+                self._refilling=True
+                threading.Thread(target=self._refill,daemon=True).start()
+        return task_id
+
+
+    #
+    # INTERNAL
+    #
+    def _fetch(self):
+        initialize()
+        if self.metrics:
+            self.metrics.rpc(umetrics.NEW_TASK_ID)
+        return ubackend.get_backend().new_task_id(self.block_size)
+
+
+    def _refill(self):
+        try:
+            ids=self._fetch()
+        except Exception:
+            # the next `get` on an empty pool fetches (and raises) in the caller
+            ids=[]
+        with self._lock:
+            self._ids.extend(ids)
+            self._refilling=False
+
+
+class PollingPolicy(object):
+    """ adaptive task-status polling intervals
+
+    * new tasks are first checked after `initial` seconds
+    * intervals grow exponentially (by `factor`, up to `maximum`) while the 
+      task state is unchanged and reset to `initial` when the state changes 
+      (for example READY -> RUNNING)
+    * once durations of completed tasks have been recorded, tasks younger than 
+      the median duration are next checked at their expected completion time
+    * each interval is randomized by +/- `jitter` (fraction) so that tasks 
+      submitted together do not poll in lock-step
+
+    Args:
+        initial<int|float>:
+            first (and minimum) interval in seconds
+        maximum<int|float>:
+            max interval in seconds
+        factor<int|float>:
+            backoff factor
+        jitter<float>:
+            fractional jitter
+        history<int>:
+            number of recent task durations used for the median
+
+    Usage:
+
+        # adaptive
+        policy=PollingPolicy(initial=2,maximum=30)
+        # fixed 10 second interval (the pre-adaptive behavior)
+        policy=PollingPolicy.fixed(10)
+    """
+    @classmethod
+    def fixed(cls,interval):
+        return cls(initial=interval,maximum=interval,factor=1,jitter=0,history=0)
+
+
+    def __init__(
+            self,
+            initial=POLL_INITIAL,
+            maximum=POLL_MAX,
+            factor=POLL_FACTOR,
+            jitter=POLL_JITTER,
+            history=POLL_HISTORY):
+        self.initial=initial
+        self.maximum=maximum
+        self.factor=factor
+        self.jitter=jitter
+        self.durations=deque(maxlen=history) if history else None
+        self._median=None
+
+
+    def interval(self,elapsed,nb_polls=0):
+        """ seconds until next status check
+
+        Args:
+            elapsed<float>: seconds since the task was submitted
+            nb_polls<int>: number of checks since the last state change
+        """
+        if self._median and (elapsed<self._median):
+            interval=self._median-elapsed
+        else:
+            interval=self.initial*(self.factor**nb_polls)
+        interval=min(max(interval,self.initial),self.maximum)
+        if self.jitter:
+            interval*=random.uniform(1-self.jitter,1+self.jitter)
+        return interval
+
+
+    def record(self,duration):
+        """ record the duration of a completed task """
+        if self.durations is not None:
+            self.durations.append(duration)
+            self._median=statistics.median(list(self.durations))
+
+
+    def median(self):
+        return self._median
+
+
+
+def polling_policy(polling=None):
+    """ polling policy from config value
+
+    Args:
+        polling<PollingPolicy|dict|int|float|str|None>:
+            * None or 'adaptive': default adaptive PollingPolicy
+            * int/float (or numeric string): fixed interval in seconds
+            * dict: PollingPolicy kwargs
+    """
+    if isinstance(polling,PollingPolicy):
+        return polling
+    elif isinstance(polling,dict):
+        return PollingPolicy(**polling)
+    elif polling in [None,ADAPTIVE]:
+        return PollingPolicy()
+    else:
+        return PollingPolicy.fixed(float(polling))
+
+
+def wait(task_id, timeout, noisy=True, raise_error=False, monitor=None, polling=None, rate_limiter=None, metrics=None):
     """ modified ee.cli.utils.wait_for_task 
         * silent mode
         * optional raise error
         * return final task status
+        * optional shared (running) TaskMonitor: the task status is polled 
+          together with every other task the monitor is tracking
+        * optional polling policy (see `polling_policy`). defaults to adaptive
+        * optional (shared) rate_limit.RateLimiter for the status requests
+        * optional metrics.Metrics: status requests are counted and timed (POLL)
     """
+    if monitor is not None:
+        return monitor.wait(task_id, timeout, raise_error=raise_error)
+    initialize()
+    policy = polling_policy(polling)
     start = time.time()
     elapsed = 0
-    last_check = 0
+    last_state = None
+    nb_polls = 0
     while True:
         elapsed = time.time() - start
-        status = ee.data.getTaskStatus(task_id)[0]
+        status = _task_statuses(task_id, rate_limiter, metrics)[0]
         state = status['state']
         if state in TASK_FINISHED_STATES:
             error_message = status.get('error_message', None)
             if noisy: 
                 print('Task %s ended at state: %s after %.2f seconds'
                         % (task_id, state, elapsed))
+            if state == COMPLETED:
+                policy.record(elapsed)
             if raise_error and error_message:
                 raise ee.ee_exception.EEException('Error: %s' % error_message)
             return status
+        if state != last_state:
+            last_state = state
+            nb_polls = 0
         remaining = timeout - elapsed
         if remaining > 0:
-            time.sleep(min(10, remaining))
+            time.sleep(min(policy.interval(elapsed, nb_polls), remaining))
+            nb_polls += 1
         else:
             break
     timeout_msg='Wait for task %s timed out after %.2f seconds' % (task_id, elapsed)
@@ -125,7 +348,388 @@ def wait(task_id, timeout, noisy=True, raise_error=False):
     return status
 
 
-def assets(user,collection=None,return_ids=True,strip_prefix=True):
+class TaskMonitor(object):
+    """ track many outstanding tasks from a single polling thread
+
+    Decouples task submission from completion polling: callers `add` task ids
+    (with a callback) and return immediately, or block on `wait`. A single 
+    thread tracks the outstanding tasks and polls the ones that are due (see 
+    PollingPolicy), and calls `callback(status)` once each task reaches a 
+    TASK_FINISHED_STATE or times out. As in `wait`, timed out tasks have a 
+    TIMEOUT key added to their status.
+
+    `ee.data.getTaskStatus` makes one request per task id (even for a list of 
+    ids): due tasks are split in chunks of `chunk_size` ids that are fetched 
+    concurrently by `nb_threads` threads. Requests are counted and rate 
+    limited per task id.
+
+    Timeouts are applied whether or not status requests succeed. Failed status
+    requests are retried with the polling backoff; after `max_poll_failures`
+    consecutive failures every outstanding task is given up (TIMEOUT status
+    with the request error as `error_message`) so that `wait` and `stop` 
+    always return.
+
+    Args:
+        timeout<int>:
+            default seconds (from `add`) before a task is considered timed out
+        polling<PollingPolicy|dict|int|float|str|None>:
+            polling policy (see `polling_policy`). defaults to adaptive
+        chunk_size<int>:
+            max number of task ids per getTaskStatus call
+        nb_threads<int>:
+            number of threads fetching chunks concurrently
+        noisy<bool>:
+            print final task states
+        raise_error<bool>:
+            if true, the first task error is stored in `self.error`
+        rate_limiter<rate_limit.RateLimiter|None>:
+            if provided status requests are rate limited (STATUS budget, one 
+            token per task id)
+        metrics<metrics.Metrics|None>:
+            if provided status requests are counted (per task id) and timed (POLL,
+            per chunk)
+        on_state<function|None>:
+            if provided called with (task_id,state) each time a polled task 
+            changes state (ie. to feed a progress.Progress)
+        max_poll_failures<int>:
+            consecutive failed status requests before the outstanding tasks are 
+            given up. if `raise_error` the request error is stored in `self.error`
+
+    Usage:
+
+        monitor=TaskMonitor(timeout=300).start()
+        monitor.add(task_id,print)
+        status=monitor.wait(other_task_id)
+        monitor.stop()  # blocks until every added task has finished
+    """
+    def __init__(
+            self,
+            timeout,
+            polling=None,
+            chunk_size=STATUS_CHUNK_SIZE,
+            nb_threads=STATUS_THREADS,
+            noisy=False,
+            raise_error=False,
+            rate_limiter=None,
+            metrics=None,
+            on_state=None,
+            max_poll_failures=MAX_POLL_FAILURES):
+        self.timeout=timeout
+        self.policy=polling_policy(polling)
+        self.rate_limiter=rate_limiter
+        self.metrics=metrics
+        self.on_state=on_state
+        self.chunk_size=chunk_size
+        self.nb_threads=nb_threads
+        self.noisy=noisy
+        self.raise_error=raise_error
+        self.max_poll_failures=max_poll_failures
+        self.nb_poll_failures=0
+        self.error=None
+        self._tasks={}
+        self._lock=threading.Lock()
+        self._wake=threading.Event()
+        self._closing=threading.Event()
+        self._thread=None
+        self._executor=None
+
+
+    def start(self):
+        initialize()
+        self._closing.clear()
+        self._executor=ThreadPoolExecutor(max_workers=self.nb_threads)
+        self._thread=threading.Thread(target=self._run,daemon=True)
+        self._thread.start()
+        return self
+
+
+    def add(self,task_id,callback,timeout=None):
+        if timeout is None:
+            timeout=self.timeout
+        now=time.time()
+        with self._lock:
+            self._tasks[task_id]=_MonitoredTask(
+                now,
+                timeout,
+                callback,
+                now+self.policy.interval(0))
+        self._notify()
+
+
+    def wait(self,task_id,timeout=None,raise_error=False):
+        """ block until task finishes (or times out) and return its status """
+        done=threading.Event()
+        result=[]
+        def _on_finished(status):
+            result.append(status)
+            done.set()
+        self.add(task_id,_on_finished,timeout=timeout)
+        done.wait()
+        status=result[0]
+        error_message=status.get('error_message', None)
+        if raise_error and error_message:
+            raise ee.ee_exception.EEException('Error: %s' % error_message)
+        return status
+
+
+    def stop(self):
+        """ wait for every outstanding task to finish and stop polling """
+        self._closing.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread=None
+        if self._executor:
+            self._executor.shutdown()
+            self._executor=None
+
+
+    #
+    # INTERNAL
+    #
+    def _notify(self):
+        self._wake.set()
+
+
+    def _run(self):
+        while True:
+            try:
+                self._poll()
+                self.nb_poll_failures=0
+            except Exception as e:
+                self._poll_failed(e)
+            self._expire()
+            if self._closing.is_set() and not self._tasks:
+                return
+            self._wake.clear()
+            self._wake.wait(self._next_poll()-time.time())
+
+
+    def _next_poll(self):
+        with self._lock:
+            due=[t.next_poll for t in self._tasks.values()]
+        if due:
+            return min(due)
+        else:
+            return time.time()+self.policy.maximum
+
+
+    def _poll(self):
+        # chunks are fetched concurrently but checked on the monitor thread
+        chunks=self._due_chunks()
+        futures=[
+            self._executor.submit(
+                _task_statuses,
+                [task_id for task_id,_ in chunk],
+                self.rate_limiter,
+                self.metrics)
+            for chunk in chunks ]
+        error=None
+        for chunk,future in zip(chunks,futures):
+            try:
+                self._check_chunk(chunk,future.result())
+            except Exception as e:
+                error=error or e
+        if error:
+            raise error
+
+
+    def _due_chunks(self):
+        # tasks due within half of the initial interval are polled early
+        # so that they are fetched together
+        now=time.time()+self.policy.initial/2
+        with self._lock:
+            due=[(i,t) for i,t in self._tasks.items() if t.next_poll<=now]
+        return [due[i:i+self.chunk_size] for i in range(0,len(due),self.chunk_size)]
+
+
+    def _poll_failed(self,error):
+        self.nb_poll_failures+=1
+        if self.noisy:
+            print('%s: status poll failed (%s)' % (type(self).__name__,error))
+        if self.raise_error and (not self.error):
+            self.error=error
+        now=time.time()
+        with self._lock:
+            tasks=list(self._tasks.items())
+        if self.nb_poll_failures>=self.max_poll_failures:
+            self.nb_poll_failures=0
+            for task_id,task in tasks:
+                self._finish(task_id,task,{
+                    'id': task_id,
+                    'state': task.state,
+                    'TIMEOUT': 'Wait for task %s abandoned after %d failed status requests' 
+                        % (task_id,self.max_poll_failures),
+                    'error_message': str(error) })
+        else:
+            # back off: every task is polled again after the polling interval
+            delay=self.policy.interval(0,self.nb_poll_failures)
+            for _,task in tasks:
+                task.next_poll=max(task.next_poll,min(now+delay,task.start+task.timeout))
+
+
+    def _expire(self):
+        # time out tasks past their deadline (ie. while status requests fail)
+        now=time.time()
+        with self._lock:
+            expired=[(i,t) for i,t in self._tasks.items() if now-t.start>t.timeout]
+        for task_id,task in expired:
+            timeout_msg='Wait for task %s timed out after %.2f seconds' % (task_id,now-task.start)
+            if self.noisy:
+                print(timeout_msg)
+            self._finish(task_id,task,{
+                'id': task_id,
+                'state': task.state,
+                'TIMEOUT': timeout_msg })
+
+
+    def _finish(self,task_id,task,status):
+        with self._lock:
+            if self._tasks.pop(task_id,None) is None:
+                return
+        task.callback(status)
+
+
+    def _check_chunk(self,chunk,statuses):
+        for (task_id,task),status in zip(chunk,statuses):
+            self._check(task_id,task,status)
+
+
+    def _check(self,task_id,task,status):
+        now=time.time()
+        elapsed=now-task.start
+        state=status['state']
+        if self.on_state and (state!=task.state):
+            self.on_state(task_id,state)
+        if state in TASK_FINISHED_STATES:
+            if self.noisy:
+                print('Task %s ended at state: %s after %.2f seconds'
+                        % (task_id, state, elapsed))
+            if state==COMPLETED:
+                self.policy.record(elapsed)
+            error_message=status.get('error_message', None)
+            if self.raise_error and error_message and (not self.error):
+                self.error=ee.ee_exception.EEException('Error: %s' % error_message)
+        elif elapsed>task.timeout:
+            timeout_msg='Wait for task %s timed out after %.2f seconds' % (task_id, elapsed)
+            status['TIMEOUT']=timeout_msg
+            if self.noisy:
+                print(timeout_msg)
+        else:
+            if state!=task.state:
+                task.state=state
+                task.nb_polls=0
+            interval=self.policy.interval(elapsed,task.nb_polls)
+            task.next_poll=now+min(interval,max(task.timeout-elapsed,0))
+            task.nb_polls+=1
+            return
+        self._finish(task_id,task,status)
+
+
+
+class AsyncTaskMonitor(TaskMonitor):
+    """ asyncio version of TaskMonitor
+
+    Polling runs as a task on the current event loop. The blocking status 
+    requests (chunks) are run concurrently in `executor` (the loop's default 
+    executor if None).
+    `start`, `add` and `wait` must be called from the event loop.
+
+    Usage:
+
+        monitor=AsyncTaskMonitor(timeout=300).start()
+        status=await monitor.wait(task_id)
+        await monitor.stop()
+    """
+    def __init__(self,*args,executor=None,**kwargs):
+        super().__init__(*args,**kwargs)
+        self.executor=executor
+        self._wake=asyncio.Event()
+
+
+    def start(self):
+        initialize()
+        self._closing.clear()
+        self._thread=asyncio.ensure_future(self._run())
+        return self
+
+
+    async def wait(self,task_id,timeout=None,raise_error=False):
+        """ wait for task to finish (or time out) and return its status """
+        done=asyncio.get_running_loop().create_future()
+        def _on_finished(status):
+            if not done.done():
+                done.set_result(status)
+        self.add(task_id,_on_finished,timeout=timeout)
+        status=await done
+        error_message=status.get('error_message', None)
+        if raise_error and error_message:
+            raise ee.ee_exception.EEException('Error: %s' % error_message)
+        return status
+
+
+    async def stop(self):
+        """ wait for every outstanding task to finish and stop polling """
+        self._closing.set()
+        self._wake.set()
+        if self._thread:
+            await self._thread
+            self._thread=None
+
+
+    #
+    # INTERNAL
+    #
+    async def _run(self):
+        loop=asyncio.get_running_loop()
+        while True:
+            try:
+                chunks=self._due_chunks()
+                results=await asyncio.gather(
+                    *(
+                        loop.run_in_executor(
+                            self.executor,
+                            _task_statuses,
+                            [task_id for task_id,_ in chunk],
+                            self.rate_limiter,
+                            self.metrics)
+                        for chunk in chunks ),
+                    return_exceptions=True)
+                for chunk,statuses in zip(chunks,results):
+                    if not isinstance(statuses,Exception):
+                        self._check_chunk(chunk,statuses)
+                errors=[r for r in results if isinstance(r,Exception)]
+                if errors:
+                    raise errors[0]
+                self.nb_poll_failures=0
+            except Exception as e:
+                self._poll_failed(e)
+            self._expire()
+            if self._closing.is_set() and not self._tasks:
+                return
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wake.wait(),
+                    max(self._next_poll()-time.time(),0))
+            except asyncio.TimeoutError:
+                pass
+
+
+
+class _MonitoredTask(object):
+    __slots__=['start','timeout','callback','next_poll','state','nb_polls']
+    def __init__(self,start,timeout,callback,next_poll):
+        self.start=start
+        self.timeout=timeout
+        self.callback=callback
+        self.next_poll=next_poll
+        self.state=None
+        self.nb_polls=0
+
+
+
+def assets(user,collection=None,return_ids=True,strip_prefix=True,page_size=ASSET_PAGE_SIZE,metrics=None):
     """ get gee assets 
 
     Args:
@@ -141,19 +745,78 @@ def assets(user,collection=None,return_ids=True,strip_prefix=True):
             * otherwise: return list object
         strip_prefix<bool>:
             * if true: strip "projects/earthengine-legacy/assets"
+        page_size<int>:
+            number of assets per list request
+        metrics<metrics.Metrics|None>:
+            if provided list requests are counted
 
     Returns<list>: list of assets
     """     
-    children=ee.data.getList({'id': asset_id(user,collection,prefix=False)})
-    if return_ids:
-        children=[ _get_id(c,strip_prefix) for c in children]
-    return children
+    return list(iter_assets(
+        user,
+        collection=collection,
+        return_ids=return_ids,
+        strip_prefix=strip_prefix,
+        page_size=page_size,
+        metrics=metrics))
+
+
+def iter_assets(user,collection=None,return_ids=True,strip_prefix=True,page_size=ASSET_PAGE_SIZE,metrics=None):
+    """ generator of gee assets 
+    
+    Lists assets one page (of `page_size` assets) at a time, so that very large 
+    collections are neither truncated nor loaded in a single request.
+
+    Args: (see `assets`)
+
+    Yields<str|dict>: asset_id or asset object
+    """ 
+    initialize()
+    params={
+        'parent': asset_id(user,collection,prefix=False),
+        'pageSize': page_size,
+        'view': 'BASIC' }
+    while True:
+        if metrics:
+            metrics.rpc(umetrics.LIST_ASSETS_RPC)
+        page=ubackend.get_backend().list_assets(params)
+        for child in page.get('assets',[]):
+            child['id']=child['name']
+            if return_ids:
+                child=_get_id(child,strip_prefix)
+            yield child
+        token=page.get('nextPageToken')
+        if token:
+            params['pageToken']=token
+        else:
+            break
 
 
 
 #
 # INTERNAL
 #
+def _task_statuses(task_ids,rate_limiter=None,metrics=None):
+    # ee.data.getTaskStatus makes one request per task id: count and rate
+    # limit them per task id
+    if isinstance(task_ids,str):
+        task_ids=[task_ids]
+    request=partial(_get_task_status,metrics)
+    if rate_limiter is None:
+        return request(task_ids)
+    else:
+        return rate_limiter.call(urate_limit.STATUS,request,task_ids,tokens=len(task_ids))
+
+
+def _get_task_status(metrics,task_ids):
+    backend=ubackend.get_backend()
+    if not metrics:
+        return backend.get_task_status(task_ids)
+    metrics.rpc(umetrics.GET_TASK_STATUS,len(task_ids))
+    with metrics.timer(umetrics.POLL):
+        return backend.get_task_status(task_ids)
+
+
 def _get_id(obj,strip_prefix):
     oid=obj['id']
     if strip_prefix:
@@ -1,24 +1,43 @@
 import ee
-ee.Initialize()
 import re
 import math
 from datetime import datetime, timedelta
 from unidecode import unidecode
 import json
 import geojson
-import mproc
+import asyncio
+from itertools import islice
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import ee.data
 import ee.ee_exception
-from itertools import chain
 from . import gee_utils as gutils
+from . import asset_cache
+from . import rate_limit as urate_limit
+from . import retry as uretry
+from . import features as ufeatures
+from . import manifests as umanifests
+from . import journal as ujournal
+from . import results as uresults
+from . import metrics as umetrics
+from . import progress as uprogress
+from . import backend as ubackend
+from . import shard as ushard
+from . import delta as udelta
+from . import scheduler
 from . import utils
 #
 # CONFIG
 # 
 NB_BATCHES=50
+MAX_IN_FLIGHT=None
+NB_THREADS=8
 TIMEOUT=5*60
 PICKLE='pickle'
 JSON='json'
+JSONL='jsonl'
 #
 # CONSTANTS
 #
@@ -29,12 +48,16 @@ PP_VALUES=[
 	"MODE",
 	"SAMPLE" ]
 DATE_FMT='%Y-%m-%d'
+# status key of uploads whose (startIngestion/updateAsset) request failed
+REQUEST_ERROR='request_error'
 # MESSAGES
 WARNING_SPECIFY_COLLECTION=(
 	"No collection set. Use `collection=False`"
 	"to upload image(s) to project root" )
 ERROR_PP=(
 	f"pyramiding_policy must be None or one of {str(PP_VALUES)}" )
+ERROR_RECORD=(
+	"Upload finished but recording it (journal, asset cache, delta) failed: {}" )
 
 
 
@@ -45,8 +68,11 @@ def _format_time(millis):
 	return datetime.fromtimestamp(millis / 1000)
 
 
-def _flatten(lists):
-	return list(chain.from_iterable(lists))
+class _Manifest(object):
+	""" precomputed manifest in a queue of features to upload """
+	__slots__=('manifest',)
+	def __init__(self,manifest):
+		self.manifest=manifest
 
 
 #
@@ -60,6 +86,9 @@ class EEImagesUp(object):
 			self,
 			user,
 			features={},
+			stream_features=False,
+			index_features=False,
+			drop_geometry=False,
 			collection=None,
 			bands=None,
 			band_names=None,
@@ -74,8 +103,20 @@ class EEImagesUp(object):
 			uri_key='gcs',
 			name_key='ee_name',
 			skip_existing=True,
+			asset_cache=False,
+			asset_cache_ttl=asset_cache.ASSET_CACHE_TTL,
+			refresh_assets=False,
 			force=False,
 			timeout=TIMEOUT,
+			polling=None,
+			task_id_block=gutils.TASK_ID_BLOCK_SIZE,
+			rate_limit=None,
+			retry=None,
+			results_store=None,
+			progress=None,
+			shard=None,
+			journal=None,
+			delta=None,
 			noisy=False,
 			raise_error=False):
 		"""
@@ -92,6 +133,19 @@ class EEImagesUp(object):
 				* if None feat(s) or feat properties must be passed directly to the
 				  public methods.
 				* otherwise feature indices can be used for manifest/upload/upload_collection
+			stream_features<bool>:
+				** ignored unless `features` is a file path **
+				if true do not load the feature collection. features are streamed from
+				the file (see features.FeatureStream) by `upload_collection` and 
+				`manifest(features=True)`. feature indices are still supported.
+			index_features<bool>:
+				** ignored unless `features` is a file path **
+				stream features (as above) and use a byte-offset index (a sidecar 
+				file built on first use, see features.FeatureIndex) so that indexed 
+				features are read directly without parsing the rest of the file
+			drop_geometry<bool>:
+				if true remove feature geometries (which are not used for uploads) 
+				when loading/streaming features
 			collection<str|False>:
 				name of image_collection/folder to upload the images.
 
@@ -130,10 +184,88 @@ class EEImagesUp(object):
 				to the start_time.
 			timeout<int>:
 				how quickly to timeout if `wait` is set to true. defaults to TIMEOUT above.
+			polling<gutils.PollingPolicy|dict|int|float|str|None>:
+				task status polling policy (see gutils.polling_policy)
+				* None or 'adaptive': exponential backoff with jitter, informed by
+				  task state changes and the median ingestion time of the run
+				* int/float: fixed polling interval in seconds
+				* dict: gutils.PollingPolicy kwargs (initial, maximum, factor, jitter)
+			task_id_block<int|None>:
+				task ids are pre-fetched `task_id_block` at a time (and refilled in the 
+				background, see gutils.TaskIdPool). if falsy fetch one id per upload
+			rate_limit<rate_limit.RateLimiter|dict|bool|None>:
+				opt-in shared rate limits for ingestion and status requests (see 
+				rate_limit.rate_limiter). requests that hit quota (429-style) errors slow 
+				the rate down and are retried, the rate recovers (up to the configured rates)
+				once the errors stop. without a rate limiter quota errors are handled by `retry`.
+				* None or False: no rate limiting
+				* True: default rates (rate_limit.SUBMIT_RATE, rate_limit.STATUS_RATE)
+				* dict: rate_limit.RateLimiter kwargs (submit_rate, status_rate, ...)
+			retry<retry.RetryPolicy|dict|int|bool|None>:
+				retries of failed uploads in `upload_collection` (see retry.retry_policy).
+				failures are classified (see retry.classify): transient, quota and timeout 
+				errors are retried with backoff, timed out tasks are waited for again and 
+				permanent errors (bad source file, asset exists, ...) are not retried. 
+				see `error_class` and `retries` of the results (results.UploadResult).
+				* None or True: default policy (retry.RETRIES retries per upload)
+				* int: max retries per upload
+				* dict: retry.RetryPolicy kwargs (retries, initial, maximum, budget, ...)
+				* False: no retries
+			results_store<str|None>:
+				how `upload_collection` stores the results of a run (self.tasks, see 
+				results.results_store). for very large runs use a compact store: 
+				* None: a list of results.UploadResult
+				* 'columnar': column-oriented in-memory store (results.ColumnarResults)
+				* path ending in .db/.sqlite/.sqlite3: sqlite database (results.SQLiteResults)
+				stores support len, iteration, indexing and the results query helpers
+				(results.failed, results.slowest, results.state_counts, ...)
+				a sqlite store stays open to be queried: call `self.tasks.close()` when 
+				done (it is closed when the next run replaces it)
+			progress<progress.Progress|dict|str|bool|None>:
+				live progress of `upload_collection` (see progress.progress_reporter):
+				submitted/running/completed/failed counts, images per minute over a 
+				sliding window and estimated completion, reported periodically
+				* None or False: no progress reporting
+				* True: print progress every progress.INTERVAL seconds
+				* str: path to a snapshot file (json) rewritten every progress.INTERVAL 
+				  seconds (progress is also printed if `noisy`)
+				* dict: progress.Progress kwargs (path, interval, window, noisy)
+			shard<str|tuple|None>:
+				'i/N' (or (i,N)): `upload_collection` only uploads the images of shard i 
+				of N. images are assigned to shards by a stable hash of their asset name
+				(see shard.shard_of) so that N processes or hosts running the same upload 
+				with shards 0 to N-1 upload every image exactly once, and reruns are stable.
+				the `rate_limit` rates are those of the whole upload (each shard uses 1/N 
+				of them) and the asset cache is read-only (see shard.LocalCoordinator)
 			skip_existing<bool>:
 				if true skip uploads for existing assets
+			asset_cache<bool|str>:
+				** ignored if `skip_existing` is false **
+				if truthy keep the existing-asset listing in a local cache so that
+				later runs do not need to re-list the collection. assets created
+				during `upload_collection` are merged into the cache.
+				* if a string: the cache directory
+				* otherwise: asset_cache.CACHE_DIR
+			asset_cache_ttl<int|None>:
+				seconds before the cached listing is re-taken (None: never)
+			refresh_assets<bool>:
+				force a new listing (and cache refresh)
 			force<bool>:
 				set to true to overwrite existing assets
+			journal<str|None>:
+				path to a (jsonl) run journal for `upload_collection`. if the journal
+				exists the run is resumed from it: completed uploads are skipped, 
+				tasks that were in flight are re-attached (not resubmitted) and failed 
+				uploads are retried. see journal.Journal
+			delta<str|None>:
+				path to a (jsonl) fingerprints file for delta uploads. each manifest is 
+				compared with the fingerprint recorded when the asset was last ingested 
+				or updated: unchanged images are skipped, images whose metadata only 
+				changed (properties, start/end time) are updated in place, and new images 
+				or images whose source changed are (re-)ingested. with `skip_existing`,
+				existing assets without a fingerprint (ie. the first delta run) are 
+				updated instead of ingested. assets whose update is rejected (ex. deleted 
+				since the last run) are re-ingested. see delta.Fingerprints
 			noisy<bool>:
 				print progress during `upload_collection`
 			raise_error<bool>:
@@ -160,18 +292,28 @@ class EEImagesUp(object):
 			# upload the first feature / print task status
 			# note: `upload` does not wait for task to complete.
 			#       set `wait=True` to wait for task to complete 
-			print(up.upload(0))
-			gutils.task_info(up.task_id)
+			task=up.upload(0)
+			print(task)
+			gutils.task_info(task)
 
 
-			# upload the first 3 features / print task final task status for each
+			# upload the first 3 features / print the result (results.UploadResult) for each
 			up.upload_collection(limit=3)
-			print(up.tasks)
+			for result in up.tasks:
+				print(result.name,result.state,result.error_message)
+
+
+			# per-phase timings (percentiles) and rpc counts
+			pprint(up.metrics.summary())
+			print(up.metrics.rpcs)
+			up.metrics.save('metrics.csv')
 		
 		"""
+		self.metrics=umetrics.Metrics()
+		self.shard=ushard.parse_shard(shard)
 		self._set_destination(user,collection)
-		self._set_features(features)
-		self._set_existing(skip_existing)
+		self._set_features(features,stream_features,index_features,drop_geometry)
+		self._set_existing(skip_existing,asset_cache,asset_cache_ttl,refresh_assets)
 		self.band_names=band_names  
 		self.bands=bands    
 		self.pyramiding_policy=self._pyramiding_policy(pyramiding_policy)
@@ -186,6 +328,16 @@ class EEImagesUp(object):
 		self.end_time_key=end_time_key
 		self.days_delta=days_delta
 		self.timeout=timeout
+		self.polling=gutils.polling_policy(polling)
+		self.task_ids=gutils.TaskIdPool(task_id_block,metrics=self.metrics) if task_id_block else None
+		self.rate_limiter=urate_limit.rate_limiter(
+			rate_limit,
+			share=1/self.shard[1] if self.shard else 1)
+		self.retry=uretry.retry_policy(retry)
+		self.results_store=results_store
+		self.progress=progress
+		self.journal=ujournal.Journal(journal) if journal else None
+		self.delta=udelta.Fingerprints(delta) if delta else None
 		self.noisy=noisy
 		self.raise_error=raise_error
 		
@@ -203,7 +355,10 @@ class EEImagesUp(object):
 			features=False,
 			dest=None,
 			save_as=PICKLE,
-			indent=None):
+			indent=None,
+			bulk=True,
+			nb_processes=None,
+			chunk_size=umanifests.CHUNK_SIZE):
 		""" manifest for single upload or manifests list
 
 		Args:
@@ -235,42 +390,71 @@ class EEImagesUp(object):
 				if dest: manifest will be saved and dest will be returned
 				otherwise: manifest will be returned
 			save_as:
-				* file-type: one of ['json', 'pickle']
+				* file-type: one of ['json', 'jsonl', 'pickle']
 				* defaults to 'pickle'
+				* jsonl: one manifest per line, gzipped if dest ends with ".gz".
+				  `features` manifests are written as they are built (never all
+				  held in memory). read with manifests.read_manifests
 			indent<int|None>:
 				if saving to json: indent pretty printing arg.
+			bulk<bool>:
+				if true (default) build `features` manifests with manifests.BulkManifests.
+				otherwise build them one feature at a time. the results are identical.
+			nb_processes<int|None>:
+				if set build `features` manifests in a pool of `nb_processes` processes 
+				(see manifests.parallel_manifests). the results are identical. saved 
+				as jsonl (or json without indent) the workers serialize the manifests
+				themselves, which scales best.
+			chunk_size<int>:
+				** ignored unless `nb_processes` **
+				number of features per process-pool task
 		
 		Returns<str|dict>:
 			
 			* <dict> Manifest for a single upload
 			* <str> Destination of saved file
 		"""
-		if features:
-			if features is True:
-				features=self.features
-			manifest=[]
-			for feat in features:
-				manifest.append(self._feature_manifest(
-					feat=feat,
-					uri=uri,
-					name=name,
-					tileset_id=tileset_id,
-					crs=crs,
-					properties=properties,
-					start_time=start_time,
-					end_time=end_time))
+		manifest_kwargs=dict(
+			uri=uri,
+			name=name,
+			tileset_id=tileset_id,
+			crs=crs,
+			properties=properties,
+			start_time=start_time,
+			end_time=end_time)
+		is_features=isinstance(features,ufeatures.FeatureStream) or bool(features)
+		text_dest=dest and ((save_as==JSONL) or ((save_as==JSON) and (indent is None)))
+		if is_features and nb_processes and text_dest:
+			# workers send back json text: the manifests are never unpickled here
+			chunks=umanifests.parallel_manifests(
+				self,
+				self._select(features),
+				nb_processes=nb_processes,
+				chunk_size=chunk_size,
+				as_jsonl=True,
+				**manifest_kwargs)
+			if save_as==JSONL:
+				umanifests.save_jsonl_text(chunks,dest)
+			else:
+				umanifests.save_json_text(chunks,dest)
+			return dest
+		if is_features:
+			manifest=self._manifests(
+				self._select(features),
+				bulk,
+				nb_processes,
+				chunk_size,
+				**manifest_kwargs)
+			if not (dest and (save_as==JSONL)):
+				manifest=list(manifest)
 		else:
-			manifest=self._feature_manifest(
-				feat=feat,
-				uri=uri,
-				name=name,
-				tileset_id=tileset_id,
-				crs=crs,
-				properties=properties,
-				start_time=start_time,
-				end_time=end_time)
+			manifest=self._feature_manifest(feat=feat,**manifest_kwargs)
 		if dest:
-			if save_as==JSON:
+			if save_as==JSONL:
+				if isinstance(manifest,dict):
+					manifest=[manifest]
+				utils.save_jsonl(manifest,dest)
+			elif save_as==JSON:
 				utils.save_json(manifest,dest,indent=indent)
 			else:
 				utils.save_pickle(manifest,dest)
@@ -292,7 +476,9 @@ class EEImagesUp(object):
 			manifest=None,
 			wait=False,
 			noisy=True, 
-			raise_error=None):
+			raise_error=None,
+			monitor=None,
+			overwrite=False):
 		""" single upload
 
 		Note: if `wait=False` the upload will not wait for task to complete.
@@ -310,55 +496,77 @@ class EEImagesUp(object):
 				print progress during upload
 			raise_error<bool>:
 				raise_errors during upload
-
-		Sets:
-
-			self.task_id<str>: task id
-			self.task<dict>: task status
+			monitor<gutils.TaskMonitor|None>:
+				if `wait`, and a (running) monitor is provided, the task status is polled
+				by the monitor in batches with all other outstanding tasks
+			overwrite<bool>:
+				re-ingest the asset even if it exists (ignores `skip_existing` and `force`)
 
 		Returns:
 			
 			<dict> task status
 		"""
 		if not manifest:
-			manifest=self.manifest(
-				feat=feat,
-				uri=uri,
-				name=name,
-				tileset_id=tileset_id,
-				crs=crs,
-				properties=properties,
-				start_time=start_time,
-				end_time=end_time)
-		if self._check_existing(manifest):
+			with self.metrics.timer(umetrics.MANIFEST):
+				manifest=self.manifest(
+					feat=feat,
+					uri=uri,
+					name=name,
+					tileset_id=tileset_id,
+					crs=crs,
+					properties=properties,
+					start_time=start_time,
+					end_time=end_time)
+		with self.metrics.timer(umetrics.EXISTS):
+			exists=(not overwrite) and self._check_existing(manifest)
+		if exists:
 			resp={
 				'WARNING': f'Asset {manifest["name"]} exists. Upload Skipped',
 				'manifest': manifest }
 		else:
-			resp=ee.data.startIngestion(
-				ee.data.newTaskId()[0], 
-				manifest, 
-				self.force)
+			gutils.initialize()
+			with self.metrics.timer(umetrics.TASK_ID):
+				task_id=self._new_task_id()
+			resp=self._start_ingestion(task_id,manifest,overwrite)
 			task_id=resp['id']
 			if wait:
 				resp=gutils.wait(
 					task_id,
 					self.timeout,
 					noisy=noisy,
-					raise_error=raise_error)
+					raise_error=raise_error,
+					monitor=monitor,
+					polling=self.polling,
+					rate_limiter=self.rate_limiter,
+					metrics=self.metrics)
 				if resp and isinstance(resp,list):
 					resp=resp[0]
-			self.task_id=task_id
-			self.task=resp
 		return resp
 
 	
-	def upload_collection(self,features=None,limit=None,nb_batches=NB_BATCHES):
-		""" upload set of features in batches
+	def upload_collection(
+			self,
+			features=None,
+			limit=None,
+			nb_batches=NB_BATCHES,
+			max_in_flight=MAX_IN_FLIGHT,
+			manifests=None):
+		""" upload set of features
 
 		* This method will always wait for tasks to complete before returning.
 		* `nb_batches` should be understood as the max number of simultaneous 
 		  requests for ee-image-uploads	
+		* features are pulled from a shared queue: as soon as an upload completes
+		  the free worker starts the next pending feature
+		* task statuses are polled in batches by a single gutils.TaskMonitor
+		* pipelined mode (`max_in_flight`): `nb_batches` threads only submit
+		  ingestions while a single monitor thread polls every outstanding task.
+		  up to `max_in_flight` ingestions are kept running on the server, 
+		  independent of the number of local threads.
+		* per-phase timings and rpc counts are recorded in `self.metrics` 
+		  (see metrics.Metrics)
+		* live progress (counts, throughput and ETA) is reported periodically
+		  if `progress` is set (see progress.Progress)
 
 		Args:
 
@@ -368,22 +576,130 @@ class EEImagesUp(object):
 			limit<int|None>:
 				* limit features to first `limit`-elements
 			nb_batches:
-				divide uploads into `nb_batches` groups and upload them simultaneously
+				* max number of uploads to run simultaneously
+				* pipelined mode: number of submission threads
+			max_in_flight<int|None>:
+				if provided use pipelined mode with at most `max_in_flight` 
+				outstanding ingestion tasks
+			manifests<str|iterable|None>:
+				** if provided `features` is ignored **
+				precomputed upload manifests: a file saved with `manifest(dest=...)`
+				(see manifests.read_manifests) or an iterable of manifests.
+				the manifests are uploaded as is (features are not loaded).
 		
 		Sets:
 
-			self.tasks<list>: list of task status
+			self.tasks<list|results store>: results.UploadResult for each feature (in 
+				the order of features). a list unless `results_store` is set
 
 		"""
-		feats=features or self.features
-		if limit:
-			feats=feats[:limit]
-		total=len(feats)
-		bs=int(math.ceil(total/nb_batches))
-		nb_batches=int((total+bs-1)//bs)
-		batches=[feats[b*bs:(b + 1)*bs] for b in range(nb_batches)]  
-		tasks=mproc.map_with_threadpool(self._upload_batch,batches,max_processes=nb_batches)
-		self.tasks=_flatten(tasks)
+		feats=self._select_items(features,limit,manifests)
+		store=self._results_store()
+		progress=self._start_progress(feats)
+		try:
+			if max_in_flight:
+				self._upload_pipelined(feats,store,progress,nb_batches,max_in_flight)
+			else:
+				self._upload_threaded(feats,store,progress,nb_batches)
+		finally:
+			self.tasks=store.finalize()
+			self._flush()
+			if progress:
+				progress.stop()
+
+
+
+	async def upload_collection_async(
+			self,
+			features=None,
+			limit=None,
+			max_in_flight=NB_BATCHES,
+			nb_threads=NB_THREADS,
+			manifests=None):
+		""" asyncio version of `upload_collection`
+
+		* submission and status polling are driven from the running event loop.
+		  only the blocking `ee.data` requests are run in a thread pool
+		* at most `max_in_flight` ingestions are outstanding at any time 
+		* like `upload_collection`, waits for tasks to complete and sets `self.tasks`
+
+		Args:
+
+			features<list|None>:
+				* list of features or feature indices in self.features to upload
+				* if not provided upload all the features in self.features
+			limit<int|None>:
+				* limit features to first `limit`-elements
+			max_in_flight<int>:
+				max number of outstanding ingestion tasks
+			nb_threads<int>:
+				number of threads for blocking `ee.data` requests
+			manifests<str|iterable|None>:
+				precomputed upload manifests (see `upload_collection`)
+
+		Sets:
+
+			self.tasks<list|results store>: results.UploadResult for each feature 
+				(see `upload_collection`)
+
+		Returns:
+
+			self.tasks
+
+		Usage:
+
+			asyncio.run(up.upload_collection_async(max_in_flight=500))
+		"""
+		feats=self._select_items(features,limit,manifests)
+		store=self._results_store()
+		progress=self._start_progress(feats)
+		loop=asyncio.get_running_loop()
+		executor=ThreadPoolExecutor(max_workers=nb_threads)
+		monitor=gutils.AsyncTaskMonitor(
+			self.timeout,
+			polling=self.polling,
+			noisy=self.noisy,
+			rate_limiter=self.rate_limiter,
+			metrics=self.metrics,
+			on_state=progress and progress.on_state,
+			executor=executor).start()
+		async def _upload(index_feat):
+			index,feat=index_feat
+			submitted=time.time()
+			manifest,resp=await loop.run_in_executor(
+				executor,
+				partial(self._submit,feat))
+			if progress and ('id' in resp):
+				progress.submitted()
+			attempt=0
+			while True:
+				if 'id' in resp:
+					resp=await monitor.wait(resp['id'])
+				delay=self._retry_delay(manifest,resp,attempt)
+				if delay is None:
+					break
+				await asyncio.sleep(delay)
+				attempt+=1
+				resp=await loop.run_in_executor(
+					executor,
+					partial(self._resubmit,manifest,resp))
+			result=self._on_finished(manifest,resp,submitted)
+			self._add_result(store,progress,index,result)
+			self._check_error(result)
+		try:
+			await scheduler.map_with_queue_async(
+				_upload,
+				enumerate(feats),
+				nb_workers=max_in_flight,
+				collect=False)
+		finally:
+			await monitor.stop()
+			executor.shutdown(wait=False)
+			self.tasks=store.finalize()
+			self._flush()
+			if progress:
+				progress.stop()
+		return self.tasks
 
 
 
@@ -397,23 +713,119 @@ class EEImagesUp(object):
 		self.collection=collection
 
 			
-	def _set_features(self,features):
+	def _set_features(self,features,stream,index,drop_geometry):
 		if isinstance(features,str):
-			features=utils.read_json(features,'features')
+			if stream or index:
+				features=ufeatures.FeatureStream(
+					features,
+					drop_geometry=drop_geometry,
+					index=index)
+			else:
+				features=utils.read_json(features,'features')
 		elif isinstance(features,(dict)):
 			features=features['features']
+		if drop_geometry and isinstance(features,list):
+			for feat in features:
+				feat.pop(ufeatures.GEOMETRY,None)
 		self.features=features
 
 
-	def _set_existing(self,skip_existing):
+	def _select(self,features=None,limit=None):
+		""" features (or feature indices) to upload or build manifests for
+
+		streamed features are returned as an iterator so they are never fully 
+		loaded. indices into streamed features are resolved in a single pass 
+		(or read directly if the features are indexed).
+		"""
+		if (features is None) or (features is True) or (features==[]):
+			features=self.features
+		if isinstance(features,ufeatures.FeatureStream):
+			features=iter(features)
+			if limit:
+				features=islice(features,limit)
+		else:
+			if limit:
+				features=features[:limit]
+			if isinstance(self.features,ufeatures.FeatureStream):
+				indices=[f for f in features if isinstance(f,int)]
+				if indices:
+					selected=dict(zip(indices,self.features.select(indices)))
+					features=[selected[f] if isinstance(f,int) else f for f in features]
+		return features
+
+
+	def _select_items(self,features,limit,manifests):
+		""" features to upload or precomputed manifests (wrapped as _Manifest) """
+		if manifests is None:
+			items=self._select(features,limit)
+		else:
+			if isinstance(manifests,str):
+				manifests=umanifests.read_manifests(manifests)
+			if hasattr(manifests,'__len__'):
+				items=[_Manifest(m) for m in manifests[:limit]]
+			else:
+				if limit:
+					manifests=islice(manifests,limit)
+				items=(_Manifest(m) for m in manifests)
+		if self.shard:
+			items=self._shard_items(items,manifests is not None)
+		return items
+
+
+	def _shard_items(self,items,is_manifests):
+		""" items of self.shard (as _Manifest: the manifest is needed for the asset name) """
+		selected=items
+		if not is_manifests:
+			selected=(
+				_Manifest(m)
+				for m in self._manifests(items,True,None,umanifests.CHUNK_SIZE))
+		selected=(i for i in selected if ushard.in_shard(i.manifest['name'],self.shard))
+		if hasattr(items,'__len__'):
+			selected=list(selected)
+		return selected
+
+
+	def _set_existing(self,skip_existing,cache,cache_ttl,refresh):
 		self.skip_existing=skip_existing
-		if skip_existing:
-			self.existing_assets=gutils.assets(
+		self.asset_cache=None
+		self.refresh_assets=refresh
+		if skip_existing and cache:
+			self.asset_cache=asset_cache.AssetCache(
 				self.user,
 				collection=self.collection,
-				strip_prefix=False)
-		else:
-			self.existing_assets=False
+				directory=None if (cache is True) else cache,
+				ttl=cache_ttl,
+				metrics=self.metrics,
+				readonly=bool(self.shard))
+		self._existing_assets=None
+		self._existing_lock=threading.Lock()
+
+
+	@property
+	def existing_assets(self):
+		""" set of existing asset names (False if not `skip_existing`)
+
+		the assets are listed (or loaded from the cache) on first access
+		"""
+		if not self.skip_existing:
+			return False
+		if self._existing_assets is None:
+			with self._existing_lock:
+				if self._existing_assets is None:
+					self._existing_assets=self._load_existing()
+		return self._existing_assets
+
+
+	def _load_existing(self):
+		with self.metrics.timer(umetrics.LIST_ASSETS):
+			if self.asset_cache:
+				return self.asset_cache.load(refresh=self.refresh_assets)
+			else:
+				return set(gutils.iter_assets(
+					self.user,
+					collection=self.collection,
+					strip_prefix=False,
+					metrics=self.metrics))
 
 
 	def _feature(self,feat):
@@ -422,12 +834,313 @@ class EEImagesUp(object):
 		return feat
 
 
-	def _upload_batch(self,feats):
-		return [ self._upload_feat(f) for f in feats]
+	def _upload_feat(self,index,feat,monitor,store,progress):
+		submitted=time.time()
+		manifest,resp=self._submit(feat)
+		if progress and ('id' in resp):
+			progress.submitted()
+		attempt=0
+		while True:
+			if 'id' in resp:
+				resp=monitor.wait(resp['id'])
+			delay=self._retry_delay(manifest,resp,attempt)
+			if delay is None:
+				break
+			time.sleep(delay)
+			attempt+=1
+			resp=self._resubmit(manifest,resp)
+		result=self._on_finished(manifest,resp,submitted)
+		self._add_result(store,progress,index,result)
+		self._check_error(result)
+
+
+	def _new_task_id(self):
+		if self.task_ids:
+			return self.task_ids.get()
+		else:
+			return self.metrics.call(
+				umetrics.NEW_TASK_ID,
+				None,
+				ubackend.get_backend().new_task_id)[0]
+
+
+	def _start_ingestion(self,task_id,manifest,overwrite=False):
+		request=partial(
+			self.metrics.call,
+			umetrics.START_INGESTION,
+			umetrics.SUBMIT,
+			ubackend.get_backend().start_ingestion,
+			task_id,
+			manifest,
+			self.force or overwrite)
+		if self.rate_limiter:
+			request=partial(self.rate_limiter.call,urate_limit.SUBMIT,request)
+		if self.retry:
+			# same task id: a retried request can not start a second ingestion
+			return self.retry.call(request)
+		else:
+			return request()
+
+
+	def _update_asset(self,manifest):
+		""" update the metadata of an existing asset (no ingestion) """
+		asset,update_mask=udelta.update_request(manifest)
+		request=partial(
+			self.metrics.call,
+			umetrics.UPDATE_ASSET,
+			umetrics.UPDATE,
+			ubackend.get_backend().update_asset,
+			manifest['name'],
+			asset,
+			update_mask)
+		if self.rate_limiter:
+			request=partial(self.rate_limiter.call,urate_limit.SUBMIT,request)
+		if self.retry:
+			self.retry.call(request)
+		else:
+			request()
+		return { 'state': ujournal.UPDATED, 'name': manifest['name'] }
+
+
+	def _submit(self,feat):
+		""" build manifest and start (or resume) upload without waiting """
+		if isinstance(feat,_Manifest):
+			manifest=feat.manifest
+		else:
+			with self.metrics.timer(umetrics.MANIFEST):
+				manifest=self.manifest(feat)
+		if self.journal:
+			resp=self.journal.resume(manifest)
+			if resp:
+				return manifest, resp
+		overwrite=False
+		try:
+			if self.delta:
+				change=self.delta.change(manifest)
+				if change==udelta.UNCHANGED:
+					return manifest, {
+						'WARNING': f'Asset {manifest["name"]} unchanged. Upload Skipped',
+						'manifest': manifest }
+				elif (change==udelta.METADATA) or (
+						(change==udelta.NEW) and self._check_existing(manifest)):
+					try:
+						return manifest, self._update_asset(manifest)
+					except Exception as e:
+						if uretry.classify(e) in uretry.RETRYABLE:
+							raise
+					# the update was rejected (ex. the asset was deleted): re-ingest
+					overwrite=True
+				else:
+					overwrite=(change==udelta.SOURCE)
+			resp=self.upload(manifest=manifest,noisy=self.noisy,overwrite=overwrite)
+		except Exception as e:
+			if self.raise_error:
+				raise
+			return manifest, self._request_error(manifest,e)
+		if self.journal and ('id' in resp):
+			self.journal.submitted(manifest,resp['id'])
+		return manifest, resp
+
+
+	def _retry_delay(self,manifest,status,attempt):
+		""" seconds before retrying a finished upload (None: final status) """
+		if attempt:
+			status['retries']=attempt
+		if status.get(REQUEST_ERROR):
+			# the request was already retried (see retry.RetryPolicy.call)
+			return None
+		error_class=uretry.classify(status)
+		if error_class:
+			status['error_class']=error_class
+			status['retries']=attempt
+			if self.retry:
+				return self.retry.delay(error_class,attempt)
+
+
+	def _resubmit(self,manifest,status):
+		""" retry upload: wait again for timed out tasks, otherwise resubmit """
+		if status['error_class']==uretry.TIMEOUT:
+			return { 'id': status['id'] }
+		overwrite=bool(self.delta) and (self.delta.change(manifest)==udelta.SOURCE)
+		try:
+			resp=self.upload(manifest=manifest,noisy=self.noisy,overwrite=overwrite)
+		except Exception as e:
+			if self.raise_error:
+				raise
+			return self._request_error(manifest,e,status.get('retries',0))
+		if self.journal and ('id' in resp):
+			self.journal.submitted(manifest,resp['id'])
+		return resp
 
 
-	def _upload_feat(self,feat):
-		return self.upload(feat,wait=True,noisy=self.noisy,raise_error=self.raise_error) 
+	def _request_error(self,manifest,error,retries=0):
+		""" final (FAILED) status of an upload whose request raised `error` """
+		return {
+			'state': gutils.FAILED,
+			'name': manifest['name'],
+			'error_class': uretry.classify(error),
+			'error_message': str(error),
+			'retries': retries,
+			REQUEST_ERROR: True }
+
+
+	def _on_finished(self,manifest,status,submitted=None):
+		""" record the final status and return the upload result """
+		self.metrics.record_status(status)
+		try:
+			if status.get('state')==gutils.COMPLETED:
+				if self.asset_cache:
+					self.asset_cache.add(manifest['name'])
+				elif self.skip_existing:
+					self.existing_assets.add(manifest['name'])
+			if self.delta and (status.get('state') in [gutils.COMPLETED,ujournal.UPDATED]):
+				self.delta.record(manifest)
+			if self.journal:
+				self.journal.finished(manifest,status)
+		except Exception as e:
+			if self.raise_error:
+				raise
+			# the upload result keeps the error: the engines never lose an upload
+			status=dict(
+				status,
+				error_class=uretry.classify(e),
+				error_message=ERROR_RECORD.format(e))
+		return uresults.UploadResult.from_status(manifest,status,submitted=submitted)
+
+
+	def _add_result(self,store,progress,index,result):
+		store.add(index,result)
+		if progress:
+			progress.finished(result)
+
+
+	def _results_store(self):
+		# a new run replaces self.tasks: close the sqlite connection of the last run
+		last=getattr(self,'tasks',None)
+		if hasattr(last,'close'):
+			last.close()
+		return uresults.results_store(self.results_store)
+
+
+	def _start_progress(self,feats):
+		total=len(feats) if hasattr(feats,'__len__') else None
+		progress=uprogress.progress_reporter(self.progress,total,noisy=self.noisy)
+		if progress:
+			progress.start()
+		return progress
+
+
+	def _check_error(self,result):
+		if self.raise_error and result.failed and result.error_message:
+			raise ee.ee_exception.EEException(f'Error: {result.error_message}')
+		return result
+
+
+	def _flush(self):
+		if self.asset_cache:
+			self.asset_cache.flush()
+		if self.journal:
+			self.journal.close()
+		if self.delta:
+			self.delta.close()
+
+
+	def _upload_threaded(self,feats,store,progress,nb_workers):
+		monitor=gutils.TaskMonitor(
+			self.timeout,
+			polling=self.polling,
+			noisy=self.noisy,
+			rate_limiter=self.rate_limiter,
+			metrics=self.metrics,
+			on_state=progress and progress.on_state).start()
+		try:
+			scheduler.map_with_queue(
+				lambda index_feat: self._upload_feat(*index_feat,monitor,store,progress),
+				enumerate(feats),
+				nb_workers=nb_workers,
+				collect=False)
+		finally:
+			monitor.stop()
+
+
+	def _upload_pipelined(self,feats,store,progress,nb_workers,max_in_flight):
+		submitted={}
+		errors=[]
+		slots=threading.BoundedSemaphore(max_in_flight)
+		monitor=gutils.TaskMonitor(
+			self.timeout,
+			polling=self.polling,
+			noisy=self.noisy,
+			rate_limiter=self.rate_limiter,
+			metrics=self.metrics,
+			on_state=progress and progress.on_state).start()
+		def _add(index,manifest,resp,attempt):
+			if 'id' in resp:
+				monitor.add(
+					resp['id'],
+					lambda status: _on_finished(index,manifest,status,attempt))
+			else:
+				_on_finished(index,manifest,resp,attempt)
+		def _on_finished(index,manifest,status,attempt):
+			delay=self._retry_delay(manifest,status,attempt)
+			if (delay is None) or errors:
+				_finish(index,manifest,status)
+			else:
+				# resubmit from a timer: the monitor thread is never blocked
+				timer=threading.Timer(delay,_retry,(index,manifest,status,attempt+1))
+				timer.daemon=True
+				timer.start()
+		def _retry(index,manifest,status,attempt):
+			if errors:
+				return _finish(index,manifest,status)
+			try:
+				resp=self._resubmit(manifest,status)
+			except Exception as e:
+				status['error_message']=str(e)
+				status['error_class']=uretry.classify(e)
+				return _finish(index,manifest,status)
+			_add(index,manifest,resp,attempt)
+		def _finish(index,manifest,status):
+			# runs on the monitor thread: nothing escapes and the slot is always released
+			try:
+				result=self._on_finished(manifest,status,submitted.pop(index,None))
+				self._add_result(store,progress,index,result)
+				if not errors:
+					self._check_error(result)
+			except Exception as e:
+				errors.append(e)
+			finally:
+				slots.release()
+		def _submit(index_feat):
+			index,feat=index_feat
+			slots.acquire()
+			if errors:
+				slots.release()
+				raise errors[0]
+			submitted[index]=time.time()
+			try:
+				manifest,resp=self._submit(feat)
+			except Exception:
+				slots.release()
+				raise
+			if progress and ('id' in resp):
+				progress.submitted()
+			_add(index,manifest,resp,0)
+		try:
+			scheduler.map_with_queue(
+				_submit,
+				enumerate(feats),
+				nb_workers=nb_workers)
+			# wait for every upload (and retry) to finish
+			for _ in range(max_in_flight):
+				slots.acquire()
+		except BaseException as e:
+			errors.append(e)
+			raise
+		finally:
+			monitor.stop()
+		if errors:
+			raise errors[0]
 
 
 	def _uri(self,uri):
@@ -552,6 +1265,20 @@ class EEImagesUp(object):
 		return data
 	
 
+	def _manifests(self,features,bulk,nb_processes,chunk_size,**manifest_kwargs):
+		if nb_processes:
+			return umanifests.parallel_manifests(
+				self,
+				features,
+				nb_processes=nb_processes,
+				chunk_size=chunk_size,
+				**manifest_kwargs)
+		elif bulk:
+			return umanifests.BulkManifests(self).manifests(features,**manifest_kwargs)
+		else:
+			return (self._feature_manifest(feat=f,**manifest_kwargs) for f in features)
+
+
 	def _feature_manifest(
 			self,
 			feat={},
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from . import gee_utils as gutils
+from . import utils
+#
+# CONSTANTS
+#
+SUBMITTED='SUBMITTED'
+SKIPPED='SKIPPED'
+UPDATED='UPDATED'
+TIMEOUT='TIMEOUT'
+DONE_STATES=[
+    gutils.COMPLETED,
+    UPDATED,
+    SKIPPED ]
+PENDING_STATES=[
+    SUBMITTED,
+    TIMEOUT ]
+
+
+
+#
+# HELPERS
+#
+def manifest_hash(manifest):
+    """ stable hash of an upload manifest """
+    jsn=json.dumps(manifest,sort_keys=True,separators=(',',':'),default=str)
+    return hashlib.sha1(jsn.encode('utf-8')).hexdigest()
+
+
+def status_state(status):
+    """ journal state for a (final) task status or upload response """
+    if 'TIMEOUT' in status:
+        return TIMEOUT
+    elif 'WARNING' in status:
+        return SKIPPED
+    else:
+        return status.get('state')
+
+
+
+#
+# MAIN
+#
+class JsonlLog(object):
+    """ append-only (jsonl) file of records keyed by asset name
+
+    On load the last record for each name wins (see `records`). A partial
+    line from an interrupted write is skipped on load, and terminated before
+    the next record is appended.
+
+    Args:
+        path<str>: path to jsonl file. created on first write if it does not exist
+        fsync<bool>: if true fsync after every record (slower, survives machine loss)
+    """
+    def __init__(self,path,fsync=False):
+        self.path=path
+        self.fsync=fsync
+        self.records={}
+        self._file=None
+        self._lock=threading.Lock()
+        self._read()
+
+
+    def append(self,record):
+        """ append record and make it the last record for its name """
+        line=json.dumps(record)
+        with self._lock:
+            self.records[record['name']]=record
+            if not self._file:
+                self._open()
+            self._file.write(f'{line}\n')
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file=None
+
+
+    #
+    # INTERNAL
+    #
+    def _open(self):
+        utils.ensure_dir(self.path)
+        partial=False
+        if os.path.isfile(self.path) and os.path.getsize(self.path):
+            with open(self.path,'rb') as file:
+                file.seek(-1,os.SEEK_END)
+                partial=(file.read(1)!=b'\n')
+        self._file=open(self.path,'a')
+        if partial:
+            # terminate a partial line from an interrupted write
+            self._file.write('\n')
+
+
+    def _read(self):
+        if os.path.isfile(self.path):
+            with open(self.path,'r') as file:
+                for line in file:
+                    try:
+                        record=json.loads(line)
+                    except ValueError:
+                        # partial line from an interrupted write
+                        continue
+                    self.records[record['name']]=record
+
+
+class Journal(JsonlLog):
+    """ append-only (jsonl) journal of an upload run
+
+    One record is appended each time an upload changes state:
+
+        {"name": <asset-name>, "hash": <manifest-hash>, "task_id": <task-id>,
+         "state": <SUBMITTED|COMPLETED|FAILED|CANCELLED|TIMEOUT|SKIPPED|UPDATED>,
+         "time": <unix-time>, "error": <error-message>}
+
+    On load the last record for each asset name wins. `resume` uses it to
+    skip completed uploads, re-attach to tasks that were still in flight
+    (SUBMITTED or TIMEOUT) instead of resubmitting them, and retry only failed
+    or cancelled uploads. A record only applies if the manifest is unchanged
+    (same hash).
+
+    Args:
+        path<str>: path to journal file. created on first write if it does not exist
+        fsync<bool>: if true fsync after every record (slower, survives machine loss)
+    """
+    def resume(self,manifest):
+        """ resume action for manifest
+
+        Returns<dict|None>:
+            * None: (re)submit the upload
+            * {'id': <task-id>}: re-attach to the task
+            * skip-response: upload was already completed or skipped
+        """
+        record=self.records.get(manifest['name'])
+        if (not record) or (record.get('hash')!=manifest_hash(manifest)):
+            return None
+        state=record['state']
+        if state in DONE_STATES:
+            return {
+                'WARNING': f'Asset {manifest["name"]} {state} in journal. Upload Skipped',
+                'manifest': manifest }
+        elif (state in PENDING_STATES) and record.get('task_id'):
+            return { 'id': record['task_id'] }
+
+
+    def submitted(self,manifest,task_id):
+        self.write(manifest,SUBMITTED,task_id=task_id)
+
+
+    def finished(self,manifest,status):
+        state=status_state(status)
+        record=self.records.get(manifest['name'],{})
+        if (state==SKIPPED) and (record.get('state') in DONE_STATES):
+            # skipped on resume: keep the original record
+            return
+        self.write(
+            manifest,
+            state,
+            task_id=status.get('id'),
+            error=status.get('error_message'))
+
+
+    def write(self,manifest,state,task_id=None,error=None):
+        name=manifest['name']
+        record={
+            'name': name,
+            'hash': manifest_hash(manifest),
+            'task_id': task_id or self.records.get(name,{}).get('task_id'),
+            'state': state,
+            'time': time.time() }
+        if error:
+            record['error']=error
+        self.append(record)
+
+
+    def states(self):
+        """ number of records by state """
+        counts={}
+        for record in self.records.values():
+            counts[record['state']]=counts.get(record['state'],0)+1
+        return counts
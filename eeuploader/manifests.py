@@ -0,0 +1,384 @@
+import os
+import re
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from unidecode import unidecode
+from . import gee_utils as gutils
+from . import utils
+#
+# CONFIG
+#
+BATCH_SIZE=10000
+CHUNK_SIZE=1000
+# max entries of the (lru) caches of unidecoded values and parsed times
+MEMO_SIZE=2**16
+#
+# CONSTANTS
+#
+GCS_PREFIX='gs://'
+GCS_URL_ROOT_REGX=re.compile(r'^(https|http)://storage.(googleapis|cloud.google).com/')
+MAX_TILESET_ID_LENGTH=99
+JSONL_EXTS=('.jsonl','.jsonl.gz')
+JSON_EXT='.json'
+MANIFEST_ATTRS=[
+    'user',
+    'collection',
+    'bands',
+    'band_names',
+    'pyramiding_policy',
+    'no_data',
+    'include',
+    'exclude',
+    'start_time_key',
+    'end_time_key',
+    'days_delta',
+    'crs_key',
+    'uri_key',
+    'name_key' ]
+
+
+
+#
+# METHODS
+#
+def read_manifests(path):
+    """ stream upload manifests from a file saved with `EEImagesUp.manifest(dest=...)`
+
+    * jsonl (.jsonl or gzipped .jsonl.gz): read one manifest at a time
+    * json (.json): a list of manifests or a single manifest
+    * otherwise: pickle (a list of manifests or a single manifest)
+
+    Args:
+        path<str>: path to manifest file
+
+    Yields<dict>: upload manifest
+    """
+    if path.endswith(JSONL_EXTS):
+        yield from utils.read_jsonl(path)
+    else:
+        if path.endswith(JSON_EXT):
+            manifests=utils.read_json(path)
+        else:
+            manifests=utils.read_pickle(path)
+        if isinstance(manifests,dict):
+            manifests=[manifests]
+        yield from manifests
+
+
+def parallel_manifests(
+        up,
+        features,
+        nb_processes=None,
+        chunk_size=CHUNK_SIZE,
+        as_jsonl=False,
+        **manifest_kwargs):
+    """ generator of upload manifests built in a pool of processes
+
+    The features are split into chunks of `chunk_size` features which are
+    built into manifests (with BulkManifests) by `nb_processes` worker 
+    processes. Only the feature properties are sent to the workers. Chunks 
+    are submitted ahead of the results (at most 2 per process) and the 
+    manifests are yielded in the order of features as they arrive, so
+    features and manifests are never all held in memory.
+
+    Receiving manifest dicts from the workers means unpickling every one of 
+    them in the parent process, a serial cost that caps the speedup. With 
+    `as_jsonl` the workers serialize their chunk to json-lines text and the 
+    parent only passes the text on (see `save_jsonl_text`).
+
+    Args:
+        up<EEImagesUp>: uploader providing the manifest configuration
+        features<iterable>: features or feature-indices
+        nb_processes<int|None>: number of worker processes. defaults to cpu count
+        chunk_size<int>: number of features per chunk
+        as_jsonl<bool>: if true yield one json-lines string per chunk
+        **manifest_kwargs: uri/.../start_time/end_time (see EEImagesUp.manifest)
+
+    Yields<dict|str>: upload manifest (or json-lines text of a chunk of manifests)
+    """
+    nb_processes=nb_processes or os.cpu_count() or 1
+    worker=_worker_jsonl if as_jsonl else _worker_manifests
+    executor=ProcessPoolExecutor(
+        nb_processes,
+        initializer=_init_worker,
+        initargs=(_manifest_uploader(up),chunk_size,manifest_kwargs))
+    with executor:
+        pending=deque()
+        for chunk in _chunks(up,features,chunk_size):
+            pending.append(executor.submit(worker,chunk))
+            if len(pending)>=2*nb_processes:
+                yield from _chunk_result(pending.popleft(),as_jsonl)
+        while pending:
+            yield from _chunk_result(pending.popleft(),as_jsonl)
+
+
+def save_jsonl_text(chunks,path,mkdirs=True):
+    """ save json-lines text chunks (see `parallel_manifests(as_jsonl=True)`)
+
+    The file is identical to `utils.save_jsonl` of the manifests.
+
+    Returns<int>: number of manifests written
+    """
+    if mkdirs:
+        utils.ensure_dir(path)
+    count=0
+    with utils.open_file(path,'w') as file:
+        for chunk in chunks:
+            file.write(chunk)
+            count+=chunk.count('\n')
+    return count
+
+
+def save_json_text(chunks,path,mkdirs=True):
+    """ save json-lines text chunks as a json list
+
+    The file is identical to `utils.save_json(manifests,path,indent=None)`.
+
+    Returns<int>: number of manifests written
+    """
+    if mkdirs:
+        utils.ensure_dir(path)
+    count=0
+    with open(path,'w') as file:
+        file.write('[')
+        for chunk in chunks:
+            lines=chunk.rstrip('\n').split('\n')
+            if count:
+                file.write(', ')
+            file.write(', '.join(lines))
+            count+=len(lines)
+        file.write(']')
+    return count
+
+
+
+#
+# MAIN
+#
+class BulkManifests(object):
+    """ bulk manifest builder for an EEImagesUp instance
+
+    Produces the same manifests as `EEImagesUp._feature_manifest` but for many
+    features at once. Features are processed in batches, one column (uris,
+    names, properties, times, ...) at a time, with:
+
+    * the destination prefix, compiled url pattern and band template computed once
+    * memoized property-key cleaning
+    * unidecode of non-ascii string property values and start/end time parsing
+      cached in bounded (MEMO_SIZE) lru caches: memory does not grow with the
+      number of features
+
+    The manifests are equal to (and json-serialize identically to) the
+    per-feature manifests.
+
+    Args:
+        up<EEImagesUp>: uploader providing the manifest configuration
+        batch_size<int>: number of features per batch
+
+    Usage:
+
+        manifests=BulkManifests(up).manifests(up.features)
+        for manifest in manifests:
+            ...
+    """
+    def __init__(self,up,batch_size=BATCH_SIZE):
+        self.up=up
+        self.batch_size=batch_size
+        self.parent=gutils.asset_id(
+            up.user,
+            collection=up.collection,
+            prefix=True,
+            safe=True)
+        if (not up.bands) and up.band_names:
+            self.band_template=list(enumerate(up.band_names))
+        else:
+            self.band_template=None
+        self._keys=_Memo(lambda k: re.sub(' ','',k))
+        self._unidecode=lru_cache(maxsize=MEMO_SIZE)(_unidecode)
+        self._times=lru_cache(maxsize=MEMO_SIZE)(up._start_end_time)
+
+
+    def manifests(
+            self,
+            features,
+            uri=None,
+            name=None,
+            tileset_id=None,
+            crs=None,
+            properties={},
+            start_time=None,
+            end_time=None):
+        """ generator of upload manifests
+
+        Args:
+            features<iterable>: features or feature-indices
+            **uri/.../start_time/end_time (see EEImagesUp.manifest doc-string)**
+
+        Yields<dict>: upload manifest
+        """
+        features=iter(features)
+        while True:
+            batch=list(islice(features,self.batch_size))
+            if not batch:
+                break
+            yield from self._batch(
+                batch,
+                uri,
+                name,
+                tileset_id,
+                crs,
+                properties,
+                start_time,
+                end_time)
+
+
+    #
+    # INTERNAL
+    #
+    def _batch(self,feats,uri,name,tileset_id,crs,properties,start_time,end_time):
+        up=self.up
+        feats=[up._feature(f) for f in feats]
+        fprops=[f.get('properties',{}) for f in feats]
+        uris=[self._uri(uri or p[up.uri_key]) for p in fprops]
+        names=[
+            self._name(u,name or p.get(up.name_key))
+            for u,p in zip(uris,fprops) ]
+        tileset_ids=[
+            tileset_id or n.split('/')[-1][:MAX_TILESET_ID_LENGTH]
+            for n in names ]
+        crss=[crs or p.get(up.crs_key) for p in fprops]
+        tilesets=[self._tilesets(*args) for args in zip(uris,crss,tileset_ids)]
+        bands=[self._bands(t) for t in tileset_ids]
+        cprops=[self._properties(p,properties) for p in fprops]
+        times=[
+            self._start_end_time(
+                start_time or p.get(up.start_time_key),
+                end_time or p.get(up.end_time_key))
+            for p in fprops ]
+        return [
+            up._build_manifest(n,t,p,b,*ts)
+            for n,t,p,b,ts in zip(names,tilesets,cprops,bands,times) ]
+
+
+    def _uri(self,uri):
+        uri=GCS_URL_ROOT_REGX.sub('',uri)
+        if not uri.startswith(GCS_PREFIX):
+            uri=f'{GCS_PREFIX}{uri}'
+        return uri
+
+
+    def _name(self,uri,name):
+        if not name:
+            name=self.up._uri_to_name(uri)
+        if name:
+            return f'{self.parent}/{name.replace(".",gutils.DOT)}'
+        else:
+            return self.parent
+
+
+    def _tilesets(self,uri,crs,tileset_id):
+        tset={
+            "id": tileset_id,
+            "sources": [{ "uris": uri }]}
+        if crs:
+            tset['crs']=crs
+        return [tset]
+
+
+    def _bands(self,tileset_id):
+        if self.up.bands:
+            return self.up.bands
+        elif self.band_template:
+            return [
+                { 'id': n, 'tileset_id': tileset_id, 'tileset_band_index': i }
+                for i,n in self.band_template ]
+
+
+    def _properties(self,feat_props,props):
+        cprops=feat_props.copy()
+        cprops.update(props)
+        if self.up.include:
+            cprops={ k:cprops[k] for k in self.up.include }
+        elif self.up.exclude:
+            for k in self.up.exclude:
+                cprops.pop(k,None)
+        keys,unidecode_=self._keys,self._unidecode
+        return {
+            keys[k]: (v if v.isascii() else unidecode_(v)) if isinstance(v,str) else str(v)
+            for k,v in cprops.items() }
+
+
+    def _start_end_time(self,start_time,end_time):
+        try:
+            hash((start_time,end_time))
+        except TypeError:
+            # unhashable inputs
+            return self.up._start_end_time(start_time,end_time)
+        start_time,end_time=self._times(start_time,end_time)
+        return (start_time and dict(start_time)), (end_time and dict(end_time))
+
+
+
+#
+# INTERNAL
+#
+class _Memo(dict):
+    """ dict that computes (and stores) missing values with func(key) """
+    def __init__(self,func):
+        super().__init__()
+        self.func=func
+
+
+    def __missing__(self,key):
+        value=self[key]=self.func(key)
+        return value
+
+
+def _unidecode(value):
+    return str(unidecode(value))
+
+
+_WORKER=None
+def _init_worker(up,chunk_size,manifest_kwargs):
+    global _WORKER
+    _WORKER=(BulkManifests(up,batch_size=chunk_size),manifest_kwargs)
+
+
+def _worker_manifests(chunk):
+    bulk,manifest_kwargs=_WORKER
+    return list(bulk.manifests(chunk,**manifest_kwargs))
+
+
+def _worker_jsonl(chunk):
+    # a single string is much cheaper to send back than the manifest dicts
+    bulk,manifest_kwargs=_WORKER
+    return ''.join(f'{json.dumps(m)}\n' for m in bulk.manifests(chunk,**manifest_kwargs))
+
+
+def _chunk_result(future,as_jsonl):
+    result=future.result()
+    if as_jsonl:
+        return [result] if result else []
+    return result
+
+
+def _manifest_uploader(up):
+    """ picklable copy of `up` with only the manifest configuration """
+    mup=object.__new__(type(up))
+    mup.__dict__.update({ k: getattr(up,k) for k in MANIFEST_ATTRS })
+    mup.features=None
+    return mup
+
+
+def _chunks(up,features,chunk_size):
+    features=iter(features)
+    while True:
+        chunk=[
+            { 'properties': up._feature(f).get('properties',{}) }
+            for f in islice(features,chunk_size) ]
+        if not chunk:
+            break
+        yield chunk
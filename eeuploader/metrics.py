@@ -0,0 +1,187 @@
+import csv
+import time
+import threading
+from array import array
+from contextlib import contextmanager
+from . import utils
+#
+# CONFIG
+#
+PERCENTILES=[50,90,99]
+#
+# CONSTANTS
+#
+# phases (seconds)
+LIST_ASSETS='list_assets'
+MANIFEST='manifest'
+EXISTS='exists_check'
+TASK_ID='task_id'
+SUBMIT='submit'
+UPDATE='update'
+QUEUE='queue'
+RUN='run'
+POLL='poll'
+PHASES=[
+    LIST_ASSETS,
+    MANIFEST,
+    EXISTS,
+    TASK_ID,
+    SUBMIT,
+    UPDATE,
+    QUEUE,
+    RUN,
+    POLL ]
+# rpc endpoints (ee.data)
+NEW_TASK_ID='newTaskId'
+START_INGESTION='startIngestion'
+UPDATE_ASSET='updateAsset'
+GET_TASK_STATUS='getTaskStatus'
+LIST_ASSETS_RPC='listAssets'
+SUMMARY_FIELDS=['count','total','mean']+[f'p{p}' for p in PERCENTILES]+['max']
+JSON_EXT='.json'
+
+
+
+#
+# MAIN
+#
+class Metrics(object):
+    """ per-phase upload timings and rpc counts
+
+    Thread-safe, low-overhead instrumentation for the upload hot path: each
+    sample is a float appended to a per-phase array. Phases (seconds):
+
+        * list_assets: listing the existing assets (once per run)
+        * manifest: building an upload manifest
+        * exists_check: checking whether the asset exists
+        * task_id: getting a task id (from the TaskIdPool or a request)
+        * submit: startIngestion request latency
+        * update: updateAsset request latency (delta uploads)
+        * queue: server queue time of the task (created to running)
+        * run: server run time of the task (running to final state)
+        * poll: getTaskStatus call latency (polling overhead, per chunk of task ids)
+
+    RPCs are counted per ee.data endpoint (newTaskId, startIngestion, ...),
+    including retried requests.
+
+    Usage:
+
+        metrics=Metrics()
+        with metrics.timer(MANIFEST):
+            manifest=...
+        resp=metrics.call(START_INGESTION,SUBMIT,ee.data.startIngestion,task_id,manifest)
+        pprint(metrics.summary())
+        metrics.save('metrics.csv')
+    """
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        """ drop every sample and rpc count """
+        self.samples={ p: array('d') for p in PHASES }
+        self.rpcs={}
+        self._lock=threading.Lock()
+
+
+    def record(self,phase,seconds):
+        """ add a sample to phase """
+        with self._lock:
+            self.samples[phase].append(seconds)
+
+
+    @contextmanager
+    def timer(self,phase):
+        """ time the block as a sample of phase """
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase,time.perf_counter()-start)
+
+
+    def rpc(self,endpoint,count=1):
+        """ count `count` requests to endpoint """
+        with self._lock:
+            self.rpcs[endpoint]=self.rpcs.get(endpoint,0)+count
+
+
+    def call(self,endpoint,phase,func,*args,**kwargs):
+        """ counted (and timed if phase) request `func(*args,**kwargs)` """
+        self.rpc(endpoint)
+        if phase:
+            with self.timer(phase):
+                return func(*args,**kwargs)
+        else:
+            return func(*args,**kwargs)
+
+
+    def record_status(self,status):
+        """ record the server queue and run time of a final task status """
+        created=status.get('creation_timestamp_ms')
+        started=status.get('start_timestamp_ms')
+        updated=status.get('update_timestamp_ms')
+        if created and started:
+            self.record(QUEUE,(int(started)-int(created))/1000)
+        if started and updated:
+            self.record(RUN,(int(updated)-int(started))/1000)
+
+
+    def summary(self):
+        """ count, total, mean, percentiles and max (seconds) of each phase with samples
+
+        Returns<dict>: { phase: { count, total, mean, p50, p90, p99, max } }
+        """
+        with self._lock:
+            samples={ p: sorted(s) for p,s in self.samples.items() if s }
+        return { p: _summary(s) for p,s in samples.items() }
+
+
+    def as_dict(self):
+        return {
+            'phases': self.summary(),
+            'rpcs': dict(self.rpcs) }
+
+
+    def save(self,path):
+        """ save the summary and rpc counts
+
+        Args:
+            path<str>: .json file (see `as_dict`) or csv file with one row per
+                phase (SUMMARY_FIELDS) followed by one row per rpc endpoint
+                (`rpc:<endpoint>`, count)
+        """
+        if path.endswith(JSON_EXT):
+            utils.save_json(self.as_dict(),path)
+        else:
+            utils.ensure_dir(path)
+            with open(path,'w',newline='') as file:
+                writer=csv.writer(file)
+                writer.writerow(['phase']+SUMMARY_FIELDS)
+                for phase,summary in self.summary().items():
+                    writer.writerow([phase]+[summary[f] for f in SUMMARY_FIELDS])
+                for endpoint,count in sorted(self.rpcs.items()):
+                    writer.writerow([f'rpc:{endpoint}',count])
+        return path
+
+
+
+#
+# INTERNAL
+#
+def _summary(samples):
+    total=sum(samples)
+    summary={
+        'count': len(samples),
+        'total': total,
+        'mean': total/len(samples) }
+    for p in PERCENTILES:
+        summary[f'p{p}']=_percentile(samples,p)
+    summary['max']=samples[-1]
+    return summary
+
+
+def _percentile(samples,p):
+    # nearest-rank percentile of sorted samples
+    index=max(0,-(-len(samples)*p//100)-1)
+    return samples[index]
@@ -0,0 +1,233 @@
+import os
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from . import utils
+#
+# CONFIG
+#
+INTERVAL=30
+WINDOW=10*60
+#
+# CONSTANTS
+#
+RUNNING='RUNNING'
+COMPLETED='COMPLETED'
+SKIPPED='SKIPPED'
+UPDATED='UPDATED'
+TS_FMT='%Y-%m-%dT%H:%M:%S'
+
+
+
+#
+# HELPERS
+#
+def progress_reporter(progress=None,total=None,noisy=False):
+    """ Progress from `progress`
+
+    Args:
+        progress<Progress|dict|str|bool|None>:
+            * None or False: None (no progress reporting)
+            * True: print progress every INTERVAL seconds
+            * str: path to the snapshot file (json) rewritten every INTERVAL seconds
+            * dict: Progress kwargs (path, interval, window, noisy)
+            * Progress: returned as is
+        total<int|None>: number of uploads (if known)
+        noisy<bool>: default for printing progress lines (True if progress is True)
+    """
+    if isinstance(progress,Progress):
+        if total is not None:
+            progress.total=total
+        return progress
+    elif isinstance(progress,dict):
+        kwargs=dict(progress)
+        kwargs.setdefault('noisy',noisy)
+        return Progress(total=total,**kwargs)
+    elif progress is True:
+        return Progress(total=total,noisy=True)
+    elif progress:
+        return Progress(total=total,path=progress,noisy=noisy)
+
+
+
+#
+# MAIN
+#
+class Progress(object):
+    """ live upload progress and throughput
+
+    Fed by the upload engines: `submitted` once per upload, `on_state` on task
+    state changes (see gutils.TaskMonitor) and `finished` with the result of
+    each upload. Every event is a counter update (under a lock), so the
+    overhead is negligible even with thousands of outstanding tasks.
+
+    Every `interval` seconds a background thread takes a `snapshot` (counts,
+    images per minute over the last `window` seconds and estimated completion),
+    prints it (if `noisy`) and rewrites the snapshot file (if `path`).
+
+    Args:
+        total<int|None>: number of uploads. if None no ETA is given
+        path<str|None>: snapshot file (json) for external monitoring
+        interval<float>: seconds between reports
+        window<float>: seconds of the sliding throughput window
+        noisy<bool>: print a progress line every report
+
+    Usage:
+
+        progress=Progress(total=len(features),path='progress.json').start()
+        ...
+        progress.stop()
+    """
+    def __init__(self,total=None,path=None,interval=INTERVAL,window=WINDOW,noisy=True):
+        self.total=total
+        self.path=path
+        self.interval=interval
+        self.window=window
+        self.noisy=noisy
+        self.start_time=None
+        self.nb_submitted=0
+        self.states={}
+        self._running=set()
+        self._finished=deque()
+        self._lock=threading.Lock()
+        self._stop=threading.Event()
+        self._thread=None
+
+
+    def start(self):
+        self.start_time=time.time()
+        self._stop.clear()
+        self._thread=threading.Thread(target=self._run,daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        """ stop reporting (after a final report) """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread=None
+        self._report()
+
+
+    def submitted(self):
+        with self._lock:
+            self.nb_submitted+=1
+
+
+    def on_state(self,task_id,state):
+        with self._lock:
+            if state==RUNNING:
+                self._running.add(task_id)
+            else:
+                self._running.discard(task_id)
+
+
+    def finished(self,result):
+        now=time.time()
+        with self._lock:
+            self._running.discard(result.task_id)
+            self.states[result.state]=self.states.get(result.state,0)+1
+            self._finished.append(now)
+            self._prune(now)
+
+
+    def snapshot(self):
+        """ current progress
+
+        Returns<dict>:
+            timestamp, elapsed (seconds), total, submitted, running, finished,
+            completed, failed (neither completed nor skipped), states (finished
+            uploads by state), per_minute (finished uploads per minute over the
+            sliding window), eta_seconds and eta (None if unknown)
+        """
+        now=time.time()
+        with self._lock:
+            self._prune(now)
+            nb_recent=len(self._finished)
+            states=dict(self.states)
+            running=len(self._running)
+            submitted=self.nb_submitted
+        finished=sum(states.values())
+        elapsed=now-(self.start_time or now)
+        span=min(self.window,elapsed)
+        per_minute=60*nb_recent/span if span>0 else 0
+        eta_seconds=None
+        if self.total is not None:
+            remaining=max(self.total-finished,0)
+            if not remaining:
+                eta_seconds=0
+            elif per_minute:
+                eta_seconds=60*remaining/per_minute
+        return {
+            'timestamp': datetime.fromtimestamp(now).strftime(TS_FMT),
+            'elapsed': elapsed,
+            'total': self.total,
+            'submitted': submitted,
+            'running': running,
+            'finished': finished,
+            'completed': states.get(COMPLETED,0),
+            'failed': finished-sum(states.get(s,0) for s in [COMPLETED,SKIPPED,UPDATED]),
+            'states': states,
+            'per_minute': per_minute,
+            'eta_seconds': eta_seconds,
+            'eta': _eta(now,eta_seconds) }
+
+
+    def report(self):
+        """ print (if noisy) and save (if path) a snapshot """
+        snapshot=self.snapshot()
+        if self.noisy:
+            print(_line(snapshot))
+        if self.path:
+            # write then rename: readers never see a partial file
+            tmp=f'{self.path}.{os.getpid()}.tmp'
+            utils.save_json(snapshot,tmp)
+            os.replace(tmp,self.path)
+        return snapshot
+
+
+    #
+    # INTERNAL
+    #
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._report()
+
+
+    def _report(self):
+        # progress reporting never interrupts the upload
+        try:
+            self.report()
+        except Exception as e:
+            if self.noisy:
+                print('Progress: report failed (%s)' % e)
+
+
+    def _prune(self,now):
+        while self._finished and (self._finished[0]<now-self.window):
+            self._finished.popleft()
+
+
+
+#
+# INTERNAL
+#
+def _eta(now,eta_seconds):
+    if eta_seconds is not None:
+        return datetime.fromtimestamp(now+eta_seconds).strftime(TS_FMT)
+
+
+def _line(snapshot):
+    total=snapshot['total']
+    done=f'{snapshot["finished"]}/{total}' if total is not None else f'{snapshot["finished"]}'
+    line=(
+        f'[progress] {done} finished | submitted: {snapshot["submitted"]} '
+        f'running: {snapshot["running"]} completed: {snapshot["completed"]} '
+        f'failed: {snapshot["failed"]} | {snapshot["per_minute"]:.1f} images/min')
+    if snapshot['eta_seconds'] is not None:
+        remaining=timedelta(seconds=round(snapshot['eta_seconds']))
+        line+=f' | eta: {snapshot["eta"]} ({remaining})'
+    return line
@@ -0,0 +1,228 @@
+import re
+import time
+import threading
+#
+# CONFIG
+#
+SUBMIT_RATE=10
+STATUS_RATE=5
+MIN_RATE=0.1
+DECREASE_FACTOR=0.5
+RECOVERY_TIME=60
+THROTTLE_COOLDOWN=1
+QUOTA_RETRIES=5
+#
+# CONSTANTS
+#
+SUBMIT='submit'
+STATUS='status'
+CEILING_MARGIN=0.9
+CEILING_SLOWDOWN=4
+QUOTA_ERROR_REGX=re.compile(
+    r'429|quota|rate.?limit|too many|resource.?exhausted',
+    re.IGNORECASE)
+
+
+
+#
+# HELPERS
+#
+def is_quota_error(error):
+    """ true if error is a rate-limit/quota (429-style) error """
+    resp=getattr(error,'resp',None)
+    if getattr(resp,'status',None)==429:
+        return True
+    return bool(QUOTA_ERROR_REGX.search(str(error)))
+
+
+def rate_limiter(rate_limit=None,share=1):
+    """ RateLimiter from `rate_limit`
+
+    Args:
+        rate_limit<RateLimiter|dict|bool|None>:
+            * None or False: None (no rate limiting)
+            * True: RateLimiter with the default rates
+            * dict: RateLimiter kwargs (submit_rate, status_rate, ...)
+            * RateLimiter: returned as is
+        share<float>:
+            share of the rates for this process (ie. 1/N for one of N shards
+            uploading to the same project). ignored if rate_limit is a RateLimiter
+    """
+    if isinstance(rate_limit,RateLimiter):
+        return rate_limit
+    elif not rate_limit:
+        return None
+    kwargs=dict(rate_limit) if isinstance(rate_limit,dict) else {}
+    kwargs['submit_rate']=kwargs.get('submit_rate',SUBMIT_RATE)*share
+    kwargs['status_rate']=kwargs.get('status_rate',STATUS_RATE)*share
+    return RateLimiter(**kwargs)
+
+
+
+#
+# MAIN
+#
+class TokenBucket(object):
+    """ thread-safe token bucket with an adaptive (AIMD) rate
+
+    `acquire` blocks until a token is available. Tokens refill at `rate` per
+    second up to `burst` (by default 1: requests are evenly spaced).
+
+    On quota errors `throttle` lowers the rate, at most once per `cooldown`
+    seconds so that the requests already in flight count once. The rate that
+    failed is kept as `ceiling`: a first failure (or one well below the 
+    ceiling) multiplies the rate by `decrease`, a failure near the ceiling 
+    only lowers it to CEILING_MARGIN of the failing rate. Successful calls 
+    (`success`) raise the rate back linearly, to `max_rate` in `recovery` 
+    seconds, and CEILING_SLOWDOWN times more slowly near the ceiling. The rate
+    settles just below the sustainable maximum instead of oscillating around it.
+
+    Args:
+        rate<float>: max (and initial) tokens per second
+        burst<float|None>: bucket size. defaults to 1
+        min_rate<float>: rate floor
+        decrease<float>: rate multiplier on quota errors
+        recovery<float>: seconds to recover from min_rate to rate
+        cooldown<float>: min seconds between two rate decreases
+    """
+    def __init__(
+            self,
+            rate,
+            burst=None,
+            min_rate=MIN_RATE,
+            decrease=DECREASE_FACTOR,
+            recovery=RECOVERY_TIME,
+            cooldown=THROTTLE_COOLDOWN):
+        self.max_rate=rate
+        self.rate=rate
+        self.burst=burst or 1
+        self.min_rate=min(min_rate,rate)
+        self.decrease=decrease
+        self.recovery=recovery
+        self.cooldown=cooldown
+        self.ceiling=None
+        self.nb_throttled=0
+        self._tokens=self.burst
+        self._updated=time.time()
+        self._increased=self._updated
+        self._throttled=0
+        self._lock=threading.Lock()
+
+
+    def acquire(self,tokens=1):
+        """ take `tokens` tokens (sleeps until they are available) """
+        with self._lock:
+            self._refill()
+            self._tokens-=tokens
+            delay=-self._tokens/self.rate if self._tokens<0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+    def throttle(self):
+        """ slow down after a quota error """
+        with self._lock:
+            now=time.time()
+            self._refill(now)
+            self._tokens=min(self._tokens,0)
+            if (now-self._throttled)<max(self.cooldown,1/self.rate):
+                return
+            if self._near_ceiling():
+                rate=CEILING_MARGIN*self.rate
+            else:
+                rate=self.decrease*self.rate
+            self.ceiling=self.rate
+            self.rate=max(rate,self.min_rate)
+            self._throttled=now
+            self._increased=now
+            self.nb_throttled+=1
+
+
+    def success(self):
+        """ speed back up after a successful call """
+        if self.rate>=self.max_rate:
+            self._increased=time.time()
+            return
+        with self._lock:
+            now=time.time()
+            step=(self.max_rate-self.min_rate)*(now-self._increased)/self.recovery
+            if self._near_ceiling():
+                step/=CEILING_SLOWDOWN
+            self._refill(now)
+            self.rate=min(self.rate+step,self.max_rate)
+            self._increased=now
+
+
+    #
+    # INTERNAL
+    #
+    def _near_ceiling(self):
+        return bool(self.ceiling) and (self.rate>=CEILING_MARGIN*self.ceiling)
+
+
+    def _refill(self,now=None):
+        now=now or time.time()
+        self._tokens=min(self._tokens+(now-self._updated)*self.rate,self.burst)
+        self._updated=now
+
+
+
+class RateLimiter(object):
+    """ shared rate limits for ingestion (submit) and task-status requests
+
+    Each kind of request has its own TokenBucket. `call` waits for a token,
+    makes the request and adapts the bucket: quota errors (see is_quota_error)
+    throttle the bucket and the request is retried (up to `retries` times),
+    successful requests let the rate recover.
+
+    Args:
+        submit_rate<float>: max ingestion requests (startIngestion) per second
+        status_rate<float>: max status requests (getTaskStatus) per second
+        retries<int>: max retries of a request after quota errors
+        **bucket_kwargs: TokenBucket kwargs (burst, min_rate, decrease, recovery, cooldown)
+
+    Usage:
+
+        limiter=RateLimiter(submit_rate=5)
+        resp=limiter.call(SUBMIT,ee.data.startIngestion,task_id,manifest)
+    """
+    def __init__(
+            self,
+            submit_rate=SUBMIT_RATE,
+            status_rate=STATUS_RATE,
+            retries=QUOTA_RETRIES,
+            **bucket_kwargs):
+        self.retries=retries
+        self.buckets={
+            SUBMIT: TokenBucket(submit_rate,**bucket_kwargs),
+            STATUS: TokenBucket(status_rate,**bucket_kwargs) }
+
+
+    def call(self,kind,func,*args,tokens=1,**kwargs):
+        """ rate limited `func(*args,**kwargs)`
+
+        Args:
+            kind<str>: SUBMIT or STATUS
+            func<function>: request function
+            tokens<int>: number of requests made by `func` (ie. getTaskStatus 
+                makes one request per task id)
+        """
+        bucket=self.buckets[kind]
+        attempt=0
+        while True:
+            bucket.acquire(tokens)
+            try:
+                result=func(*args,**kwargs)
+            except Exception as e:
+                if (attempt<self.retries) and is_quota_error(e):
+                    bucket.throttle()
+                    attempt+=1
+                    continue
+                raise
+            bucket.success()
+            return result
+
+
+    def rates(self):
+        """ current rate (requests per second) by kind """
+        return { k: b.rate for k,b in self.buckets.items() }
@@ -0,0 +1,474 @@
+import time
+import sqlite3
+import threading
+from array import array
+from . import journal as ujournal
+from . import utils
+#
+# CONFIG
+#
+SQLITE_BUFFER_SIZE=1000
+#
+# CONSTANTS
+#
+FIELDS=(
+    'name',
+    'task_id',
+    'state',
+    'submitted',
+    'started',
+    'updated',
+    'finished',
+    'error_class',
+    'error_message',
+    'retries' )
+TIME_FIELDS=(
+    'submitted',
+    'started',
+    'updated',
+    'finished' )
+FAILED_STATES=[
+    'FAILED',
+    'CANCELLED' ]
+COLUMNAR='columnar'
+SQLITE_EXTS=('.db','.sqlite','.sqlite3')
+NO_TIME=float('nan')
+
+
+
+#
+# HELPERS
+#
+def results_store(store=None):
+    """ results store from `store`
+
+    Args:
+        store<str|None>:
+            * None: ResultList (a list of UploadResults)
+            * 'columnar': ColumnarResults
+            * path ending in .db/.sqlite/.sqlite3: SQLiteResults
+    """
+    if not store:
+        return ResultList()
+    elif store==COLUMNAR:
+        return ColumnarResults()
+    elif str(store).endswith(SQLITE_EXTS):
+        return SQLiteResults(store)
+    else:
+        raise ValueError(f'results store must be None, "{COLUMNAR}" or a sqlite path: {store}')
+
+
+def state_counts(results):
+    """ number of results by state """
+    if hasattr(results,'state_counts'):
+        return results.state_counts()
+    counts={}
+    for result in results:
+        counts[result.state]=counts.get(result.state,0)+1
+    return counts
+
+
+def failed(results):
+    """ results of uploads that failed or timed out (see UploadResult.error_class) """
+    if hasattr(results,'failed'):
+        return results.failed()
+    return [r for r in results if r.failed or r.error_class]
+
+
+def nb_retried(results):
+    """ number of uploads that were retried """
+    if hasattr(results,'nb_retried'):
+        return results.nb_retried()
+    return sum(1 for r in results if r.retries)
+
+
+def slowest(results,n=10):
+    """ the `n` results with the longest durations (submission to final status) """
+    if hasattr(results,'slowest'):
+        return results.slowest(n)
+    timed=[r for r in results if r.duration is not None]
+    return sorted(timed,key=lambda r: r.duration,reverse=True)[:n]
+
+
+
+#
+# MAIN
+#
+class UploadResult(object):
+    """ immutable result of a single upload
+
+    A compact (`__slots__`) record created once per upload, when its final
+    status is known. Results are returned by the upload engines instead of
+    being written to shared state, so concurrent uploads never share
+    anything mutable.
+
+    Args:
+        name<str>: asset name
+        task_id<str|None>: (last) ingestion task id. None if the upload was skipped
+        state<str>: final state: COMPLETED, FAILED, CANCELLED, TIMEOUT, SKIPPED or UPDATED
+        submitted<float|None>: unix-time of the (first) submission
+        started<float|None>: unix-time the task started running (server)
+        updated<float|None>: unix-time of the last task update (server)
+        finished<float|None>: unix-time the final status was received
+        error_class<str|None>: see retry.classify
+        error_message<str|None>: task error, timeout or skip message
+        retries<int>: number of retries
+    """
+    __slots__=FIELDS
+    def __init__(
+            self,
+            name,
+            task_id=None,
+            state=None,
+            submitted=None,
+            started=None,
+            updated=None,
+            finished=None,
+            error_class=None,
+            error_message=None,
+            retries=0):
+        values=(
+            name,
+            task_id,
+            state,
+            submitted,
+            started,
+            updated,
+            finished,
+            error_class,
+            error_message,
+            retries)
+        for field,value in zip(FIELDS,values):
+            object.__setattr__(self,field,value)
+
+
+    @classmethod
+    def from_status(cls,manifest,status,submitted=None,finished=None):
+        """ result from an upload manifest and its final task status (or upload response) """
+        return cls(
+            manifest['name'],
+            task_id=status.get('id'),
+            state=ujournal.status_state(status),
+            submitted=submitted,
+            started=_seconds(status.get('start_timestamp_ms')),
+            updated=_seconds(status.get('update_timestamp_ms')),
+            finished=finished or time.time(),
+            error_class=status.get('error_class'),
+            error_message=(
+                status.get('error_message') or
+                status.get('TIMEOUT') or
+                status.get('WARNING')),
+            retries=status.get('retries',0))
+
+
+    @property
+    def failed(self):
+        """ true if the task ended with an error (FAILED or CANCELLED) """
+        return self.state in FAILED_STATES
+
+
+    @property
+    def duration(self):
+        """ seconds from submission to the final status """
+        if self.submitted and self.finished:
+            return self.finished-self.submitted
+
+
+    def as_dict(self):
+        return { f: getattr(self,f) for f in FIELDS }
+
+
+    def __setattr__(self,name,value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+
+    def __delattr__(self,name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+
+    def __eq__(self,other):
+        return isinstance(other,UploadResult) and (self.as_dict()==other.as_dict())
+
+
+    def __hash__(self):
+        return hash(tuple(getattr(self,f) for f in FIELDS))
+
+
+    def __repr__(self):
+        values=', '.join(f'{f}={getattr(self,f)!r}' for f in FIELDS if getattr(self,f))
+        return f'{type(self).__name__}({values})'
+
+
+    def __reduce__(self):
+        return (type(self),tuple(getattr(self,f) for f in FIELDS))
+
+
+
+class ResultList(object):
+    """ default results store: collects the UploadResults of a run
+
+    `add` may be called from any thread, in any order. `finalize` returns the
+    results as a list (in the order of the uploads).
+    """
+    def __init__(self):
+        self._results={}
+
+
+    def add(self,index,result):
+        self._results[index]=result
+
+
+    def finalize(self):
+        return [self._results[i] for i in sorted(self._results)]
+
+
+
+class ColumnarResults(object):
+    """ in-memory, column-oriented results store
+
+    Each field is stored in its own column: times as float arrays, states and
+    error classes as one-byte codes, retries as a short array and error
+    messages only for the uploads that have one. A result takes a few dozen
+    bytes (plus its name and task id) instead of a dict (or object) per upload.
+    Rows are stored in the order they are added and read (`__iter__`,
+    `__getitem__`) in the order of the uploads.
+    """
+    def __init__(self):
+        self.index=array('Q')
+        self.names=[]
+        self.task_ids=[]
+        self.states=array('B')
+        self.times={ f: array('d') for f in TIME_FIELDS }
+        self.error_classes=array('B')
+        self.error_messages={}
+        self.retries=array('H')
+        self._codes={ None: 0 }
+        self._values=[None]
+        self._order=None
+        self._lock=threading.Lock()
+
+
+    def add(self,index,result):
+        with self._lock:
+            row=len(self.index)
+            self.index.append(index)
+            self.names.append(result.name)
+            self.task_ids.append(result.task_id)
+            self.states.append(self._code(result.state))
+            for field,column in self.times.items():
+                value=getattr(result,field)
+                column.append(NO_TIME if value is None else value)
+            self.error_classes.append(self._code(result.error_class))
+            if result.error_message:
+                self.error_messages[row]=result.error_message
+            self.retries.append(min(result.retries or 0,0xFFFF))
+            self._order=None
+
+
+    def finalize(self):
+        return self
+
+
+    def state_counts(self):
+        counts={}
+        for code in self.states:
+            counts[code]=counts.get(code,0)+1
+        return { self._values[c]: n for c,n in counts.items() }
+
+
+    def failed(self):
+        failed_codes={ self._codes[s] for s in FAILED_STATES if s in self._codes }
+        return [
+            self._row(row)
+            for row in self._rows()
+            if (self.states[row] in failed_codes) or self.error_classes[row] ]
+
+
+    def nb_retried(self):
+        return sum(1 for r in self.retries if r)
+
+
+    def slowest(self,n=10):
+        submitted=self.times['submitted']
+        finished=self.times['finished']
+        rows=[r for r in range(len(self.index)) if (finished[r]-submitted[r])>=0]
+        rows.sort(key=lambda r: finished[r]-submitted[r],reverse=True)
+        return [self._row(r) for r in rows[:n]]
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def __iter__(self):
+        return (self._row(row) for row in self._rows())
+
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return [self._row(row) for row in self._rows()[i]]
+        return self._row(self._rows()[i])
+
+
+    #
+    # INTERNAL
+    #
+    def _code(self,value):
+        code=self._codes.get(value)
+        if code is None:
+            code=self._codes[value]=len(self._values)
+            self._values.append(value)
+        return code
+
+
+    def _rows(self):
+        order=self._order
+        if order is None:
+            order=self._order=sorted(range(len(self.index)),key=self.index.__getitem__)
+        return order
+
+
+    def _row(self,row):
+        times={ f: _time(c[row]) for f,c in self.times.items() }
+        return UploadResult(
+            self.names[row],
+            task_id=self.task_ids[row],
+            state=self._values[self.states[row]],
+            error_class=self._values[self.error_classes[row]],
+            error_message=self.error_messages.get(row),
+            retries=self.retries[row],
+            **times)
+
+
+
+class SQLiteResults(object):
+    """ sqlite-backed results store
+
+    Results are buffered and written `buffer_size` at a time to a `results`
+    table (one row per upload, keyed by the upload index). Queries are run 
+    in sqlite, so the results of a run never need to be in memory.
+
+    The connection stays open until `close` (or the end of a `with` block).
+
+    Args:
+        path<str>: path to sqlite database
+        buffer_size<int>: number of results buffered before a write
+        clear<bool>: if true clear the table (a new run). false to read saved results
+    """
+    def __init__(self,path,buffer_size=SQLITE_BUFFER_SIZE,clear=True):
+        self.path=path
+        self.buffer_size=buffer_size
+        self._buffer=[]
+        self._lock=threading.Lock()
+        utils.ensure_dir(path)
+        self._conn=sqlite3.connect(path,check_same_thread=False)
+        columns=', '.join(
+            f'{f} REAL' if f in TIME_FIELDS else f'{f} INTEGER' if f=='retries' else f'{f} TEXT'
+            for f in FIELDS)
+        with self._conn:
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS results (idx INTEGER PRIMARY KEY, {columns})')
+            if clear:
+                self._conn.execute('DELETE FROM results')
+
+
+    def add(self,index,result):
+        with self._lock:
+            self._buffer.append((index,)+tuple(getattr(result,f) for f in FIELDS))
+            if len(self._buffer)>=self.buffer_size:
+                self._flush()
+
+
+    def finalize(self):
+        with self._lock:
+            self._flush()
+        return self
+
+
+    def close(self):
+        self.finalize()
+        self._conn.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self,*args):
+        self.close()
+
+
+    def state_counts(self):
+        return dict(self._query('SELECT state, COUNT(*) FROM results GROUP BY state'))
+
+
+    def failed(self):
+        states=', '.join(f"'{s}'" for s in FAILED_STATES)
+        return self._results(
+            f'WHERE (state IN ({states})) OR (error_class IS NOT NULL) ORDER BY idx')
+
+
+    def nb_retried(self):
+        return self._query('SELECT COUNT(*) FROM results WHERE retries>0')[0][0]
+
+
+    def slowest(self,n=10):
+        return self._results(
+            'WHERE (finished-submitted) IS NOT NULL ORDER BY (finished-submitted) DESC LIMIT ?',
+            (n,))
+
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM results')[0][0]
+
+
+    def __iter__(self):
+        return iter(self._results('ORDER BY idx'))
+
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return list(self)[i]
+        if i<0:
+            i+=len(self)
+        results=self._results('ORDER BY idx LIMIT 1 OFFSET ?',(i,))
+        if not results:
+            raise IndexError(f'result index out of range: {i}')
+        return results[0]
+
+
+    #
+    # INTERNAL
+    #
+    def _flush(self):
+        if self._buffer:
+            marks=', '.join('?' for _ in range(len(FIELDS)+1))
+            with self._conn:
+                self._conn.executemany(
+                    f'INSERT OR REPLACE INTO results VALUES ({marks})',
+                    self._buffer)
+            self._buffer=[]
+
+
+    def _query(self,sql,params=()):
+        with self._lock:
+            self._flush()
+            return self._conn.execute(sql,params).fetchall()
+
+
+    def _results(self,where,params=()):
+        rows=self._query(f'SELECT {", ".join(FIELDS)} FROM results {where}',params)
+        return [UploadResult(*row) for row in rows]
+
+
+
+#
+# INTERNAL
+#
+def _seconds(millis):
+    if millis:
+        return int(millis)/1000
+
+
+def _time(value):
+    if value==value:
+        return value
@@ -0,0 +1,225 @@
+import re
+import time
+import random
+import threading
+from . import gee_utils as gutils
+from . import journal as ujournal
+from . import rate_limit as urate_limit
+from . import results as uresults
+#
+# CONFIG
+#
+RETRIES=3
+BACKOFF_INITIAL=10
+BACKOFF_MAX=5*60
+BACKOFF_FACTOR=2
+BACKOFF_JITTER=0.1
+#
+# CONSTANTS
+#
+TRANSIENT='transient'
+QUOTA='quota'
+TIMEOUT='timeout'
+BAD_SOURCE='bad_source'
+EXISTS='exists'
+CANCELLED='cancelled'
+UNKNOWN='unknown'
+RETRYABLE=[
+    TRANSIENT,
+    QUOTA,
+    TIMEOUT ]
+CANCELLED_STATES=[
+    'CANCELLED',
+    'CANCEL_REQUESTED' ]
+EXISTS_REGX=re.compile(
+    r'already exists|cannot overwrite',
+    re.IGNORECASE)
+BAD_SOURCE_REGX=re.compile(
+    r'not found|no such (object|file|bucket)|does not exist|permission|access denied|'
+    r'unable to (read|open|decode)|invalid (file|image|tiff|geotiff|source|manifest)|'
+    r'unsupported|corrupt|gdal|\b40[034]\b',
+    re.IGNORECASE)
+TRANSIENT_REGX=re.compile(
+    r'internal error|backend|unavailable|deadline|timed? ?out|try again|retry|'
+    r'connection|reset by peer|broken pipe|\b50[0234]\b',
+    re.IGNORECASE)
+
+
+
+#
+# HELPERS
+#
+def classify(status):
+    """ error class of a final task status, upload response or exception
+
+    Args:
+        status<dict|Exception>: task status, upload response or request error
+
+    Returns<str|None>:
+        * None: no error (completed or skipped as existing)
+        * TIMEOUT: task still running after the timeout (retried by waiting again)
+        * QUOTA: rate-limit/quota error (see rate_limit.is_quota_error)
+        * TRANSIENT: backend/network error
+        * BAD_SOURCE: missing, unreadable or invalid source file
+        * EXISTS: asset already exists
+        * CANCELLED: task was cancelled
+        * UNKNOWN: any other error
+    """
+    if isinstance(status,Exception):
+        message=str(status)
+        if urate_limit.is_quota_error(status):
+            return QUOTA
+        if isinstance(status,(ConnectionError,TimeoutError)):
+            return TRANSIENT
+        code=getattr(getattr(status,'resp',None),'status',None)
+        if code and (int(code)>=500):
+            return TRANSIENT
+    else:
+        if 'TIMEOUT' in status:
+            return TIMEOUT
+        state=status.get('state')
+        if (state in [gutils.COMPLETED,ujournal.UPDATED]) or ('WARNING' in status):
+            return None
+        if state in CANCELLED_STATES:
+            return CANCELLED
+        message=status.get('error_message')
+        if not message:
+            return None if (state is None) else UNKNOWN
+    if EXISTS_REGX.search(message):
+        return EXISTS
+    elif urate_limit.QUOTA_ERROR_REGX.search(message):
+        return QUOTA
+    elif BAD_SOURCE_REGX.search(message):
+        return BAD_SOURCE
+    elif TRANSIENT_REGX.search(message):
+        return TRANSIENT
+    else:
+        return UNKNOWN
+
+
+def retry_policy(retry=None):
+    """ RetryPolicy from `retry`
+
+    Args:
+        retry<RetryPolicy|dict|int|bool|None>:
+            * None or True: RetryPolicy with the defaults
+            * False or 0: None (no retries)
+            * int: max retries per upload
+            * dict: RetryPolicy kwargs
+            * RetryPolicy: returned as is
+    """
+    if isinstance(retry,RetryPolicy):
+        return retry
+    elif isinstance(retry,dict):
+        return RetryPolicy(**retry)
+    elif (retry is None) or (retry is True):
+        return RetryPolicy()
+    elif retry:
+        return RetryPolicy(retries=int(retry))
+
+
+def summary(results):
+    """ summary of the results (results.UploadResult or a results store) of a run
+
+    Returns<dict>:
+        nb_tasks: number of results
+        states: number of results by state
+        nb_retried: number of uploads that were retried
+        failures: name, error_class, error_message and retries of each upload
+                  that failed or timed out
+    """
+    failures=[
+        {
+            'name': result.name,
+            'error_class': result.error_class,
+            'error_message': result.error_message,
+            'retries': result.retries }
+        for result in uresults.failed(results) ]
+    return {
+        'nb_tasks': len(results),
+        'states': uresults.state_counts(results),
+        'nb_retried': uresults.nb_retried(results),
+        'failures': failures }
+
+
+
+#
+# MAIN
+#
+class RetryPolicy(object):
+    """ retries of failed uploads and requests
+
+    Only RETRYABLE error classes (transient, quota and timeout, see
+    `classify`) are retried: at most `retries` times per upload, with
+    exponential backoff and jitter, and at most `budget` times in total
+    (shared by every upload using the policy). Permanent errors (bad source,
+    asset exists, cancelled, unknown) are never retried.
+
+    Args:
+        retries<int>: max retries per upload (or request)
+        initial<float>: seconds before the first retry
+        maximum<float>: max seconds between retries
+        factor<float>: backoff multiplier
+        jitter<float>: random +/- fraction added to each delay
+        budget<int|None>: max total number of retries (None: no limit)
+        retry_on<list>: error classes to retry. defaults to RETRYABLE
+
+    Usage:
+
+        policy=RetryPolicy(retries=5,budget=1000)
+        delay=policy.delay(classify(status),attempt)
+        if delay is not None:
+            ... resubmit after `delay` seconds
+    """
+    def __init__(
+            self,
+            retries=RETRIES,
+            initial=BACKOFF_INITIAL,
+            maximum=BACKOFF_MAX,
+            factor=BACKOFF_FACTOR,
+            jitter=BACKOFF_JITTER,
+            budget=None,
+            retry_on=RETRYABLE):
+        self.retries=retries
+        self.initial=initial
+        self.maximum=maximum
+        self.factor=factor
+        self.jitter=jitter
+        self.budget=budget
+        self.retry_on=retry_on
+        self.nb_retries=0
+        self._lock=threading.Lock()
+
+
+    def delay(self,error_class,attempt):
+        """ seconds to wait before retry number `attempt+1` (None: do not retry)
+
+        Args:
+            error_class<str|None>: see `classify`
+            attempt<int>: number of retries so far
+        """
+        if (error_class not in self.retry_on) or (attempt>=self.retries):
+            return None
+        with self._lock:
+            if (self.budget is not None) and (self.nb_retries>=self.budget):
+                return None
+            self.nb_retries+=1
+        if error_class==TIMEOUT:
+            # the task is still running: wait for it again right away
+            return 0
+        delay=min(self.initial*(self.factor**attempt),self.maximum)
+        return delay*(1+random.uniform(-self.jitter,self.jitter))
+
+
+    def call(self,func,*args,**kwargs):
+        """ `func(*args,**kwargs)` retrying retryable request errors """
+        attempt=0
+        while True:
+            try:
+                return func(*args,**kwargs)
+            except Exception as e:
+                delay=self.delay(classify(e),attempt)
+                if delay is None:
+                    raise
+                attempt+=1
+                time.sleep(delay)
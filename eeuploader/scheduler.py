@@ -0,0 +1,121 @@
+import asyncio
+import threading
+#
+# CONFIG
+#
+NB_WORKERS=16
+
+
+
+#
+# METHODS
+#
+def map_with_queue(map_function,args_list,nb_workers=NB_WORKERS,collect=True):
+    """ map over args_list with a shared work queue
+
+    Unlike a static split of args_list into `nb_workers` slices, each worker
+    takes the next pending arg as soon as it is free, so a single slow call
+    does not stall the args queued behind it.
+
+    Args:
+        map_function<function>:
+            function to map over args_list
+        args_list<list|iterable>:
+            arguments to map over. iterables (ie. generators) are consumed 
+            lazily, one arg at a time
+        nb_workers<int>:
+            max number of simultaneous calls to map_function
+        collect<bool>:
+            if false the return values are dropped (ie. when map_function 
+            stores its own results) and None is returned
+
+    Returns<list|None>:
+        list of return values from map_function (in the order of args_list)
+
+    Raises:
+        the first exception raised by map_function (pending args are dropped)
+    """
+    results={}
+    errors=[]
+    work=enumerate(args_list)
+    lock=threading.Lock()
+    def _worker():
+        while not errors:
+            with lock:
+                try:
+                    i,arg=next(work)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    errors.append(e)
+                    return
+            try:
+                result=map_function(arg)
+                if collect:
+                    results[i]=result
+            except Exception as e:
+                errors.append(e)
+    threads=[
+        threading.Thread(target=_worker,daemon=True)
+        for _ in range(_nb_workers(nb_workers,args_list)) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    if collect:
+        return [results[i] for i in range(len(results))]
+
+
+async def map_with_queue_async(map_coroutine,args_list,nb_workers=NB_WORKERS,collect=True):
+    """ asyncio version of `map_with_queue`
+
+    `nb_workers` worker coroutines (on the running event loop) take the next 
+    pending arg as soon as they are free.
+
+    Args:
+        map_coroutine<coroutine function>:
+            coroutine function to map over args_list
+        args_list<list|iterable>:
+            arguments to map over. iterables are consumed lazily
+        nb_workers<int>:
+            max number of simultaneous map_coroutine calls
+        collect<bool>:
+            if false the return values are dropped and None is returned
+
+    Returns<list|None>:
+        list of return values from map_coroutine (in the order of args_list)
+
+    Raises:
+        the first exception raised by map_coroutine (the remaining workers 
+        are cancelled)
+    """
+    results={}
+    work=enumerate(args_list)
+    async def _worker():
+        for i,arg in work:
+            result=await map_coroutine(arg)
+            if collect:
+                results[i]=result
+    workers=[
+        asyncio.ensure_future(_worker())
+        for _ in range(_nb_workers(nb_workers,args_list)) ]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for w in workers:
+            w.cancel()
+        raise
+    if collect:
+        return [results[i] for i in range(len(results))]
+
+
+
+#
+# INTERNAL
+#
+def _nb_workers(nb_workers,args_list):
+    if hasattr(args_list,'__len__'):
+        nb_workers=min(nb_workers,len(args_list))
+    return max(1,nb_workers)
@@ -0,0 +1,285 @@
+import os
+import re
+import sys
+import hashlib
+import tempfile
+import subprocess
+import yaml
+from . import features as ufeatures
+from . import gee_utils as gutils
+from . import journal as ujournal
+from . import results as uresults
+from . import utils
+#
+# CONSTANTS
+#
+SHARD_REGX=re.compile(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+GZ_EXT='.gz'
+WORKER_COMMAND=[sys.executable,'-m','eeuploader.cli','upload']
+ERROR_SHARD="eeuploader.shard: shard must be 'i/N' (or (i,N)) with 0 <= i < N: {}"
+
+
+
+#
+# HELPERS
+#
+def parse_shard(shard):
+    """ (index,nb_shards) from 'i/N' or (i,N). None if shard is falsy """
+    if not shard:
+        return None
+    parts=shard
+    if isinstance(shard,str):
+        match=SHARD_REGX.search(shard)
+        if not match:
+            raise ValueError(ERROR_SHARD.format(shard))
+        parts=match.groups()
+    index,nb_shards=(int(v) for v in parts)
+    if not (0<=index<nb_shards):
+        raise ValueError(ERROR_SHARD.format(shard))
+    return index, nb_shards
+
+
+def shard_of(name,nb_shards):
+    """ shard of an asset name
+
+    A stable (sha1) hash of the name: the same asset always belongs to the
+    same shard, across runs, processes and hosts, whatever the order or
+    content of the rest of the feature collection.
+    """
+    digest=hashlib.sha1(name.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8],'big')%nb_shards
+
+
+def in_shard(name,shard):
+    """ true if asset name belongs to shard (index,nb_shards) """
+    index,nb_shards=shard
+    return shard_of(name,nb_shards)==index
+
+
+def shard_path(path,index,nb_shards):
+    """ per-shard path: run.jsonl -> run.shard-0-of-4.jsonl """
+    if path.endswith(GZ_EXT):
+        root,ext=os.path.splitext(path[:-len(GZ_EXT)])
+        ext+=GZ_EXT
+    else:
+        root,ext=os.path.splitext(path)
+    return f'{root}.shard-{index}-of-{nb_shards}{ext}'
+
+
+def save_results(results,path):
+    """ save results (results.UploadResult) to a jsonl file """
+    utils.save_jsonl((r.as_dict() for r in results),path)
+    return path
+
+
+def read_results(path):
+    """ results (results.UploadResult) from a jsonl file (see `save_results`) """
+    return [uresults.UploadResult(**r) for r in utils.read_jsonl(path)]
+
+
+def merge_logs(paths,dest):
+    """ merge (shard) journals or delta fingerprints (journal.JsonlLog files) into 
+    a single file (the latest record of each asset wins)
+
+    Returns<int>: number of records
+    """
+    return utils.save_jsonl(_latest_records(paths).values(),dest)
+
+
+def split_log(paths,dest,nb_shards):
+    """ split journal.JsonlLog files into per-shard files (`shard_path(dest,i,N)`)
+
+    Each shard file gets the latest record of every asset of its shard.
+
+    Returns<list>: shard paths
+    """
+    records=_latest_records(paths)
+    shard_paths=[shard_path(dest,i,nb_shards) for i in range(nb_shards)]
+    for i,path in enumerate(shard_paths):
+        utils.save_jsonl(
+            (r for r in records.values() if shard_of(r['name'],nb_shards)==i),
+            path)
+    return shard_paths
+
+
+
+#
+# MAIN
+#
+class LocalCoordinator(object):
+    """ run an upload as `nb_shards` local worker processes
+
+    Each worker runs `eeuploader upload <args> --shard i/N` with its own
+    journal (`shard_path(journal,i,N)`, so that re-running the same command
+    resumes every shard), results and log files. Once every worker has
+    finished the shard journals are merged into `journal` and the shard
+    results into `self.results`.
+
+    Files shared by the workers are written by the coordinator only: the
+    feature index is built before the workers start, and the workers use the
+    asset cache read-only (see EEImagesUp `shard`). The coordinator refreshes
+    the cache before and adds the assets the workers created after the run.
+    Every other file a worker writes is its own: delta fingerprints are split
+    into shard files before the run and merged back after it, sqlite results 
+    stores are written by the coordinator from the merged results and each 
+    worker writes its own progress snapshot (`shard_path(progress,i,N)`).
+
+    Args:
+        nb_shards<int>: number of worker processes
+        args<list>: `eeuploader upload` arguments (without --shard, --journal, --results)
+        journal<str|None>: journal path. shard journals are written next to it
+        metrics<str|None>: metrics path. each shard saves `shard_path(metrics,i,N)`
+        index<str|None>: feature collection whose index (features.FeatureIndex) the workers use
+        asset_cache<asset_cache.AssetCache|None>: existing-asset cache of the upload
+        delta<str|None>: delta fingerprints path (EEImagesUp `delta`)
+        results_store<str|None>: results store (EEImagesUp `results_store`)
+        progress<dict|str|bool|None>: progress (EEImagesUp `progress`)
+        work_dir<str|None>: directory for the shard results and logs (default: a new temp directory)
+        noisy<bool>: print worker progress
+
+    Usage:
+
+        coordinator=LocalCoordinator(8,['fc.geojson','upargs.yaml'],journal='run.jsonl')
+        results=coordinator.run()
+    """
+    def __init__(
+            self,
+            nb_shards,
+            args,
+            journal=None,
+            metrics=None,
+            index=None,
+            asset_cache=None,
+            delta=None,
+            results_store=None,
+            progress=None,
+            work_dir=None,
+            noisy=True):
+        self.nb_shards=nb_shards
+        self.args=list(args)
+        self.journal=journal
+        self.metrics=metrics
+        self.index=index
+        self.asset_cache=asset_cache
+        self.delta=delta
+        self.results_store=results_store
+        self.progress=progress
+        self.work_dir=work_dir or tempfile.mkdtemp(prefix='eeuploader-shards-')
+        self.noisy=noisy
+        self.results=None
+        self.return_codes=None
+
+
+    def commands(self):
+        """ worker commands """
+        return [self._command(i) for i in range(self.nb_shards)]
+
+
+    def run(self):
+        """ run the workers, wait for them to finish and merge their results and journals
+
+        Returns<list>: results.UploadResult of every shard (shard by shard)
+        """
+        os.makedirs(self.work_dir,exist_ok=True)
+        if self.index:
+            ufeatures.FeatureIndex(self.index)
+        if self.asset_cache:
+            self.asset_cache.load()
+        if self.delta:
+            split_log([self.delta]+self._shard_paths(self.delta),self.delta,self.nb_shards)
+        workers=[]
+        for i,command in enumerate(self.commands()):
+            log=open(self._path('log',i),'w')
+            workers.append((subprocess.Popen(command,stdout=log,stderr=subprocess.STDOUT),log))
+            if self.noisy:
+                print(f'shard {i}/{self.nb_shards}: pid={workers[-1][0].pid} log={log.name}')
+        self.return_codes=[]
+        for i,(worker,log) in enumerate(workers):
+            self.return_codes.append(worker.wait())
+            log.close()
+            if self.noisy:
+                print(f'shard {i}/{self.nb_shards}: exit={self.return_codes[-1]}')
+        self.results=[]
+        for i in range(self.nb_shards):
+            path=self._path('results',i)
+            if os.path.isfile(path):
+                self.results+=read_results(path)
+        if self.asset_cache:
+            for result in self.results:
+                if result.state==gutils.COMPLETED:
+                    self.asset_cache.add(result.name)
+            self.asset_cache.flush()
+        if self.journal:
+            merge_logs([self.journal]+self._shard_paths(self.journal),self.journal)
+        if self.delta:
+            merge_logs([self.delta]+self._shard_paths(self.delta),self.delta)
+        if self._is_store_path():
+            store=uresults.results_store(self.results_store)
+            for i,result in enumerate(self.results):
+                store.add(i,result)
+            store.close()
+        return self.results
+
+
+    def failed_shards(self):
+        """ indices of the workers that exited with an error """
+        return [i for i,code in enumerate(self.return_codes or []) if code]
+
+
+    #
+    # INTERNAL
+    #
+    def _command(self,index):
+        command=WORKER_COMMAND+self.args+[
+            '--shard',f'{index}/{self.nb_shards}',
+            '--results',self._path('results',index) ]
+        if self.journal:
+            command+=['--journal',shard_path(self.journal,index,self.nb_shards)]
+        if self.metrics:
+            command+=['--metrics',shard_path(self.metrics,index,self.nb_shards)]
+        # key=value arguments come last: they override the upload args
+        if self.delta:
+            command.append(f'delta={shard_path(self.delta,index,self.nb_shards)}')
+        if self._is_store_path():
+            command.append(f'results_store={shard_path(self.results_store,index,self.nb_shards)}')
+        progress=self._progress(index)
+        if progress:
+            command.append(f'progress={progress}')
+        return command
+
+
+    def _progress(self,index):
+        # progress argument of a worker: its own snapshot file
+        if isinstance(self.progress,dict) and self.progress.get('path'):
+            progress=dict(self.progress)
+            progress['path']=shard_path(progress['path'],index,self.nb_shards)
+            return yaml.safe_dump(progress,default_flow_style=True).strip()
+        elif isinstance(self.progress,str):
+            return shard_path(self.progress,index,self.nb_shards)
+
+
+    def _is_store_path(self):
+        return bool(self.results_store) and (self.results_store!=uresults.COLUMNAR)
+
+
+    def _shard_paths(self,path):
+        return [shard_path(path,i,self.nb_shards) for i in range(self.nb_shards)]
+
+
+    def _path(self,kind,index):
+        ext='jsonl' if kind=='results' else kind
+        return os.path.join(self.work_dir,f'{kind}.shard-{index}-of-{self.nb_shards}.{ext}')
+
+
+
+#
+# INTERNAL
+#
+def _latest_records(paths):
+    records={}
+    for path in paths:
+        if os.path.isfile(path):
+            for name,record in ujournal.JsonlLog(path).records.items():
+                if (name not in records) or (record['time']>=records[name]['time']):
+                    records[name]=record
+    return records
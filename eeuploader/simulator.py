@@ -0,0 +1,335 @@
+import re
+import math
+import time
+import heapq
+import random
+import threading
+import ee.ee_exception
+from . import backend as ubackend
+#
+# CONFIG
+#
+LATENCY=0.05
+INGESTION_TIME=(1,5)
+#
+# CONSTANTS
+#
+READY='READY'
+RUNNING='RUNNING'
+COMPLETED='COMPLETED'
+FAILED='FAILED'
+UNKNOWN='UNKNOWN'
+TASK_ID_PREFIX='SIM'
+ASSET_ROOT='projects/earthengine-legacy/assets'
+TRANSIENT_ERROR='Internal error. Please try again.'
+BAD_SOURCE_ERROR='Unable to read {}: No such object'
+EXISTS_ERROR='Cannot overwrite asset {}: asset already exists'
+NOT_FOUND_ERROR='Asset {} not found'
+QUOTA_ERROR='Too many requests (429): {} quota exceeded'
+# endpoints
+NEW_TASK_ID='newTaskId'
+START_INGESTION='startIngestion'
+UPDATE_ASSET='updateAsset'
+GET_TASK_STATUS='getTaskStatus'
+LIST_ASSETS='listAssets'
+GET_LIST='getList'
+
+
+
+#
+# HELPERS
+#
+def lognormal(median,sigma=0.5):
+    """ log-normal durations (seconds) with `median`: for `latency`/`ingestion_time` """
+    return lambda rng: rng.lognormvariate(math.log(median),sigma)
+
+
+def simulate(**kwargs):
+    """ use a new SimulatedBackend(**kwargs) as the current backend (context manager)
+
+    Usage:
+
+        with simulate(ingestion_time=lognormal(2),failure_rate=0.01) as sim:
+            up.upload_collection()
+        print(sim.rpcs)
+    """
+    return ubackend.use_backend(SimulatedBackend(**kwargs))
+
+
+
+#
+# MAIN
+#
+class SimulatedBackend(object):
+    """ local, in-memory earth engine backend (see backend.EEBackend)
+
+    Simulates the ingestion requests and tasks made by eeuploader so that
+    uploads can be run (and benchmarked) without earth engine:
+
+        * every request sleeps for a `latency` and is counted in `self.rpcs`
+        * requests over an endpoint's quota raise quota (429) errors
+        * ingesting an existing asset without `force` raises an (already exists) error
+        * ingestions are queued (READY) until one of the `max_running` slots
+          is free, then RUNNING for an `ingestion_time`, then COMPLETED or
+          FAILED. completed assets are added to the listed assets
+        * updates of existing assets are stored in `self.updates`
+        * task statuses carry the creation/start/update timestamps
+
+    Durations are seconds: a number (constant), a (low,high) tuple (uniform)
+    or a function of a random.Random (see `lognormal`).
+
+    Args:
+        latency<float|tuple|function|dict>: request latency. a dict gives the
+            latency by endpoint (NEW_TASK_ID, START_INGESTION, ...)
+        ingestion_time<float|tuple|function>: time an ingestion runs
+        failure_rate<float>: probability an ingestion fails with a transient error
+        bad_source_rate<float>: probability an ingestion fails with a permanent
+            (missing source) error
+        quotas<dict|None>: max requests per second by endpoint
+        max_running<int|None>: max concurrently running ingestions (None: no limit)
+        assets<list|None>: existing asset names
+        seed<int|None>: random seed
+    """
+    initialized=False
+    def __init__(
+            self,
+            latency=LATENCY,
+            ingestion_time=INGESTION_TIME,
+            failure_rate=0,
+            bad_source_rate=0,
+            quotas=None,
+            max_running=None,
+            assets=None,
+            seed=None):
+        if isinstance(latency,dict):
+            self.latency={ k: _sampler(v) for k,v in latency.items() }
+        else:
+            self.latency=_sampler(latency)
+        self.ingestion_time=_sampler(ingestion_time)
+        self.failure_rate=failure_rate
+        self.bad_source_rate=bad_source_rate
+        self.quotas={ k: _Quota(rate) for k,rate in (quotas or {}).items() }
+        self.max_running=max_running
+        self.assets=set(assets or [])
+        self.tasks={}
+        self.updates={}
+        self.rpcs={}
+        self.nb_quota_errors=0
+        self.nb_initialized=0
+        self._rng=random.Random(seed)
+        self._slots=[]
+        self._listings={}
+        self._nb_ids=0
+        self._lock=threading.Lock()
+
+
+    def initialize(self,**kwargs):
+        self.nb_initialized+=1
+
+
+    def new_task_id(self,count=1):
+        self._request(NEW_TASK_ID)
+        with self._lock:
+            start=self._nb_ids
+            self._nb_ids+=count
+        return [f'{TASK_ID_PREFIX}{i:012d}' for i in range(start,start+count)]
+
+
+    def start_ingestion(self,task_id,manifest,force=False):
+        self._request(START_INGESTION)
+        name=_asset_name(manifest['name'])
+        with self._lock:
+            if (task_id not in self.tasks) and (not force):
+                self._add_completed()
+                if name in self.assets:
+                    raise ee.ee_exception.EEException(EXISTS_ERROR.format(name))
+            if task_id not in self.tasks:
+                self.tasks[task_id]=self._task(name)
+        return { 'id': task_id, 'name': manifest['name'], 'started': 'OK' }
+
+
+    def update_asset(self,asset_id,asset,update_mask):
+        self._request(UPDATE_ASSET)
+        name=_asset_name(asset_id)
+        with self._lock:
+            self._add_completed()
+            if name not in self.assets:
+                raise ee.ee_exception.EEException(NOT_FOUND_ERROR.format(name))
+            self.updates[name]={ k: asset.get(k) for k in update_mask }
+        return { 'name': name, **asset }
+
+
+    def get_task_status(self,task_ids):
+        if isinstance(task_ids,str):
+            task_ids=[task_ids]
+        # as ee.data.getTaskStatus: one request per task id
+        for _ in task_ids:
+            self._request(GET_TASK_STATUS)
+        now=time.time()
+        with self._lock:
+            return [self._status(task_id,now) for task_id in task_ids]
+
+
+    def list_assets(self,params):
+        self._request(LIST_ASSETS)
+        if params.get('pageToken'):
+            names=self._listings[params['parent']]
+        else:
+            # the listing is a snapshot taken with its first page
+            names=self._listings[params['parent']]=self._children(params['parent'])
+        start=int(params.get('pageToken') or 0)
+        size=params.get('pageSize') or len(names)
+        page={ 'assets': [
+            { 'name': n, 'type': 'IMAGE' }
+            for n in names[start:start+size] ] }
+        if start+size<len(names):
+            page['nextPageToken']=str(start+size)
+        return page
+
+
+    def get_list(self,params):
+        self._request(GET_LIST)
+        return [
+            { 'id': n, 'type': 'Image' }
+            for n in self._children(params['id']) ]
+
+
+    def nb_running(self):
+        """ number of tasks currently running """
+        now=time.time()
+        with self._lock:
+            return sum(1 for t in self.tasks.values() if t.start<=now<t.end)
+
+
+    #
+    # INTERNAL
+    #
+    def _request(self,endpoint):
+        with self._lock:
+            self.rpcs[endpoint]=self.rpcs.get(endpoint,0)+1
+            quota=self.quotas.get(endpoint)
+            over_quota=quota and (not quota.take())
+            if over_quota:
+                self.nb_quota_errors+=1
+            latency=self.latency
+            if isinstance(latency,dict):
+                latency=latency.get(endpoint)
+            delay=latency(self._rng) if latency else 0
+        if delay:
+            time.sleep(delay)
+        if over_quota:
+            raise ee.ee_exception.EEException(QUOTA_ERROR.format(endpoint))
+
+
+    def _task(self,name):
+        now=time.time()
+        duration=self.ingestion_time(self._rng) if self.ingestion_time else 0
+        error=None
+        draw=self._rng.random()
+        if draw<self.bad_source_rate:
+            error=BAD_SOURCE_ERROR.format(name)
+        elif draw<self.bad_source_rate+self.failure_rate:
+            error=TRANSIENT_ERROR
+        start=now
+        if self.max_running:
+            if len(self._slots)>=self.max_running:
+                start=max(now,heapq.heappop(self._slots))
+            heapq.heappush(self._slots,start+duration)
+        return _SimulatedTask(name,now,start,start+duration,error)
+
+
+    def _status(self,task_id,now):
+        task=self.tasks.get(task_id)
+        if task is None:
+            return { 'id': task_id, 'state': UNKNOWN }
+        status={
+            'id': task_id,
+            'task_type': 'INGEST_IMAGE',
+            'description': task.name,
+            'creation_timestamp_ms': _millis(task.created),
+            'update_timestamp_ms': _millis(min(now,task.end)) }
+        if now<task.start:
+            status['state']=READY
+        else:
+            status['start_timestamp_ms']=_millis(task.start)
+            if now<task.end:
+                status['state']=RUNNING
+            elif task.error:
+                status['state']=FAILED
+                status['error_message']=task.error
+            else:
+                status['state']=COMPLETED
+                self.assets.add(task.name)
+        return status
+
+
+    def _children(self,parent):
+        parent=_asset_name(parent)
+        with self._lock:
+            self._add_completed()
+            return sorted(
+                n for n in self.assets
+                if n.startswith(f'{parent}/') and ('/' not in n[len(parent)+1:]))
+
+
+    def _add_completed(self):
+        # add the assets of completed tasks (with the lock held)
+        now=time.time()
+        for task in self.tasks.values():
+            if (task.end<=now) and (not task.error):
+                self.assets.add(task.name)
+
+
+
+class _SimulatedTask(object):
+    __slots__=['name','created','start','end','error']
+    def __init__(self,name,created,start,end,error):
+        self.name=name
+        self.created=created
+        self.start=start
+        self.end=end
+        self.error=error
+
+
+
+class _Quota(object):
+    # token bucket (burst of one second of requests)
+    def __init__(self,rate):
+        self.rate=rate
+        self.tokens=rate
+        self.updated=time.time()
+
+
+    def take(self):
+        now=time.time()
+        self.tokens=min(self.tokens+(now-self.updated)*self.rate,self.rate)
+        self.updated=now
+        if self.tokens>=1:
+            self.tokens-=1
+            return True
+        return False
+
+
+
+#
+# INTERNAL
+#
+def _sampler(spec):
+    if callable(spec):
+        return spec
+    elif isinstance(spec,(tuple,list)):
+        low,high=spec
+        return lambda rng: rng.uniform(low,high)
+    elif spec is not None:
+        return lambda rng: spec
+
+
+def _millis(seconds):
+    return int(seconds*1000)
+
+
+def _asset_name(name):
+    """ full asset name (projects/earthengine-legacy/assets/...) """
+    if not re.search(r'^projects/',name):
+        name=f'{ASSET_ROOT}/{name}'
+    return name
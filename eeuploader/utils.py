@@ -1,4 +1,5 @@
 from pathlib import Path, PurePath
+import gzip
 import json
 import geojson
 import yaml
@@ -43,6 +44,20 @@ def read_json(path,*key_path,is_geo=False,mode='r'):
     return _obj(jsn,key_path)
 
 
+def read_jsonl(path):
+    """ stream objects from a json-lines file (gzipped if path ends with .gz)
+
+    Args: 
+        - path<str>: path to jsonl file
+
+    Yields: one object per (non-empty) line
+    """
+    with open_file(path,'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
 def read_yaml(path,*key_path,mode='rb'):
     """ read yaml file
     Args: 
@@ -79,6 +94,24 @@ def save_json(obj,path,indent=4,sort_keys=False,mkdirs=True,mode='w'):
         json.dump(obj,file,indent=indent,sort_keys=sort_keys)
 
 
+def save_jsonl(objs,path,mkdirs=True,mode='w'):
+    """ save objects to a json-lines file (gzipped if path ends with .gz)
+
+    objects are written one line at a time as they are pulled from `objs`
+
+    Returns<int>: number of objects written
+    """ 
+    if mkdirs:
+        ensure_dir(path)
+    count=0
+    with open_file(path,mode) as file:
+        for obj in objs:
+            file.write(json.dumps(obj))
+            file.write('\n')
+            count+=1
+    return count
+
+
 def save_yaml(obj,path,mkdirs=True,mode='w+'):
     """ save object to yaml file
     """ 
@@ -97,6 +130,14 @@ def save_pickle(obj,path,mkdirs=True,mode='wb',protocol=pickle.HIGHEST_PROTOCOL)
         pickle.dump(obj,file,protocol=protocol)
 
 
+def open_file(path,mode='r'):
+    """ open a (text) file, gzipped if path ends with .gz """
+    if str(path).endswith('.gz'):
+        return gzip.open(path,f'{mode}t')
+    else:
+        return open(path,mode)
+
+
 #
 # INTERNAL
 #
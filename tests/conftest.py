@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+import eeuploader.image as eeup
+import eeuploader.simulator as sim
+#
+# CONSTANTS
+#
+USER='test'
+COLLECTION='tests'
+ASSET_ROOT='projects/earthengine-legacy/assets'
+POLLING={
+    'initial': 0.02,
+    'maximum': 0.1 }
+ENGINES=[
+    'threads',
+    'pipelined',
+    'async' ]
+
+
+
+#
+# HELPERS
+#
+def asset_name(i):
+    return f'{ASSET_ROOT}/users/{USER}/{COLLECTION}/img{i}'
+
+
+def manifests(n):
+    return [
+        { 'name': asset_name(i), 'tilesets': [], 'properties': { 'i': i } }
+        for i in range(n) ]
+
+
+def uploader(**kwargs):
+    upkwargs={
+        'features': None,
+        'collection': COLLECTION,
+        'skip_existing': False,
+        'polling': POLLING,
+        'rate_limit': False,
+        'retry': False }
+    upkwargs.update(kwargs)
+    return eeup.EEImagesUp(USER,**upkwargs)
+
+
+def upload(up,engine,**kwargs):
+    """ run upload_collection with `engine` and return the results """
+    if engine=='async':
+        asyncio.run(up.upload_collection_async(max_in_flight=4,**kwargs))
+    elif engine=='pipelined':
+        up.upload_collection(nb_batches=2,max_in_flight=4,**kwargs)
+    else:
+        up.upload_collection(nb_batches=4,**kwargs)
+    return up.tasks
+
+
+
+#
+# FIXTURES
+#
+@pytest.fixture
+def simulate():
+    """ simulate(**SimulatedBackend kwargs): the current backend for the test """
+    contexts=[]
+    def _simulate(**kwargs):
+        kwargs.setdefault('latency',0)
+        kwargs.setdefault('ingestion_time',0.01)
+        context=sim.simulate(**kwargs)
+        contexts.append(context)
+        return context.__enter__()
+    yield _simulate
+    for context in reversed(contexts):
+        context.__exit__(None,None,None)
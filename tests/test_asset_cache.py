@@ -0,0 +1,127 @@
+import gzip
+import shutil
+import pytest
+import eeuploader.asset_cache as uasset_cache
+import eeuploader.simulator as sim
+from conftest import ENGINES, USER, COLLECTION, ASSET_ROOT, asset_name, manifests, uploader, upload
+#
+# CONSTANTS
+#
+TTL=60
+
+
+
+#
+# HELPERS
+#
+def cache(directory,collection=COLLECTION,**kwargs):
+    return uasset_cache.AssetCache(
+        f'users/{USER}',
+        collection=collection,
+        directory=str(directory),
+        **kwargs)
+
+
+def nb_listings(backend):
+    return backend.rpcs.get(sim.LIST_ASSETS,0)
+
+
+def names(indices):
+    return { asset_name(i) for i in indices }
+
+
+
+#
+# TESTS
+#
+def test_cache_hit(simulate,tmp_path):
+    backend=simulate(assets=names(range(5)))
+    assert cache(tmp_path).load()==names(range(5))
+    assert nb_listings(backend)==1
+    assert cache(tmp_path).load()==names(range(5))
+    assert nb_listings(backend)==1
+
+
+def test_ttl_expiry(simulate,tmp_path,monkeypatch):
+    backend=simulate(assets=names(range(5)))
+    cache(tmp_path,ttl=TTL).load()
+    backend.assets.add(asset_name(5))
+    now=uasset_cache.time.time()
+    monkeypatch.setattr(uasset_cache.time,'time',lambda: now+TTL/2)
+    assert cache(tmp_path,ttl=TTL).load()==names(range(5))
+    assert nb_listings(backend)==1
+    monkeypatch.setattr(uasset_cache.time,'time',lambda: now+2*TTL)
+    assert cache(tmp_path,ttl=None).load()==names(range(5))
+    assert nb_listings(backend)==1
+    assert cache(tmp_path,ttl=TTL).load()==names(range(6))
+    assert nb_listings(backend)==2
+
+
+def test_refresh_assets(simulate,tmp_path):
+    backend=simulate(assets=names(range(5)))
+    up=uploader(skip_existing=True,asset_cache=str(tmp_path))
+    assert up.existing_assets==names(range(5))
+    backend.assets.add(asset_name(5))
+    up=uploader(skip_existing=True,asset_cache=str(tmp_path))
+    assert up.existing_assets==names(range(5))
+    assert nb_listings(backend)==1
+    up=uploader(skip_existing=True,asset_cache=str(tmp_path),refresh_assets=True)
+    assert up.existing_assets==names(range(6))
+    assert nb_listings(backend)==2
+    # the forced listing rewrote the cache
+    assert cache(tmp_path).load()==names(range(6))
+    assert nb_listings(backend)==2
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_uploads_merged_into_cache(simulate,tmp_path,engine):
+    # img0-4 exist: img5-7 are uploaded, added to the cache and flushed
+    backend=simulate(assets=names(range(5)))
+    up=uploader(skip_existing=True,asset_cache=str(tmp_path))
+    tasks=upload(up,engine,manifests=manifests(8))
+    assert sum(1 for t in tasks if t.state=='COMPLETED')==3
+    backend.rpcs.clear()
+    up=uploader(skip_existing=True,asset_cache=str(tmp_path))
+    assert up.existing_assets==names(range(8))
+    assert nb_listings(backend)==0
+
+
+def test_add_flush(simulate,tmp_path):
+    backend=simulate(assets=names(range(2)))
+    assets=cache(tmp_path)
+    assets.load()
+    assets.add(asset_name(2))
+    assets.add(asset_name(2))
+    assets.add(f'{ASSET_ROOT}/users/{USER}/other/img0')
+    assets.flush()
+    assets.flush()
+    with gzip.open(assets.path,'rt') as file:
+        lines=file.read().splitlines()
+    assert len(lines)==1+4
+    expected=names(range(3))|{ f'{ASSET_ROOT}/users/{USER}/other/img0' }
+    assert cache(tmp_path).load()==expected
+    assert nb_listings(backend)==1
+
+
+def test_readonly_never_writes(simulate,tmp_path):
+    simulate(assets=names(range(2)))
+    cache(tmp_path).load()
+    readonly=cache(tmp_path,readonly=True)
+    readonly.load()
+    readonly.add(asset_name(2))
+    readonly.flush()
+    readonly.refresh()
+    assert cache(tmp_path).load()==names(range(2))
+
+
+def test_parent_mismatch(simulate,tmp_path):
+    # a cache file with the header of another parent is re-listed
+    backend=simulate(assets=names(range(3))|{ f'{ASSET_ROOT}/users/{USER}/other/img0' })
+    tests=cache(tmp_path)
+    tests.load()
+    other=cache(tmp_path,collection='other')
+    shutil.copy(tests.path,other.path)
+    assert other.load()=={ f'{ASSET_ROOT}/users/{USER}/other/img0' }
+    assert nb_listings(backend)==2
+    with gzip.open(other.path,'rt') as file:
+        assert other.parent in file.readline()
@@ -0,0 +1,33 @@
+from click.testing import CliRunner
+import eeuploader.cli as cli
+
+
+
+#
+# TESTS
+#
+def test_args_kwargs():
+    args,kwargs=cli._args_kwargs([
+        'upargs.yaml',
+        'collection=no',
+        'user=012',
+        'start_time=2020-01-01',
+        'asset_cache=true',
+        'asset_cache_ttl=3600',
+        'rate_limit={submit_rate: 5, status_rate: 2}' ])
+    assert args==['upargs.yaml']
+    assert kwargs=={
+        'collection': 'no',
+        'user': '012',
+        'start_time': '2020-01-01',
+        'asset_cache': True,
+        'asset_cache_ttl': 3600,
+        'rate_limit': { 'submit_rate': 5, 'status_rate': 2 } }
+
+
+def test_manifests_with_feature_collection(tmp_path):
+    runner=CliRunner()
+    for args in [['fc.geojson','upargs.yaml'],['fc.geojson','user=test']]:
+        result=runner.invoke(cli.upload,['--manifests','manifests.jsonl']+args)
+        assert result.exit_code==2
+        assert 'can not be used with --manifests' in result.output
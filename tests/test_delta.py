@@ -0,0 +1,73 @@
+import pytest
+import eeuploader.delta as udelta
+import eeuploader.simulator as sim
+from conftest import ENGINES, asset_name, manifests, uploader, upload
+
+
+
+#
+# HELPERS
+#
+def changed_manifests():
+    """ img0: unchanged, img1: metadata, img2: source, img3: new """
+    mans=manifests(4)
+    mans[1]['properties']={ 'i': 1, 'cloud_cover': 0.5 }
+    mans[2]['pyramiding_policy']='MODE'
+    return mans
+
+
+def states(tasks):
+    return { t.name: t.state for t in tasks }
+
+
+
+#
+# TESTS
+#
+def test_changes(tmp_path):
+    fingerprints=udelta.Fingerprints(str(tmp_path/'fingerprints.jsonl'))
+    for manifest in manifests(3):
+        fingerprints.record(manifest)
+    fingerprints.close()
+    fingerprints=udelta.Fingerprints(str(tmp_path/'fingerprints.jsonl'))
+    assert [fingerprints.change(m) for m in changed_manifests()]==[
+        udelta.UNCHANGED,
+        udelta.METADATA,
+        udelta.SOURCE,
+        udelta.NEW ]
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_delta_upload(simulate,tmp_path,engine):
+    backend=simulate()
+    path=str(tmp_path/'fingerprints.jsonl')
+    tasks=upload(uploader(delta=path),engine,manifests=manifests(3))
+    assert set(states(tasks).values())=={'COMPLETED'}
+    backend.rpcs.clear()
+    tasks=upload(uploader(delta=path),engine,manifests=changed_manifests())
+    assert states(tasks)=={
+        asset_name(0): 'SKIPPED',
+        asset_name(1): 'UPDATED',
+        asset_name(2): 'COMPLETED',
+        asset_name(3): 'COMPLETED' }
+    assert list(backend.updates)==[asset_name(1)]
+    assert backend.rpcs[sim.START_INGESTION]==2
+    # everything is recorded: a third run skips every image
+    tasks=upload(uploader(delta=path),engine,manifests=changed_manifests())
+    assert set(states(tasks).values())=={'SKIPPED'}
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_update_of_deleted_asset(simulate,tmp_path,engine):
+    # updateAsset raises NOT_FOUND for img1: it is re-ingested instead
+    backend=simulate()
+    path=str(tmp_path/'fingerprints.jsonl')
+    upload(uploader(delta=path),engine,manifests=manifests(2))
+    backend.tasks.clear()
+    backend.assets.discard(asset_name(1))
+    tasks=upload(uploader(delta=path),engine,manifests=changed_manifests()[:2])
+    assert states(tasks)=={
+        asset_name(0): 'SKIPPED',
+        asset_name(1): 'COMPLETED' }
+    assert backend.rpcs[sim.UPDATE_ASSET]==1
+    assert asset_name(1) in backend.assets
@@ -0,0 +1,66 @@
+import pytest
+import ee.ee_exception
+import eeuploader.journal as ujournal
+import eeuploader.retry as uretry
+import eeuploader.results as uresults
+import eeuploader.simulator as sim
+from conftest import ENGINES, asset_name, manifests, uploader, upload
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_permanent_request_error(simulate,engine):
+    # startIngestion raises "already exists" for img3: the run goes on
+    simulate(assets=[asset_name(3)])
+    tasks=upload(uploader(),engine,manifests=manifests(10))
+    assert len(tasks)==10
+    states={ t.name: t.state for t in tasks }
+    assert states.pop(asset_name(3))=='FAILED'
+    assert set(states.values())=={'COMPLETED'}
+    failed=uresults.failed(tasks)
+    assert [f.error_class for f in failed]==[uretry.EXISTS]
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_permanent_request_error_raise_error(simulate,engine):
+    simulate(assets=[asset_name(3)])
+    with pytest.raises(ee.ee_exception.EEException):
+        upload(uploader(raise_error=True),engine,manifests=manifests(10))
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_transient_errors_retried(simulate,engine):
+    backend=simulate(failure_rate=0.3,seed=1)
+    retry={ 'retries': 20, 'initial': 0.01, 'maximum': 0.02 }
+    tasks=upload(uploader(retry=retry),engine,manifests=manifests(20))
+    assert uresults.state_counts(tasks)=={ 'COMPLETED': 20 }
+    assert uresults.nb_retried(tasks)>0
+    assert backend.rpcs[sim.START_INGESTION]==20+sum(t.retries for t in tasks)
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_bad_source_not_retried(simulate,engine):
+    backend=simulate(bad_source_rate=1)
+    retry={ 'retries': 5, 'initial': 0.01, 'maximum': 0.02 }
+    tasks=upload(uploader(retry=retry),engine,manifests=manifests(5))
+    assert [t.error_class for t in tasks]==[uretry.BAD_SOURCE]*5
+    assert uresults.nb_retried(tasks)==0
+    assert backend.rpcs[sim.START_INGESTION]==5
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_record_error_kept_on_result(simulate,tmp_path,monkeypatch,engine):
+    # the journal write fails for img3: the slot is released and the run ends
+    simulate()
+    finished=ujournal.Journal.finished
+    def _finished(self,manifest,status):
+        if manifest['name']==asset_name(3):
+            raise OSError('disk full')
+        return finished(self,manifest,status)
+    monkeypatch.setattr(ujournal.Journal,'finished',_finished)
+    up=uploader(journal=str(tmp_path/'run.jsonl'))
+    tasks=upload(up,engine,manifests=manifests(12))
+    assert len(tasks)==12
+    results={ t.name: t for t in tasks }
+    assert results[asset_name(3)].error_class==uretry.UNKNOWN
+    assert 'disk full' in results[asset_name(3)].error_message
+    assert sum(1 for t in tasks if t.error_message)==1
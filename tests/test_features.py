@@ -0,0 +1,42 @@
+import json
+import eeuploader.features as ufeatures
+
+
+
+#
+# HELPERS
+#
+def features(n):
+    return [
+        {
+            'type': 'Feature',
+            'properties': { 'gcs': f'gs://bucket/img{i}.tif', 'name': f'é{i}' },
+            'geometry': None }
+        for i in range(n) ]
+
+
+def write_crlf(path,feats):
+    # pretty-printed (multi-line) geojson with windows line endings
+    text=json.dumps({ 'type': 'FeatureCollection', 'features': feats },indent=2,ensure_ascii=False)
+    with open(path,'wb') as file:
+        file.write(text.replace('\n','\r\n').encode('utf-8'))
+
+
+
+#
+# TESTS
+#
+def test_index_crlf(tmp_path):
+    path=str(tmp_path/'fc.geojson')
+    feats=features(20)
+    write_crlf(path,feats)
+    index=ufeatures.FeatureIndex(path)
+    assert len(index)==20
+    assert index.read([19,0,7])==[feats[19],feats[0],feats[7]]
+
+
+def test_stream_crlf(tmp_path):
+    path=str(tmp_path/'fc.geojson')
+    feats=features(5)
+    write_crlf(path,feats)
+    assert list(ufeatures.iter_features(path))==feats
@@ -0,0 +1,63 @@
+import pytest
+import eeuploader.journal as ujournal
+import eeuploader.simulator as sim
+from conftest import ENGINES, asset_name, manifests, uploader, upload
+
+
+
+#
+# HELPERS
+#
+def states(tasks):
+    return { t.name: t.state for t in tasks }
+
+
+
+#
+# TESTS
+#
+@pytest.mark.parametrize('engine',ENGINES)
+def test_resume(simulate,tmp_path,engine):
+    # img3 fails (asset exists) then succeeds once the asset is deleted
+    backend=simulate(assets=[asset_name(3)])
+    path=str(tmp_path/'run.jsonl')
+    tasks=upload(uploader(journal=path),engine,manifests=manifests(6))
+    assert states(tasks)[asset_name(3)]=='FAILED'
+    backend.assets.discard(asset_name(3))
+    backend.rpcs.clear()
+    tasks=upload(uploader(journal=path),engine,manifests=manifests(6))
+    expected={ asset_name(i): ujournal.SKIPPED for i in range(6) }
+    expected[asset_name(3)]='COMPLETED'
+    assert states(tasks)==expected
+    assert backend.rpcs[sim.START_INGESTION]==1
+    assert ujournal.Journal(path).states()=={ 'COMPLETED': 6 }
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_resume_reattaches_in_flight_tasks(simulate,tmp_path,engine):
+    # a task submitted by an interrupted run is waited for, not resubmitted
+    backend=simulate()
+    path=str(tmp_path/'run.jsonl')
+    manifest=manifests(1)[0]
+    task_id=backend.new_task_id()[0]
+    backend.start_ingestion(task_id,manifest)
+    journal=ujournal.Journal(path)
+    journal.submitted(manifest,task_id)
+    journal.close()
+    tasks=upload(uploader(journal=path),engine,manifests=[manifest])
+    assert [(t.task_id,t.state) for t in tasks]==[(task_id,'COMPLETED')]
+    assert backend.rpcs[sim.START_INGESTION]==1
+
+
+def test_partial_line(tmp_path):
+    # a record cut by a crash is skipped, and the next record starts on a new line
+    path=str(tmp_path/'run.jsonl')
+    journal=ujournal.Journal(path)
+    journal.write(manifests(1)[0],ujournal.SUBMITTED,task_id='A')
+    journal.close()
+    with open(path,'a') as file:
+        file.write('{"name": "trunc')
+    journal=ujournal.Journal(path)
+    journal.write(manifests(2)[1],ujournal.SUBMITTED,task_id='B')
+    journal.close()
+    assert sorted(ujournal.Journal(path).records)==[asset_name(0),asset_name(1)]
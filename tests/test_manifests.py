@@ -0,0 +1,68 @@
+import pytest
+import eeuploader.image as eeup
+import eeuploader.manifests as umanifests
+from conftest import USER, COLLECTION
+
+
+
+#
+# HELPERS
+#
+def features(n):
+    return [
+        {
+            'type': 'Feature',
+            'properties': {
+                'gcs': f'gs://bucket/images/img{i}.tif',
+                'date': ['2019-08-12','2020-01-01'][i%2],
+                'crs': 'epsg:32720',
+                'biome': 'forêt' if i%3 else 'savanna' } }
+        for i in range(n) ]
+
+
+def uploader(n):
+    return eeup.EEImagesUp(
+        USER,
+        features=features(n),
+        collection=COLLECTION,
+        start_time_key='date',
+        days_delta=1)
+
+
+
+#
+# TESTS
+#
+@pytest.mark.parametrize('save_as,ext',[(eeup.JSONL,'jsonl'),(eeup.JSONL,'jsonl.gz'),(eeup.JSON,'json')])
+def test_parallel_text_output_identical(tmp_path,save_as,ext):
+    up=uploader(250)
+    bulk=up.manifest(features=True,dest=str(tmp_path/f'bulk.{ext}'),save_as=save_as)
+    parallel=up.manifest(
+        features=True,
+        dest=str(tmp_path/f'parallel.{ext}'),
+        save_as=save_as,
+        nb_processes=2,
+        chunk_size=40)
+    assert list(umanifests.read_manifests(parallel))==list(umanifests.read_manifests(bulk))
+    if not ext.endswith('.gz'):
+        assert open(parallel).read()==open(bulk).read()
+
+
+def test_parallel_manifests_identical():
+    up=uploader(120)
+    assert up.manifest(features=True,nb_processes=2,chunk_size=25)==up.manifest(features=True,bulk=False)
+
+
+def test_bulk_caches_bounded(monkeypatch):
+    # every feature has its own uri and non-ascii value: the caches stay bounded
+    monkeypatch.setattr(umanifests,'MEMO_SIZE',100)
+    up=uploader(1)
+    feats=[
+        { 'properties': { 'gcs': f'gs://bucket/img{i}.tif', 'date': '2020-01-01', 'note': f'é{i}' } }
+        for i in range(1000) ]
+    bulk=umanifests.BulkManifests(up,batch_size=50)
+    mans=list(bulk.manifests(iter(feats)))
+    assert mans==[up.manifest(f) for f in feats]
+    assert bulk._unidecode.cache_info().currsize==100
+    assert bulk._times.cache_info().currsize==1
+    assert len(bulk._keys)==3
@@ -0,0 +1,101 @@
+import csv
+import json
+import pytest
+import eeuploader.metrics as umetrics
+import eeuploader.simulator as sim
+from conftest import ENGINES, asset_name, manifests, uploader, upload
+#
+# CONSTANTS
+#
+NB_UPLOADS=20
+INGESTION_TIME=0.01
+# metrics endpoint: simulator endpoint
+ENDPOINTS={
+    umetrics.LIST_ASSETS_RPC: sim.LIST_ASSETS,
+    umetrics.NEW_TASK_ID: sim.NEW_TASK_ID,
+    umetrics.START_INGESTION: sim.START_INGESTION,
+    umetrics.GET_TASK_STATUS: sim.GET_TASK_STATUS }
+
+
+
+#
+# TESTS
+#
+def test_summary_percentiles():
+    metrics=umetrics.Metrics()
+    for seconds in reversed(range(1,101)):
+        metrics.record(umetrics.SUBMIT,seconds)
+    metrics.record(umetrics.POLL,0.5)
+    summary=metrics.summary()
+    assert set(summary)=={ umetrics.SUBMIT, umetrics.POLL }
+    assert summary[umetrics.SUBMIT]=={
+        'count': 100,
+        'total': 5050,
+        'mean': 50.5,
+        'p50': 50,
+        'p90': 90,
+        'p99': 99,
+        'max': 100 }
+    assert set(summary[umetrics.POLL].values())=={ 1, 0.5 }
+
+
+def test_record_status():
+    metrics=umetrics.Metrics()
+    metrics.record_status({
+        'creation_timestamp_ms': '1000',
+        'start_timestamp_ms': '3500',
+        'update_timestamp_ms': '4000' })
+    metrics.record_status({ 'creation_timestamp_ms': '1000' })
+    summary=metrics.summary()
+    assert summary[umetrics.QUEUE]['total']==2.5
+    assert summary[umetrics.RUN]['total']==0.5
+    assert summary[umetrics.QUEUE]['count']==1
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_simulated_run(simulate,engine):
+    # img0 exists: NB_UPLOADS-1 uploads
+    backend=simulate(ingestion_time=INGESTION_TIME,assets=[asset_name(0)])
+    up=uploader(skip_existing=True,task_id_block=10)
+    upload(up,engine,manifests=manifests(NB_UPLOADS))
+    summary=up.metrics.summary()
+    counts={ p: s['count'] for p,s in summary.items() }
+    assert counts[umetrics.LIST_ASSETS]==1
+    assert counts[umetrics.EXISTS]==NB_UPLOADS
+    for phase in [umetrics.TASK_ID,umetrics.SUBMIT,umetrics.QUEUE,umetrics.RUN]:
+        assert counts[phase]==NB_UPLOADS-1
+    assert 1<=counts[umetrics.POLL]<=backend.rpcs[sim.GET_TASK_STATUS]
+    run=summary[umetrics.RUN]
+    assert INGESTION_TIME/2<=run['p50']<=run['p90']<=run['p99']<=run['max']
+    assert run['p50']<=4*INGESTION_TIME
+    for endpoint,sim_endpoint in ENDPOINTS.items():
+        assert up.metrics.rpcs[endpoint]==backend.rpcs[sim_endpoint]
+    assert up.metrics.rpcs[umetrics.START_INGESTION]==NB_UPLOADS-1
+    up.metrics.reset()
+    assert up.metrics.summary()=={}
+    assert up.metrics.rpcs=={}
+
+
+def test_save(simulate,tmp_path):
+    simulate(ingestion_time=INGESTION_TIME)
+    up=uploader()
+    upload(up,'threads',manifests=manifests(5))
+    metrics=up.metrics
+    path=str(tmp_path/'out'/'metrics.json')
+    assert metrics.save(path)==path
+    with open(path) as file:
+        saved=json.load(file)
+    assert saved=={ 'phases': metrics.summary(), 'rpcs': metrics.rpcs }
+    path=str(tmp_path/'out'/'metrics.csv')
+    metrics.save(path)
+    with open(path,newline='') as file:
+        rows=list(csv.reader(file))
+    assert rows[0]==['phase']+umetrics.SUMMARY_FIELDS
+    phases={ r[0]: r[1:] for r in rows[1:] if not r[0].startswith('rpc:') }
+    rpcs={ r[0][len('rpc:'):]: int(r[1]) for r in rows[1:] if r[0].startswith('rpc:') }
+    assert set(phases)==set(metrics.summary())
+    submit=metrics.summary()[umetrics.SUBMIT]
+    assert [float(v) for v in phases[umetrics.SUBMIT]]==pytest.approx(
+        [submit[f] for f in umetrics.SUMMARY_FIELDS])
+    assert rpcs==metrics.rpcs
+    assert rpcs[umetrics.START_INGESTION]==5
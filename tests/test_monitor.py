@@ -0,0 +1,65 @@
+import time
+import pytest
+import eeuploader.gee_utils as gutils
+import eeuploader.simulator as sim
+import eeuploader.backend as ubackend
+import eeuploader.metrics as umetrics
+from conftest import ENGINES, POLLING, manifests, uploader, upload
+
+
+
+#
+# HELPERS
+#
+class FailingStatusBackend(sim.SimulatedBackend):
+    """ simulator whose status requests always fail """
+    def get_task_status(self,task_ids):
+        self._request(sim.GET_TASK_STATUS)
+        raise ConnectionError('status service unavailable')
+
+
+
+#
+# TESTS
+#
+@pytest.mark.parametrize('engine',ENGINES)
+def test_timeout_while_polls_fail(engine):
+    with ubackend.use_backend(FailingStatusBackend(latency=0)):
+        up=uploader(timeout=0.5,polling={'initial': 0.05,'maximum': 0.05,'factor': 1})
+        start=time.time()
+        tasks=upload(up,engine,manifests=manifests(4))
+    assert time.time()-start<5
+    assert len(tasks)==4
+    assert {t.state for t in tasks}=={'TIMEOUT'}
+
+
+def test_outstanding_tasks_given_up_after_poll_failures():
+    with ubackend.use_backend(FailingStatusBackend(latency=0)) as backend:
+        monitor=gutils.TaskMonitor(
+            60,
+            polling=POLLING,
+            raise_error=True,
+            max_poll_failures=3).start()
+        status=monitor.wait(backend.new_task_id()[0])
+        monitor.stop()
+    assert 'TIMEOUT' in status
+    assert status['error_message']=='status service unavailable'
+    assert isinstance(monitor.error,ConnectionError)
+    assert backend.rpcs[sim.GET_TASK_STATUS]==3
+
+
+def test_status_requests_counted_per_task_id(simulate):
+    backend=simulate(ingestion_time=0.05)
+    metrics=umetrics.Metrics()
+    task_ids=backend.new_task_id(25)
+    for task_id,manifest in zip(task_ids,manifests(25)):
+        backend.start_ingestion(task_id,manifest)
+    backend.rpcs.clear()
+    monitor=gutils.TaskMonitor(60,polling=POLLING,chunk_size=4,metrics=metrics).start()
+    statuses=[]
+    for task_id in task_ids:
+        monitor.add(task_id,statuses.append)
+    monitor.stop()
+    assert {s['state'] for s in statuses}=={'COMPLETED'}
+    assert backend.rpcs[sim.GET_TASK_STATUS]>=25
+    assert metrics.rpcs[umetrics.GET_TASK_STATUS]==backend.rpcs[sim.GET_TASK_STATUS]
@@ -0,0 +1,106 @@
+import random
+import pytest
+import eeuploader.gee_utils as gutils
+from conftest import manifests
+#
+# CONSTANTS
+#
+SEED=7
+
+
+
+#
+# HELPERS
+#
+class RecordingPolicy(gutils.PollingPolicy):
+    """ polling policy recording the nb_polls of each interval """
+    def __init__(self,**kwargs):
+        super().__init__(**kwargs)
+        self.nb_polls=[]
+
+
+    def interval(self,elapsed,nb_polls=0):
+        self.nb_polls.append(nb_polls)
+        return super().interval(elapsed,nb_polls)
+
+
+def intervals(policy,nb,elapsed=0):
+    return [policy.interval(elapsed,n) for n in range(nb)]
+
+
+
+#
+# TESTS
+#
+def test_exponential_backoff():
+    policy=gutils.PollingPolicy(initial=1,maximum=1000,factor=2,jitter=0)
+    assert intervals(policy,6)==[1,2,4,8,16,32]
+
+
+def test_jitter_seeded():
+    policy=gutils.PollingPolicy(initial=1,maximum=1000,factor=2,jitter=0.1)
+    random.seed(SEED)
+    first=intervals(policy,8)
+    random.seed(SEED)
+    assert intervals(policy,8)==first
+    for n,interval in enumerate(first):
+        assert 0.9*2**n<=interval<=1.1*2**n
+    assert len(set(policy.interval(0) for _ in range(10)))>1
+
+
+def test_capped_at_maximum():
+    random.seed(SEED)
+    policy=gutils.PollingPolicy(initial=1,maximum=10,factor=2,jitter=0.1)
+    backoff=intervals(policy,20)
+    assert max(backoff)<=10*1.1
+    assert all(9<=i<=11 for i in backoff[4:])
+    fixed=gutils.PollingPolicy.fixed(5)
+    assert set(intervals(fixed,10))=={ 5 }
+
+
+def test_median_ingestion_hint():
+    policy=gutils.PollingPolicy(initial=1,maximum=60,factor=2,jitter=0,history=3)
+    assert policy.median() is None
+    for duration in [100,10,20,30]:
+        policy.record(duration)
+    # history of 3: 100 is dropped
+    assert policy.median()==20
+    # younger tasks are next checked at the expected completion time
+    assert policy.interval(5,nb_polls=3)==15
+    # but no sooner than `initial`
+    assert policy.interval(19.5,nb_polls=3)==1
+    # older tasks back off
+    assert policy.interval(25,nb_polls=3)==8
+    policy=gutils.PollingPolicy(initial=1,maximum=60,factor=2,jitter=0,history=0)
+    policy.record(20)
+    assert policy.median() is None
+    assert policy.interval(5,nb_polls=3)==8
+
+
+def test_reset_on_state_change(simulate):
+    # img1 waits (READY) for img0 to finish, then runs (RUNNING)
+    backend=simulate(max_running=1,ingestion_time=0.3)
+    task_ids=backend.new_task_id(2)
+    for task_id,manifest in zip(task_ids,manifests(2)):
+        backend.start_ingestion(task_id,manifest)
+    policy=RecordingPolicy(initial=0.02,maximum=0.04,jitter=0,history=0)
+    status=gutils.wait(task_ids[1],10,noisy=False,polling=policy)
+    assert status['state']=='COMPLETED'
+    polls=policy.nb_polls
+    resets=[i for i,n in enumerate(polls) if (i>0) and (n==0)]
+    assert polls[0]==0
+    assert len(resets)==1
+    assert polls[1:resets[0]]==list(range(1,resets[0]))
+    assert polls[resets[0]:]==list(range(len(polls)-resets[0]))
+
+
+@pytest.mark.parametrize('polling,expected',[
+    (None,(gutils.POLL_INITIAL,gutils.POLL_MAX,gutils.POLL_FACTOR)),
+    (gutils.ADAPTIVE,(gutils.POLL_INITIAL,gutils.POLL_MAX,gutils.POLL_FACTOR)),
+    (5,(5,5,1)),
+    ('2.5',(2.5,2.5,1)),
+    ({ 'initial': 2, 'maximum': 20 },(2,20,gutils.POLL_FACTOR)) ])
+def test_polling_policy(polling,expected):
+    policy=gutils.polling_policy(polling)
+    assert (policy.initial,policy.maximum,policy.factor)==expected
+    assert gutils.polling_policy(policy) is policy
@@ -0,0 +1,138 @@
+import os
+import json
+from datetime import datetime
+import pytest
+import eeuploader.progress as uprogress
+import eeuploader.results as uresults
+#
+# CONSTANTS
+#
+START=1_000_000
+
+
+
+#
+# HELPERS
+#
+class Clock(object):
+    """ fake clock of the progress module """
+    def __init__(self,now=START):
+        self.now=now
+
+
+    def __call__(self):
+        return self.now
+
+
+def result(i,state=uprogress.COMPLETED):
+    return uresults.UploadResult(f'img{i}',task_id=f'T{i}',state=state)
+
+
+
+#
+# FIXTURES
+#
+@pytest.fixture
+def clock(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(uprogress.time,'time',clock)
+    return clock
+
+
+
+#
+# TESTS
+#
+def test_stop_never_raises(tmp_path):
+    # the snapshot can not be written (its directory is a file): stop reports and returns
+    blocker=tmp_path/'blocker'
+    blocker.write_text('')
+    progress=uprogress.Progress(total=1,path=str(blocker/'progress.json'),interval=60,noisy=False)
+    progress.start()
+    progress.stop()
+    assert not os.path.exists(blocker/'progress.json')
+
+
+def test_snapshot_counts(clock):
+    progress=uprogress.Progress(total=6,noisy=False)
+    progress.start_time=clock.now
+    for i in range(5):
+        progress.submitted()
+    for i in range(4):
+        progress.on_state(f'T{i}','READY')
+    for i in range(3):
+        progress.on_state(f'T{i}',uprogress.RUNNING)
+    progress.finished(result(0,uprogress.COMPLETED))
+    progress.finished(result(1,'FAILED'))
+    progress.finished(result(4,uprogress.SKIPPED))
+    snapshot=progress.snapshot()
+    assert snapshot['submitted']==5
+    assert snapshot['running']==1
+    assert snapshot['finished']==3
+    assert snapshot['completed']==1
+    assert snapshot['failed']==1
+    assert snapshot['states']=={ 'COMPLETED': 1, 'FAILED': 1, 'SKIPPED': 1 }
+
+
+def test_sliding_window_rate(clock):
+    progress=uprogress.Progress(total=100,window=60,noisy=False)
+    progress.start_time=clock.now
+    # 10 uploads in the first 10 seconds: rate over the elapsed time
+    for i in range(10):
+        clock.now+=1
+        progress.finished(result(i))
+    assert progress.snapshot()['per_minute']==60
+    # 20 more over the next 50 seconds: 30 in the window
+    for i in range(10,30):
+        clock.now+=2.5
+        progress.finished(result(i))
+    assert progress.snapshot()['per_minute']==30
+    # 30 seconds later only the last 13 (finished at 30s or later) are in the window
+    clock.now+=30
+    assert progress.snapshot()['per_minute']==13
+    # nothing finished in the last window
+    clock.now+=60
+    snapshot=progress.snapshot()
+    assert snapshot['per_minute']==0
+    assert snapshot['finished']==30
+
+
+def test_eta(clock):
+    progress=uprogress.Progress(total=100,window=60,noisy=False)
+    progress.start_time=clock.now
+    for i in range(30):
+        clock.now+=2
+        progress.finished(result(i))
+    # 30 per minute, 70 left
+    snapshot=progress.snapshot()
+    assert snapshot['eta_seconds']==140
+    assert snapshot['eta']==datetime.fromtimestamp(clock.now+140).strftime(uprogress.TS_FMT)
+    assert '(0:02:20)' in uprogress._line(snapshot)
+    progress.total=30
+    assert progress.snapshot()['eta_seconds']==0
+    progress.total=None
+    snapshot=progress.snapshot()
+    assert (snapshot['eta_seconds'],snapshot['eta'])==(None,None)
+
+
+def test_atomic_snapshot_write(clock,tmp_path,monkeypatch):
+    path=str(tmp_path/'progress.json')
+    progress=uprogress.Progress(total=2,path=path,noisy=False)
+    progress.start_time=clock.now
+    progress.submitted()
+    replaced=[]
+    replace=os.replace
+    def _replace(src,dst):
+        # the snapshot is complete before it replaces the file
+        with open(src) as file:
+            replaced.append((src,dst,json.load(file)))
+        return replace(src,dst)
+    monkeypatch.setattr(uprogress.os,'replace',_replace)
+    snapshot=progress.report()
+    progress.finished(result(0))
+    progress.report()
+    assert [(s.endswith('.tmp'),d) for s,d,_ in replaced]==[(True,path)]*2
+    assert replaced[0][2]==snapshot
+    with open(path) as file:
+        assert json.load(file)['finished']==1
+    assert os.listdir(tmp_path)==['progress.json']
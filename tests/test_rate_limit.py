@@ -0,0 +1,19 @@
+import eeuploader.image as eeup
+import eeuploader.rate_limit as urate_limit
+from conftest import USER, COLLECTION
+
+
+
+#
+# TESTS
+#
+def test_opt_in():
+    assert eeup.EEImagesUp(USER,features=None,collection=COLLECTION).rate_limiter is None
+    assert urate_limit.rate_limiter(None) is None
+    assert urate_limit.rate_limiter(False) is None
+    assert urate_limit.rate_limiter(True).rates()=={
+        urate_limit.SUBMIT: urate_limit.SUBMIT_RATE,
+        urate_limit.STATUS: urate_limit.STATUS_RATE }
+    assert urate_limit.rate_limiter({ 'submit_rate': 2 }).rates()=={
+        urate_limit.SUBMIT: 2,
+        urate_limit.STATUS: urate_limit.STATUS_RATE }
@@ -0,0 +1,92 @@
+import random
+import sqlite3
+import pytest
+import eeuploader.results as uresults
+from conftest import ENGINES, asset_name, manifests, uploader, upload
+#
+# CONSTANTS
+#
+STORES=[
+    None,
+    uresults.COLUMNAR,
+    'results.db' ]
+
+
+
+#
+# HELPERS
+#
+def results(n):
+    """ n results with every state, some errors, retries and missing times """
+    states=['COMPLETED','FAILED','CANCELLED','SKIPPED']
+    rows=[]
+    for i in range(n):
+        state=states[i%len(states)]
+        submitted=None if (i%7==0) else 1000.0+i
+        rows.append(uresults.UploadResult(
+            asset_name(i),
+            task_id=f'TASK{i}',
+            state=state,
+            submitted=submitted,
+            started=submitted and submitted+1,
+            finished=2000.0+3*i,
+            error_class='exists' if state=='FAILED' else None,
+            error_message=f'error {i}' if state=='FAILED' else None,
+            retries=i%3))
+    return rows
+
+
+def store_results(store,tmp_path,rows):
+    """ add rows to the store (in random order) and return the finalized store """
+    if store and store.endswith(uresults.SQLITE_EXTS):
+        store=str(tmp_path/store)
+    store=uresults.results_store(store)
+    indexed=list(enumerate(rows))
+    random.Random(1).shuffle(indexed)
+    for index,result in indexed:
+        store.add(index,result)
+    return store.finalize()
+
+
+
+#
+# TESTS
+#
+@pytest.mark.parametrize('store',STORES)
+def test_stores_agree(tmp_path,store):
+    rows=results(50)
+    stored=store_results(store,tmp_path,rows)
+    assert len(stored)==50
+    assert list(stored)==rows
+    assert stored[0]==rows[0]
+    assert stored[-1]==rows[-1]
+    assert stored[10:13]==rows[10:13]
+    assert uresults.failed(stored)==uresults.failed(rows)
+    assert uresults.slowest(stored,5)==uresults.slowest(rows,5)
+    assert uresults.state_counts(stored)==uresults.state_counts(rows)
+    assert uresults.nb_retried(stored)==uresults.nb_retried(rows)
+    if hasattr(stored,'close'):
+        stored.close()
+
+
+def test_sqlite_reopen(tmp_path):
+    path=str(tmp_path/'results.db')
+    rows=results(10)
+    with uresults.SQLiteResults(path,buffer_size=3) as store:
+        for index,result in enumerate(rows):
+            store.add(index,result)
+    with uresults.SQLiteResults(path,clear=False) as store:
+        assert list(store)==rows
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_sqlite_store_closed_by_next_run(simulate,tmp_path,engine):
+    simulate()
+    up=uploader(results_store=str(tmp_path/'results.db'))
+    first=upload(up,engine,manifests=manifests(5))
+    assert uresults.state_counts(first)=={ 'COMPLETED': 5 }
+    second=upload(up,engine,manifests=manifests(3))
+    assert len(second)==3
+    with pytest.raises(sqlite3.ProgrammingError):
+        len(first)
+    second.close()
@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import eeuploader.asset_cache as uasset_cache
+import eeuploader.delta as udelta
+import eeuploader.results as uresults
+import eeuploader.shard as ushard
+from conftest import USER, COLLECTION, asset_name, manifests, uploader
+
+
+
+#
+# HELPERS
+#
+def write_fc(path,n):
+    feats=[
+        { 'type': 'Feature', 'properties': { 'gcs': f'gs://bucket/img{i}.tif' } }
+        for i in range(n) ]
+    with open(path,'w') as file:
+        json.dump({ 'type': 'FeatureCollection', 'features': feats },file)
+
+
+def cache(directory,**kwargs):
+    return uasset_cache.AssetCache(USER,collection=COLLECTION,directory=directory,**kwargs)
+
+
+
+#
+# TESTS
+#
+def test_rates_split_by_shards():
+    up=uploader(shard='1/4',rate_limit={ 'submit_rate': 8, 'status_rate': 4 })
+    assert up.rate_limiter.rates()=={ 'submit': 2, 'status': 1 }
+    up=uploader(rate_limit={ 'submit_rate': 8, 'status_rate': 4 })
+    assert up.rate_limiter.rates()=={ 'submit': 8, 'status': 4 }
+
+
+def test_worker_asset_cache_readonly(simulate,tmp_path):
+    simulate(assets=[asset_name(0)])
+    up=uploader(shard='0/2',skip_existing=True,asset_cache=str(tmp_path))
+    assert up.existing_assets=={ asset_name(0) }
+    up.asset_cache.add(asset_name(1))
+    up.asset_cache.flush()
+    assert os.listdir(tmp_path)==[]
+
+
+def test_coordinator_single_writer(simulate,tmp_path,monkeypatch):
+    # workers that do nothing: their results are written in advance
+    monkeypatch.setattr(ushard,'WORKER_COMMAND',[sys.executable,'-c','pass'])
+    simulate(assets=[asset_name(0)])
+    fc=str(tmp_path/'fc.geojson')
+    write_fc(fc,10)
+    coordinator=ushard.LocalCoordinator(
+        2,
+        [fc],
+        index=fc,
+        asset_cache=cache(str(tmp_path/'cache')),
+        work_dir=str(tmp_path/'work'),
+        noisy=False)
+    os.makedirs(coordinator.work_dir)
+    ushard.save_results([
+            uresults.UploadResult(asset_name(1),state='COMPLETED'),
+            uresults.UploadResult(asset_name(2),state='FAILED') ],
+        coordinator._path('results',1))
+    assert len(coordinator.run())==2
+    assert os.path.isfile(f'{fc}.idx')
+    assert [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]==[]
+    assert cache(str(tmp_path/'cache')).load()=={ asset_name(0), asset_name(1) }
+
+
+def test_worker_files_per_shard(tmp_path):
+    coordinator=ushard.LocalCoordinator(
+        2,
+        ['fc.geojson','upargs.yaml','results_store=run.db','progress=p.json','delta=fp.jsonl'],
+        delta='fp.jsonl',
+        results_store='run.db',
+        progress={ 'path': 'p.json', 'interval': 60 },
+        work_dir=str(tmp_path),
+        noisy=False)
+    for i,command in enumerate(coordinator.commands()):
+        # the worker's own paths come last (and override the upload args)
+        assert command[-3:]==[
+            f'delta=fp.shard-{i}-of-2.jsonl',
+            f'results_store=run.shard-{i}-of-2.db',
+            f'progress={{interval: 60, path: p.shard-{i}-of-2.json}}' ]
+
+
+def test_coordinator_delta_and_results_store(simulate,tmp_path,monkeypatch):
+    monkeypatch.setattr(ushard,'WORKER_COMMAND',[sys.executable,'-c','pass'])
+    simulate()
+    delta=str(tmp_path/'fp.jsonl')
+    fingerprints=udelta.Fingerprints(delta)
+    for manifest in manifests(10):
+        fingerprints.record(manifest)
+    fingerprints.close()
+    store=str(tmp_path/'run.db')
+    coordinator=ushard.LocalCoordinator(
+        2,
+        [],
+        delta=delta,
+        results_store=store,
+        work_dir=str(tmp_path/'work'),
+        noisy=False)
+    os.makedirs(coordinator.work_dir)
+    for i in range(2):
+        ushard.save_results(
+            [uresults.UploadResult(asset_name(10+i),state='COMPLETED')],
+            coordinator._path('results',i))
+    # a worker records a new fingerprint in its shard file
+    new=manifests(12)[10+ushard.shard_of(asset_name(10),2)]
+    new_path=ushard.shard_path(delta,ushard.shard_of(asset_name(10),2),2)
+    monkeypatch.setattr(ushard,'WORKER_COMMAND',[
+        sys.executable,
+        '-c',
+        f'import eeuploader.delta as d; f=d.Fingerprints({new_path!r}); f.record({new!r}); f.close()' ])
+    coordinator.run()
+    # each shard file was seeded with the fingerprints of its shard only
+    for i in range(2):
+        names=udelta.Fingerprints(ushard.shard_path(delta,i,2)).records
+        assert all(ushard.shard_of(n,2)==i for n in names)
+    assert sorted(udelta.Fingerprints(delta).records)==sorted(asset_name(i) for i in range(11))
+    results=uresults.SQLiteResults(store,clear=False)
+    assert sorted(r.name for r in results)==[asset_name(10),asset_name(11)]
+    results.close()
@@ -0,0 +1,100 @@
+import time
+import threading
+import pytest
+import eeuploader.gee_utils as gutils
+import eeuploader.metrics as umetrics
+import eeuploader.simulator as sim
+from conftest import ENGINES, manifests, uploader, upload
+#
+# CONSTANTS
+#
+NB_THREADS=8
+NB_GETS=250
+BLOCK=50
+LATENCY=0.2
+
+
+
+#
+# HELPERS
+#
+def wait_refilled(pool,timeout=5):
+    """ wait for the background refill (if any) to finish """
+    end=time.time()+timeout
+    while pool._refilling and (time.time()<end):
+        time.sleep(0.01)
+
+
+def nb_blocks(n,block):
+    return -(-n//block)
+
+
+
+#
+# TESTS
+#
+def test_no_duplicates_across_threads(simulate):
+    backend=simulate(latency={ sim.NEW_TASK_ID: 0.01 })
+    metrics=umetrics.Metrics()
+    pool=gutils.TaskIdPool(BLOCK,metrics=metrics)
+    task_ids=[]
+    def _get():
+        ids=[pool.get() for _ in range(NB_GETS)]
+        task_ids.extend(ids)
+    threads=[threading.Thread(target=_get) for _ in range(NB_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wait_refilled(pool)
+    nb=NB_THREADS*NB_GETS
+    assert len(set(task_ids))==nb
+    # unused ids: at most the block in the pool and one refill
+    nb_rpcs=backend.rpcs[sim.NEW_TASK_ID]
+    assert nb_blocks(nb,BLOCK)<=nb_rpcs<=nb_blocks(nb,BLOCK)+2
+    assert metrics.rpcs[umetrics.NEW_TASK_ID]==nb_rpcs
+
+
+def test_background_refill(simulate):
+    backend=simulate(latency={ sim.NEW_TASK_ID: LATENCY })
+    pool=gutils.TaskIdPool(8,refill_at=2)
+    start=time.time()
+    pool.get()
+    # the first get fetches the first block
+    assert time.time()-start>=LATENCY
+    for _ in range(5):
+        pool.get()
+    # 2 ids left: the next block is being fetched in the background
+    assert pool._refilling
+    assert backend.rpcs[sim.NEW_TASK_ID]==2
+    wait_refilled(pool)
+    start=time.time()
+    task_ids=[pool.get() for _ in range(10)]
+    assert time.time()-start<LATENCY/2
+    assert len(set(task_ids))==10
+    wait_refilled(pool)
+    assert backend.rpcs[sim.NEW_TASK_ID]==3
+
+
+def test_refill_error_raised_on_empty_pool(simulate):
+    backend=simulate()
+    pool=gutils.TaskIdPool(4,refill_at=0)
+    task_ids=[pool.get() for _ in range(4)]
+    wait_refilled(pool)
+    assert backend.rpcs[sim.NEW_TASK_ID]==2
+    pool._ids.clear()
+    def _fail(count=1):
+        raise ConnectionError('newTaskId unavailable')
+    backend.new_task_id=_fail
+    with pytest.raises(ConnectionError):
+        pool.get()
+    assert len(set(task_ids))==4
+
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_uploads_use_task_id_blocks(simulate,engine):
+    backend=simulate()
+    tasks=upload(uploader(task_id_block=10),engine,manifests=manifests(25))
+    assert len({ t.task_id for t in tasks })==25
+    assert backend.rpcs[sim.START_INGESTION]==25
+    assert nb_blocks(25,10)<=backend.rpcs[sim.NEW_TASK_ID]<=nb_blocks(25,10)+1